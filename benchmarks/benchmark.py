@@ -0,0 +1,319 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""benchmarks the poll loop, profile handling and the d-bus getters
+
+Every operation runs against stand-in sensor files in a temporary
+directory, the d-bus getters are called through a private session bus.
+Results are written as JSON, e.g.
+
+    python2.7 benchmarks/benchmark.py -o bench_output.txt
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..', 'src'))
+
+import dbus
+import dbus.bus
+import dbus.mainloop.glib
+import dbus.service
+import gobject
+
+from tpfancod import clock, control, hardware, settings, worker
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PROFILE_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+# ibm_thermal provides at most this many sensors, the others are hwmon files
+IBM_THERMAL_SENSORS = 8
+
+BUS_NAME = 'org.tpfanco.tpfancod'
+
+DBUS_GETTERS = ['get_temperatures', 'get_fan_state',
+                'get_trip_temperatures', 'get_trip_fan_speeds',
+                'get_snapshot']
+
+
+class StandInBackend(hardware.SysfsBackend):
+
+    """reads real files, but emulates the fan so that commands keep the fan file readable"""
+
+    def __init__(self, ibm_fan):
+        hardware.SysfsBackend.__init__(self)
+        self.ibm_fan = ibm_fan
+        self.fan = hardware.FakeFan()
+        self.render_fan()
+
+    def render_fan(self):
+        with open(self.ibm_fan, 'w') as f:
+            f.write(self.fan.render(clock.monotonic()))
+
+    def write(self, path, data):
+        if path != self.ibm_fan:
+            return hardware.SysfsBackend.write(self, path, data)
+        self.fan.command(data, clock.monotonic())
+        self.render_fan()
+        return len(data)
+
+
+class DiscardingClock(clock.VirtualClock):
+
+    """virtual clock that never runs its timers, Control.poll() is called directly"""
+
+    def timeout_add(self, interval, callback, *args):
+        return 0
+
+
+class StandInTree(object):
+
+    """temporary directory with config, profile and sensor files for a profile of the given size"""
+
+    def __init__(self, size):
+        self.size = size
+        self.root = tempfile.mkdtemp(prefix='tpfancod-benchmark-')
+        self.config_path = os.path.join(self.root, 'settings.conf')
+        self.profile_path = os.path.join(self.root, 'profile_standard')
+        self.ibm_fan = os.path.join(self.root, 'fan')
+        self.ibm_thermal = os.path.join(self.root, 'thermal')
+        self.profile_dir = os.path.join(self.root, 'profiles') + '/'
+        os.mkdir(self.profile_dir)
+
+        ibm_count = min(size, IBM_THERMAL_SENSORS)
+        self.hwmon = [os.path.join(self.root, 'temp%d_input' % (idx + 1))
+                      for idx in range(size - ibm_count)]
+        with open(self.ibm_thermal, 'w') as f:
+            f.write('temperatures:\t' + ' '.join(
+                str(40 + idx) for idx in range(ibm_count)) + '\n')
+        for idx, path in enumerate(self.hwmon):
+            with open(path, 'w') as f:
+                f.write('%d\n' % ((45 + idx % 20) * 1000))
+
+        with open(self.config_path, 'w') as f:
+            f.write('[General]\nenabled = True\noverride_profile = True\n'
+                    'current_profile = profile_standard\n')
+        triggers = "{0:0, 40:2, 45:3, 50:4, 55:5, 60:6, 65:7, 70:255}"
+        with open(self.profile_path, 'w') as f:
+            f.write('[General]\ncomment = benchmark\nproduct_vendor = LENOVO\n'
+                    'product_name = benchmark\nproduct_id = benchmark\n'
+                    '[Options]\nhysteresis = 2\n[Sensors]\n')
+            for idx in range(ibm_count):
+                f.write("ibm_thermal_sensor_%d = {'name':'Sensor %d','triggers':%s}\n" %
+                        (idx, idx, triggers))
+            for path in self.hwmon:
+                f.write("%s = {'name':'%s','scaling':0.001,'triggers':%s}\n" %
+                        (path, os.path.basename(path), triggers))
+
+    def create_settings(self, bus=None, path=None):
+        return settings.Settings(bus, path, False, True, False, '1.0.0', self.config_path,
+                                 'profile_standard', self.ibm_fan, self.ibm_thermal,
+                                 self.profile_dir, 3500, 5,
+                                 backend=StandInBackend(self.ibm_fan),
+                                 profile_db_path=os.path.join(self.root, 'profiles.db'))
+
+    def remove(self):
+        shutil.rmtree(self.root)
+
+
+def summarize(durations, retained, peak):
+    """returns the latency distribution in usecs and the memory retained per call"""
+    durations = sorted(durations)
+    count = len(durations)
+
+    def pick(fraction):
+        return durations[min(count - 1, int(fraction * count))] * 1e6
+
+    if tracemalloc is not None:
+        unit = 'bytes'
+    else:
+        unit = 'gc_objects'
+    result = {'count': count,
+              'mean_us': sum(durations) / count * 1e6,
+              'min_us': pick(0.0),
+              'median_us': pick(0.5),
+              'p90_us': pick(0.9),
+              'p99_us': pick(0.99),
+              'max_us': pick(1.0),
+              'retained_per_call': retained / float(count),
+              'retained_unit': unit}
+    if peak is not None:
+        result['peak_bytes'] = peak
+    return result
+
+
+def measure(operation, iterations):
+    """calls operation iterations times, returns its timings and memory usage"""
+    operation()
+    durations = []
+    for _ in range(iterations):
+        start = clock.monotonic()
+        operation()
+        durations.append(clock.monotonic() - start)
+
+    # memory is measured in a separate pass, tracing slows down the calls
+    # considerably. python 2.7 has no tracemalloc, there we count the
+    # objects tracked by the garbage collector instead
+    gc.collect()
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(iterations):
+            operation()
+        current, peak = tracemalloc.get_traced_memory()
+        retained = current - before
+        peak -= before
+        tracemalloc.stop()
+    else:
+        before = len(gc.get_objects())
+        for _ in range(iterations):
+            operation()
+        gc.collect()
+        retained = len(gc.get_objects()) - before
+    return summarize(durations, retained, peak)
+
+
+def benchmark_local(tree, iterations):
+    """benchmarks the operations that run inside the daemon"""
+    act_settings = tree.create_settings()
+    controller = control.Control(None, None, act_settings, DiscardingClock(),
+                                 worker.InlineExecutor())
+    profile_copy = os.path.join(tree.root, 'profile_copy')
+    return {'poll': measure(controller.poll, iterations),
+            'settings_load': measure(act_settings.load, iterations),
+            'read_profile': measure(lambda: act_settings.read_profile(tree.profile_path), iterations),
+            'write_profile': measure(lambda: act_settings.write_profile(profile_copy), iterations)}
+
+
+class PrivateBus(object):
+
+    """dbus-daemon with a session configuration that only lives as long as the benchmark"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                                        stdout=subprocess.PIPE)
+        self.address = self.process.stdout.readline().strip()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def serve(tree, address):
+    """runs Settings and Control on the private bus until killed"""
+    # the sensors are read by worker threads
+    gobject.threads_init()
+    dbus.mainloop.glib.threads_init()
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    bus = dbus.bus.BusConnection(address)
+    name = dbus.service.BusName(BUS_NAME, bus)
+    act_settings = tree.create_settings(name, '/Settings')
+    control.Control(name, '/Control', act_settings)
+    gobject.MainLoop().run()
+
+
+def benchmark_dbus(tree, bus, iterations):
+    """benchmarks the d-bus getters as seen by a client"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            serve(tree, bus.address)
+        finally:
+            os._exit(0)
+
+    try:
+        client = dbus.bus.BusConnection(bus.address)
+        deadline = time.time() + 10
+        while not client.name_has_owner(BUS_NAME):
+            if time.time() > deadline:
+                raise RuntimeError('tpfancod did not appear on the private bus')
+            time.sleep(0.05)
+        proxy = client.get_object(BUS_NAME, '/Control')
+        results = {}
+        for getter in DBUS_GETTERS:
+            method = proxy.get_dbus_method(
+                getter, 'org.tpfanco.tpfancod.Control')
+            results['dbus_' + getter] = measure(method, iterations)
+        client.close()
+        return results
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', help='write the results to this file instead of stdout')
+    parser.add_argument('-n', '--iterations', help='calls per operation and profile size',
+                        type=int, default=200)
+    parser.add_argument('-s', '--sizes', help='comma separated profile sizes (number of sensors)',
+                        default=','.join(str(size) for size in PROFILE_SIZES))
+    parser.add_argument('--no-dbus', help='skip the d-bus benchmarks',
+                        action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stderr)
+
+    results = {'python': sys.version.split()[0],
+               'timestamp': time.time(),
+               'iterations': args.iterations,
+               'sizes': {}}
+    bus = None
+    if not args.no_dbus:
+        bus = PrivateBus()
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            tree = StandInTree(size)
+            try:
+                result = benchmark_local(tree, args.iterations)
+                if bus is not None:
+                    result.update(benchmark_dbus(tree, bus, args.iterations))
+                results['sizes'][str(size)] = result
+            finally:
+                tree.remove()
+    finally:
+        if bus is not None:
+            bus.stop()
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+
+if __name__ == '__main__':
+    main()
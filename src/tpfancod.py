@@ -21,16 +21,15 @@
 
 import argparse
 import logging
-import os.path
+import os
 import signal
 import sys
 
-import dbus.mainloop.glib
-import gobject
-
 if not ('/usr/lib/python2.7/site-packages' in sys.path):
     sys.path.append('/usr/lib/python2.7/site-packages')
-from tpfancod import settings, control
+# dbus, glib and the daemon modules are imported after the fan watchdog is
+# armed, see daemon_main
+from tpfancod import startup
 
 
 class Tpfancod(object):
@@ -39,6 +38,11 @@ class Tpfancod(object):
 
     controller = None
 
+    act_settings = None
+
+    # keeps org.tpfanco.tpfancod owned while the daemon runs
+    bus_name = None
+
     mainloop = None
 
     debug = False
@@ -47,6 +51,14 @@ class Tpfancod(object):
 
     no_ibm_thermal = False
 
+    # sensor script and virtual duration in seconds for simulation mode
+    simulation_script = None
+
+    simulation_duration = 600
+
+    # compile the community profiles and exit
+    build_profile_db = False
+
     # version
     version = '1.0.0'
 
@@ -76,10 +88,12 @@ class Tpfancod(object):
     watchdog_time = 5
 
     def __init__(self):
+        self.phases = startup.StartupPhases()
         logging.basicConfig(stream=sys.stdout,
                             format='%(asctime)s - %(levelname)s - %(message)s',
                             datefmt='%Y-%m-%d %H:%M:%S')
         self.logger = logging.getLogger(__name__)
+        self.phases.begin('arguments')
         self.parse_command_line_args()
         self.start_fan_control()
 
@@ -100,6 +114,13 @@ class Tpfancod(object):
             '-P', '--pid', help='alternate location for the PID file of the running process')
         parser.add_argument(
             '-p', '--profiles', help='alternate location for the directory containing fan control profiles')
+        parser.add_argument(
+            '-s', '--simulate', help='run the fan control against the sensor values from the given script in virtual time, without touching the hardware')
+        parser.add_argument(
+            '--duration', help='virtual duration of a simulation in seconds', type=float)
+        parser.add_argument(
+            '--build-profile-db', help='compile the fan control profiles into the profile database and exit',
+            action='store_true')
 
         args = parser.parse_args()
 
@@ -112,7 +133,12 @@ class Tpfancod(object):
         if args.pid:
             self.pid_path = args.pid
         if args.profiles:
-            self.data_dir = args.profiles
+            self.supplied_profile_dir = os.path.join(args.profiles, '')
+        if args.simulate:
+            self.simulation_script = args.simulate
+        if args.duration:
+            self.simulation_duration = args.duration
+        self.build_profile_db = args.build_profile_db
 
     def start_fan_control(self):
         """daemon start function"""
@@ -130,9 +156,19 @@ class Tpfancod(object):
             self.logger.setLevel(logging.DEBUG)
         else:
             self.logger.setLevel(logging.ERROR)
+        startup.set_log_level(self.debug)
 
         self.logger.debug('Running in debug mode')
 
+        if self.simulation_script is not None:
+            self.simulate()
+            return
+
+        if self.build_profile_db:
+            self.compile_profiles()
+            return
+
+        self.phases.begin('system_check')
         if not self.is_system_suitable():
             print 'Fatal error: unable to set fanspeed, enable watchdog or read temperature'
             print '             Please make sure you are root and a recent'
@@ -147,23 +183,64 @@ class Tpfancod(object):
             exit(1)
 
         # go into daemon mode
+        self.phases.begin('daemonize')
         self.daemonize()
 
+    def simulate(self):
+        """runs the fan control in virtual time and prints a report"""
+        from tpfancod import simulate
+
+        report = simulate.run(self.simulation_script, self.simulation_duration, self.config_path,
+                              self.current_profile, self.supplied_profile_dir, self.poll_time,
+                              self.watchdog_time, self.version, self.debug, self.ibm_fan,
+                              self.ibm_thermal)
+        print 'Simulated ' + str(self.simulation_duration) + ' s in ' + str(report['ticks']) + ' ticks'
+        print 'Tick latency: min %.3f ms, median %.3f ms, p95 %.3f ms, max %.3f ms' % (
+            report['tick_min'] * 1000, report['tick_median'] * 1000,
+            report['tick_p95'] * 1000, report['tick_max'] * 1000)
+        print 'File reads: ' + str(report['reads']) + ', fan writes: ' + str(report['writes'])
+        print 'Fan commands: ' + str(len(report['commands'])) + ' (' + str(report['level_commands']) + ' level changes)'
+        print 'Watchdog expirations: ' + str(report['watchdog_expired'])
+        print 'Final fan level: ' + report['final_level']
+        if self.debug:
+            for when, command in report['commands']:
+                print '%10.3f  %s' % (when, command)
+
+    def compile_profiles(self):
+        """compiles the profiles in the profile directory into the profile database"""
+        from tpfancod import profiledb, settings
+
+        # only used to parse the profile files
+        reader = settings.Settings('Dummy', None, self.debug, self.quiet, self.no_ibm_thermal, self.version,
+                                   self.config_path, self.current_profile, self.ibm_fan, self.ibm_thermal,
+                                   self.supplied_profile_dir, self.poll_time, self.watchdog_time)
+        db_path = settings.Settings.profile_db_path
+        try:
+            if not os.path.isdir(os.path.dirname(db_path)):
+                os.makedirs(os.path.dirname(db_path))
+            count = profiledb.build(
+                self.supplied_profile_dir, db_path, reader.read_profile)
+        except EnvironmentError, e:
+            print 'Fatal error: unable to compile the profiles: ' + str(e)
+            exit(1)
+        print 'Compiled ' + str(count) + ' profiles into ' + db_path
+
     def is_system_suitable(self):
         """returns True iff fan speed setting, watchdog and thermal reading is supported by kernel and
-           we have write permissions"""
-        try:
-            fanfile = open(self.ibm_fan, 'w')
-            fanfile.write('level auto')
-            fanfile.flush()
-            fanfile.close()
-            fanfile = open(self.ibm_fan, 'w')
-            fanfile.write('watchdog 5')
-            fanfile.flush()
-            fanfile.close()
+           we have write permissions
 
+        the fan is left to the EC with the watchdog armed, so it is safe even
+        if the rest of the startup takes long"""
+        try:
+            # thinkpad_acpi takes several commands separated by commas in
+            # one write, like the actuator sends them
+            fd = os.open(self.ibm_fan, os.O_WRONLY)
+            try:
+                os.write(fd, 'level auto,watchdog %d' % self.watchdog_time)
+            finally:
+                os.close(fd)
             return True
-        except IOError:
+        except (IOError, OSError):
             return False
 
     def daemonize(self):
@@ -217,27 +294,56 @@ class Tpfancod(object):
         # register SIGTERM handler
         signal.signal(signal.SIGTERM, self.term_handler)
 
+        self.phases.begin('imports')
+        import dbus.mainloop.glib
+        import dbus.service
+        import gobject
+        from tpfancod import control, settings
+
+        # the sensors are read by worker threads, see worker.py
+        gobject.threads_init()
+
+        # take over the fan before connecting to the bus, the objects are
+        # exported afterwards
+        act_settings = self.act_settings = settings.Settings(
+            None, None, self.debug, self.quiet, self.no_ibm_thermal, self.version, self.config_path, self.current_profile, self.ibm_fan, self.ibm_thermal, self.supplied_profile_dir, self.poll_time, self.watchdog_time, phases=self.phases)
+
+        # create controller
+        self.phases.begin('control')
+        self.controller = control.Control(None, None, act_settings)
+        # the first cycle reads on this thread: the workers deliver on the
+        # main loop, which does not run yet
+        self.phases.begin('first_poll')
+        self.controller.poll_now(inline=True)
+
         # register d-bus service
+        self.phases.begin('dbus')
+        dbus.mainloop.glib.threads_init()
         dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
         system_bus = dbus.SystemBus()
-        name = dbus.service.BusName(
+        act_settings.add_to_connection(system_bus, '/Settings')
+        self.controller.add_to_connection(system_bus, '/Control')
+        self.bus_name = dbus.service.BusName(
             'org.tpfanco.tpfancod', system_bus)
 
-        # create and load configuration
-        act_settings = settings.Settings(
-            name, '/Settings', self.debug, self.quiet, self.no_ibm_thermal, self.version, self.config_path, self.current_profile, self.ibm_fan, self.ibm_thermal, self.supplied_profile_dir, self.poll_time, self.watchdog_time)
-
-        # create controller
-        self.controller = control.Control(
-            name, '/Control', act_settings)
+        # SIGUSR1 starts and ends a profiling window, see profiler.py
+        signal.signal(signal.SIGUSR1, self.usr1_handler)
+        self.phases.finish()
 
         # start glib main loop
         self.mainloop = gobject.MainLoop()
         self.mainloop.run()
 
+    def usr1_handler(self, signum, frame):
+        """handles SIGUSR1"""
+        self.controller.profiler.toggle()
+
     def term_handler(self, signum, frame):
         """handles SIGTERM"""
-        self.controller.set_speed(255)
+        # write settings changes that are still waiting for their debounce
+        # window
+        self.act_settings.flush_pending()
+        self.controller.shutdown()
         try:
             os.remove(self.pid_path)
         except:
@@ -0,0 +1,135 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""fan commands of the poll loop
+
+Every command written to /proc/acpi/ibm/fan is an ACPI call into the EC,
+so FanActuator remembers what it commanded and writes only what is needed
+to reach the next fan level. thinkpad_acpi rearms its watchdog after every
+successful write and accepts several commands separated by commas in one
+write, so a level change rearms the watchdog as well and an explicit
+'watchdog' command is only sent when the watchdog would otherwise run out
+before the next poll.
+"""
+
+import logging
+
+
+def level_command(speed):
+    """returns the fan command for a speed (0=off, 2-8=normal, 254=disengaged, 255=ec, 256=full-speed)"""
+    if speed == 0:
+        return 'level 0'
+    if speed == 254:
+        return 'level disengaged'
+    if speed == 255:
+        return 'level auto'
+    if speed == 256:
+        return 'level full-speed'
+    return 'level %d' % (speed - 1)
+
+
+def reached(speed, level):
+    """returns True if the fan level read from the fan file is the commanded speed"""
+    # disengaged and full-speed read back the same
+    return level == speed or (speed == 254 and level == 256)
+
+
+class FanActuator(object):
+
+    """writes the fewest fan commands that reach a fan speed and keep the watchdog armed"""
+
+    def __init__(self, backend, ibm_fan, time_source, watchdog_time, margin):
+        self.logger = logging.getLogger(__name__)
+        # the fan file is kept open by the backend, see hardware.HandlePool
+        self.backend = backend
+        self.ibm_fan = ibm_fan
+        self.time_source = time_source
+        # watchdog timeout in secs
+        self.watchdog_time = watchdog_time
+        # secs that the watchdog must have left at the next call
+        self.margin = margin
+        self.reset_stats()
+        self.invalidate()
+
+    def reset_stats(self):
+        self.stats = {'level_commands': 0,
+                      'level_suppressed': 0,
+                      'watchdog_commands': 0,
+                      'watchdog_suppressed': 0,
+                      'writes': 0,
+                      'errors': 0}
+
+    def invalidate(self):
+        """forgets the commanded state, the next call writes everything again"""
+        # last commanded speed, None if unknown
+        self.speed = None
+        # time_source() at which the watchdog runs out, None if unknown
+        self.deadline = None
+
+    def set_speed(self, speed, level, next_call):
+        """commands speed, level is the level read from the fan file or None
+
+        next_call is the number of secs until the next call, the watchdog
+        is rearmed if it would have less than margin secs left by then"""
+        if self.speed is not None and level is not None and not reached(self.speed, level):
+            # the EC, a resume or another program changed the fan
+            self.logger.debug('Fan level ' + str(level) + ' differs from the commanded ' +
+                              str(self.speed) + ', commanding again')
+            self.speed = None
+
+        commands = []
+        if self.speed != speed:
+            commands.append(level_command(speed))
+            self.stats['level_commands'] += 1
+        else:
+            self.stats['level_suppressed'] += 1
+
+        now = self.time_source()
+        if self.deadline is None:
+            # sets the timeout, which is unknown before the first write
+            commands.append('watchdog %d' % self.watchdog_time)
+            self.stats['watchdog_commands'] += 1
+        # a level command rearms the watchdog as well and in auto mode the
+        # watchdog would only switch to auto mode
+        elif not commands and speed != 255 and self.deadline - now - next_call < self.margin:
+            commands.append('watchdog %d' % self.watchdog_time)
+            self.stats['watchdog_commands'] += 1
+        else:
+            self.stats['watchdog_suppressed'] += 1
+
+        if not commands:
+            return
+        self.logger.debug('Fan commands: ' + ','.join(commands))
+        try:
+            self.backend.write(self.ibm_fan, ','.join(commands))
+        except IOError:
+            # sometimes write fails during suspend/resume
+            self.stats['errors'] += 1
+            self.invalidate()
+            return
+        self.stats['writes'] += 1
+        self.speed = speed
+        # every successful write rearms the watchdog
+        self.deadline = now + self.watchdog_time
+
+    def get_stats(self):
+        return dict(self.stats)
@@ -0,0 +1,84 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+def differs(old, new, thresholds):
+    """returns True if the dicts have different keys or a value moved by at least its threshold
+
+    thresholds maps keys to thresholds, keys without one count on any change"""
+    if len(old) != len(new):
+        return True
+    for key, value in new.iteritems():
+        if key not in old:
+            return True
+        if value != old[key] and abs(value - old[key]) >= thresholds.get(key, 0):
+            return True
+    return False
+
+
+class ChangeFilter(object):
+
+    """decides which readings of a poll cycle are worth a d-bus signal
+
+    Values are compared with the last emitted ones, not with the previous
+    poll, so a slow drift is reported once it adds up to the threshold and
+    a change held back by the rate limit is emitted after the interval."""
+
+    # change of the fan speed that is worth a signal, the rpm reading
+    # jitters by a few rpm between polls
+    rpm_threshold = 100
+
+    def __init__(self, interval, threshold):
+        # msecs between two signals of the same kind
+        self.interval = interval
+        # change in K that makes a temperature worth a signal
+        self.threshold = threshold
+        # kind -> (time of the last signal, emitted value)
+        self.emitted = {}
+
+    def check(self, kind, value, now, thresholds={}):
+        """returns True and remembers value if a signal of this kind should be emitted now"""
+        last = self.emitted.get(kind)
+        if last is not None:
+            when, old = last
+            if not differs(old, value, thresholds):
+                return False
+            if (now - when) * 1000 < self.interval:
+                return False
+        self.emitted[kind] = (now, dict(value))
+        return True
+
+    def check_temperatures(self, temperatures, now):
+        return self.check('temperatures', temperatures, now,
+                          dict.fromkeys(temperatures, self.threshold))
+
+    def check_fan_state(self, fan_state, now):
+        return self.check('fan_state', fan_state, now, {'rpm': self.rpm_threshold})
+
+    def check_trips(self, trip_temperatures, trip_fan_speeds, now):
+        trips = dict(('temp:' + sensor_id, temp)
+                     for sensor_id, temp in trip_temperatures.iteritems())
+        trips.update(('speed:' + sensor_id, speed)
+                     for sensor_id, speed in trip_fan_speeds.iteritems())
+        return self.check('trips', trips, now)
+
+    def reset(self):
+        self.emitted = {}
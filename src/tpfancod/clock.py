@@ -0,0 +1,144 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import ctypes
+import ctypes.util
+import heapq
+import time
+
+CLOCK_MONOTONIC = 1
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    """returns clock_gettime from libc or librt, None if neither has it"""
+    for name in ('c', 'rt'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        return clock_gettime
+    return None
+
+
+def _monotonic_ctypes():
+    """returns the value of CLOCK_MONOTONIC in seconds"""
+    ts = timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        return time.time()
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
+# python 2.7 has no time.monotonic, so we ask the C library directly
+if hasattr(time, 'monotonic'):
+    monotonic = time.monotonic
+else:
+    _clock_gettime = _load_clock_gettime()
+    if _clock_gettime is not None:
+        monotonic = _monotonic_ctypes
+    else:
+        monotonic = time.time
+
+
+class GlibClock(object):
+
+    """timers of the glib main loop and the system clocks"""
+
+    def __init__(self):
+        # imported here so that the startup checks and monotonic() do not
+        # pay for loading glib
+        import gobject
+        self.gobject = gobject
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return monotonic()
+
+    def timeout_add(self, interval, callback, *args):
+        return self.gobject.timeout_add(interval, callback, *args)
+
+    def idle_add(self, callback, *args):
+        return self.gobject.idle_add(callback, *args)
+
+    def source_remove(self, source):
+        return self.gobject.source_remove(source)
+
+
+class VirtualClock(object):
+
+    """runs timers in virtual time without sleeping, used for simulations"""
+
+    def __init__(self):
+        self.now = 0.0
+        # virtual time 0 corresponds to the real time at creation
+        self.epoch = time.time()
+        self.queue = []
+        self.sources = {}
+        self.next_source = 1
+        # wall clock duration of every dispatched callback in seconds
+        self.durations = []
+
+    def time(self):
+        return self.epoch + self.now
+
+    def monotonic(self):
+        return self.now
+
+    def timeout_add(self, interval, callback, *args):
+        source = self.next_source
+        self.next_source += 1
+        self.sources[source] = (interval, callback, args)
+        heapq.heappush(self.queue, (self.now + interval / 1000.0, source))
+        return source
+
+    def idle_add(self, callback, *args):
+        return self.timeout_add(0, callback, *args)
+
+    def source_remove(self, source):
+        return self.sources.pop(source, None) is not None
+
+    def run(self, duration):
+        """dispatches all timers that are due within duration seconds"""
+        end = self.now + duration
+        while self.queue and self.queue[0][0] <= end:
+            due, source = heapq.heappop(self.queue)
+            if source not in self.sources:
+                continue
+            self.now = max(self.now, due)
+            interval, callback, args = self.sources[source]
+            start = monotonic()
+            again = callback(*args)
+            self.durations.append(monotonic() - start)
+            if again and source in self.sources:
+                heapq.heappush(
+                    self.queue, (self.now + interval / 1000.0, source))
+            else:
+                self.sources.pop(source, None)
+        self.now = end
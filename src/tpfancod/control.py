@@ -21,7 +21,8 @@
 
 import logging
 import dbus.service
-import gobject
+
+from tpfancod import actuator, changes, clock, events, hardware, history, profiler, scheduler, stats, throttle, worker
 
 
 class UnavailableException(dbus.DBusException):
@@ -32,10 +33,25 @@ class Control(dbus.service.Object):
 
     """fan controller"""
 
-    # value that temperature has to fall below to slow down fan
-    current_trip_temps = {}
-    # current fan speeds required by sensor readings
-    current_trip_speeds = {}
+    # time until the next poll in msecs
+    poll_interval = 0
+    # glib source of the next poll
+    poll_source = None
+    # True from the start of a poll cycle until its readings arrive
+    polling = False
+    # clock.monotonic() when the running poll cycle started
+    cycle_start = 0.0
+    # adaptive polling keeps this many msecs away from the watchdog timeout
+    watchdog_margin = 1000
+    # number of poll cycles kept for get_history
+    history_size = 3600
+    # msecs that the getters serve a snapshot before they read the hardware
+    # again
+    snapshot_max_age = 1000
+    # msecs that a read of the fan and the sensors may take before the fan
+    # is given back to the EC, together with the poll interval this stays
+    # within watchdog_time
+    read_deadline = 1000
     # last spinup time for interval cooling mode
     last_interval_spinup = 0
     # fan in interval cooling mode
@@ -43,8 +59,16 @@ class Control(dbus.service.Object):
     # fan on in interval cooling mode
     #interval_running = False
 
-    def __init__(self, bus, path, act_settings):
+    def __init__(self, bus, path, act_settings, main_clock=None, executor=None):
         self.act_settings = act_settings
+        # timers and time stamps, replaced by a virtual clock in simulations
+        if main_clock is None:
+            main_clock = clock.GlibClock()
+        self.clock = main_clock
+        # runs the hardware reads off the main loop, see worker.py
+        if executor is None:
+            executor = worker.WorkerPool(self.clock)
+        self.executor = executor
         self.logger = logging.getLogger(__name__)
 
         if self.act_settings.debug:
@@ -61,107 +85,141 @@ class Control(dbus.service.Object):
         self.logger.debug(
             'Sensor names: ' + str(self.act_settings.sensor_names))
 
+        self.scheduler = scheduler.AdaptiveScheduler(
+            self.act_settings.poll_time)
+        # sensor registry the scheduler has seen the temperatures of
+        self.scheduled_registry = None
+        self.thresholds = events.ThresholdMonitor(self.on_threshold_crossed)
+        # durations of the stages of the poll cycles
+        self.poll_stats = stats.PollStats()
+        self.history = history.History(self.history_size)
+        self.samples = hardware.SampleCache(self.take_snapshot, self.clock,
+                                            self.snapshot_max_age, self.executor,
+                                            self.read_deadline, self.apply_snapshot)
+        self.changes = changes.ChangeFilter(self.act_settings.signal_interval,
+                                            self.act_settings.signal_threshold)
+        self.actuator = actuator.FanActuator(self.act_settings.backend, self.act_settings.ibm_fan,
+                                             self.clock.monotonic, self.act_settings.watchdog_time,
+                                             self.watchdog_margin / 1000.0)
+        # throttle events per poll and the escalation of the performance mode
+        self.throttle = throttle.ThrottleGovernor()
+        # on demand diagnostics of the live process
+        self.profiler = profiler.Profiler(self.clock)
+
         dbus.service.Object.__init__(self, bus, path)
         self.repoll(1)
 
-    def set_speed(self, speed):
-        """sets the fan speed (0=off, 2-8=normal, 254=disengaged, 255=ec, 256=full-speed)"""
-        fan_state = self.get_fan_state()
+    def set_speed(self, speed, interval=None):
+        """sets the fan speed (0=off, 2-8=normal, 254=disengaged, 255=ec, 256=full-speed)
+
+        interval is the time in msecs until the next poll, by default the
+        longest one the watchdog allows"""
+        if interval is None:
+            interval = self.act_settings.watchdog_time * 1000
+        snapshot = self.samples.latest()
+        start = clock.monotonic()
+        self.logger.debug(
+            'Current fan level is ' + str(snapshot.get_level()) + ', setting ' + str(speed))
+        # the snapshot keeps the level read from the fan file, the actuator
+        # remembers the commanded one
+        self.actuator.set_speed(speed, snapshot.get_level(), interval / 1000.0)
+        self.poll_stats.add('fan_write', clock.monotonic() - start)
+
+    def take_snapshot(self):
+        """reads the fan state and all sensors of the profile exactly once
+
+        runs on a worker thread, so it only reads: the sensors, the load
+        inputs and the statistics are updated by apply_snapshot"""
+        snapshot = hardware.Snapshot(self.clock.time())
+        start = clock.monotonic()
         try:
-            self.logger.debug(
-                'Rearming fan watchdog timer (+' + str(self.act_settings.watchdog_time) + ' s)')
-            self.logger.debug(
-                'Current fan level is ' + str(fan_state['level']))
-            fanfile = open(self.act_settings.ibm_fan, 'w')
-            fanfile.write('watchdog %d' % self.act_settings.watchdog_time)
-            fanfile.flush()
-            if speed == fan_state['level']:
-                self.logger.debug('-> Keeping the current fan level unchanged')
+            snapshot.fan_state = self.read_fan_state()
+        except UnavailableException, e:
+            snapshot.fan_error = e.get_dbus_message()
+        snapshot.durations.append(('fan_read', clock.monotonic() - start))
+        try:
+            self.read_temperatures(snapshot)
+        except UnavailableException, e:
+            snapshot.temperature_error = e.get_dbus_message()
+        start = clock.monotonic()
+        snapshot.load_samples = self.act_settings.load_monitor.sample()
+        snapshot.durations.append(('load', clock.monotonic() - start))
+        start = clock.monotonic()
+        snapshot.throttle_count = self.act_settings.throttle_counters.read()
+        snapshot.durations.append(('throttle', clock.monotonic() - start))
+        return snapshot
+
+    def apply_snapshot(self, snapshot):
+        """takes the readings of a new snapshot over into the sensors and the statistics on the main loop"""
+        for stage, seconds in snapshot.durations:
+            self.poll_stats.add(stage, seconds)
+        if snapshot.readings is not None:
+            snapshot.temperatures = self.act_settings.sensor_registry.apply(snapshot.readings,
+                                                                            snapshot.read_time)
+            self.logger.debug('Output of read_temperatures ' + str(snapshot.temperatures))
+        snapshot.load = self.act_settings.load_monitor.apply(snapshot.load_samples)
+
+    def get_current_snapshot(self, deliver, reply_error):
+        """calls deliver with a snapshot that is at most snapshot_max_age old, reply_error if the read timed out"""
+        def on_snapshot(snapshot):
+            if snapshot is None:
+                reply_error(UnavailableException(
+                    'Reading the fan and the sensors timed out'))
             else:
-                self.logger.debug('-> Setting fan level to ' + str(speed))
-                if speed == 0:
-                    fanfile.write('disable')
-                else:
-                    fanfile.write('enable')
-                    fanfile.flush()
-                    if speed == 254:
-                        fanfile.write('level disengaged')
-                    if speed == 255:
-                        fanfile.write('level auto')
-                    elif speed == 256:
-                        fanfile.write('level full-speed')
-                    else:
-                        fanfile.write('level %d' % (speed - 1))
-            fanfile.flush()
-        except IOError:
-            # sometimes write fails during suspend/resume
-            pass
-        finally:
-            try:
-                fanfile.close()
-            except:
-                pass
+                deliver(snapshot)
+        self.samples.fetch(on_snapshot)
 
     @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='s')
     def get_version(self):
         return self.act_settings.version
 
-    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}')
-    def get_temperatures(self):
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}',
+                         async_callbacks=('reply', 'reply_error'))
+    def get_temperatures(self, reply, reply_error):
         """returns list of current sensor readings, +/-128 or 0 means sensor is disconnected"""
-        res = {}
+        def deliver(snapshot):
+            if snapshot.temperatures is None:
+                reply_error(UnavailableException(snapshot.temperature_error))
+            else:
+                reply(snapshot.temperatures)
+        self.get_current_snapshot(deliver, reply_error)
+
+    def read_temperatures(self, snapshot):
+        """reads the due sensors of the profile into snapshot.readings"""
         # TODO: we need to be able to read the sensors even if fan control is
         # disabled
+        registry = self.act_settings.sensor_registry
+        readings = {}
+        # sensors with an interval are only read when they are due
+        snapshot.read_time = now = self.clock.monotonic()
         try:
-            tempfile = open(self.act_settings.ibm_thermal, 'r')
-            elements = tempfile.readline().split()[1:]
-            tempfile.close()
-            for idx, val in enumerate(elements):
-                if str(idx) in self.act_settings.trigger_points:
-                    res[str(idx)] = val
-        except IOError, e:
+            start = clock.monotonic()
+            registry.sample_ibm_thermal(readings, now)
+            middle = clock.monotonic()
+            registry.sample_hwmon(readings, now)
+            snapshot.durations.append(('ibm_thermal', middle - start))
+            snapshot.durations.append(('hwmon', clock.monotonic() - middle))
+        except (IOError, ValueError), e:
             # sometimes read fails during suspend/resume
-            if self.act_settings.trigger_points == {}:
-                raise UnavailableException(e.message)
-            else:
-                pass
-        finally:
-            try:
-                tempfile.close()
-            except:
-                pass
-        # now we need to loop through hwmon sensors
-        for sensor in self.act_settings.trigger_points:
-            # string are assumed to be from hwmon, while ints are from
-            # ibm_thermal
-            if not sensor.isdigit():
-                try:
-                    tempfile = open(sensor, 'r')
-                    element = tempfile.readline()
-                    tempfile.close()
-                    scaling = self.act_settings.sensor_scalings[sensor]
-                    # need to convert the value of the sensor to degree
-                    # Celsius
-                    res[sensor] = int(
-                        round(float(element.strip()) * float(scaling)))
-                except IOError, e:
-                    # sometimes read fails during suspend/resume
-                    raise UnavailableException(e.message)
-                finally:
-                    try:
-                        tempfile.close()
-                    except:
-                        pass
-        res = {str(x): int(y) for x, y in res.items()}
-        self.logger.debug('Output of get_temperatures ' + str(res))
-        return res
+            raise UnavailableException(str(e))
+        snapshot.readings = readings
 
-    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}')
-    def get_fan_state(self):
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}',
+                         async_callbacks=('reply', 'reply_error'))
+    def get_fan_state(self, reply, reply_error):
         """Returns current (fan_level, fan_rpm)"""
+        def deliver(snapshot):
+            if snapshot.fan_state is None:
+                reply_error(UnavailableException(snapshot.fan_error))
+            else:
+                reply(snapshot.fan_state)
+        self.get_current_snapshot(deliver, reply_error)
+
+    def read_fan_state(self):
+        """reads the fan level and speed"""
         try:
-            fanfile = open(self.act_settings.ibm_fan, 'r')
-            for line in fanfile.readlines():
+            content = self.act_settings.backend.read(self.act_settings.ibm_fan)
+            for line in content.splitlines():
                 key, value = line.split(':')
                 if key == 'speed':
                     rpm = int(value.strip())
@@ -184,27 +242,53 @@ class Control(dbus.service.Object):
                     'rpm': rpm}
         except Exception, e:
             raise UnavailableException(e.message)
-        finally:
-            try:
-                fanfile.close()
-            except:
-                pass
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='(da{si}a{si}a{si}a{si}sa{ss})')
+    def get_snapshot(self):
+        """returns (timestamp, temperatures, fan state, trip temperatures, trip fan speeds, profile, sensor names) of the last poll
+
+        temperatures or fan state are empty if they could not be read"""
+        snapshot = self.samples.latest()
+        registry = self.act_settings.sensor_registry
+        return (snapshot.timestamp,
+                snapshot.temperatures or {},
+                snapshot.fan_state or {},
+                registry.get_trip_temperatures(),
+                registry.get_trip_fan_speeds(),
+                self.act_settings.active_profile,
+                self.act_settings.sensor_names)
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}')
+    def get_cache_stats(self):
+        """returns hits, misses, refreshes and timeouts of the snapshot cache, its max age in msecs
+        and the number of sensor files read and of reads saved by the sensor intervals"""
+        res = self.samples.get_stats()
+        registry = self.act_settings.sensor_registry
+        res['sensor_reads'] = registry.reads
+        res['sensor_reads_skipped'] = registry.skipped_reads
+        return res
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='(a{si}a{si})')
+    def get_load(self):
+        """returns (cpu load in percent, fan speeds required by the load inputs) of the last poll"""
+        return (self.samples.latest().load,
+                self.act_settings.load_monitor.get_trip_fan_speeds())
 
     @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='')
     def reset_trips(self):
         """resets current trip points, should be called after config change"""
-        self.current_trip_speeds = {}
-        self.current_trip_temps = {}
+        self.act_settings.sensor_registry.reset_trips()
+        self.act_settings.load_monitor.reset_trips()
 
     @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}')
     def get_trip_temperatures(self):
         """returns the current hysteresis temperatures for all sensors"""
-        return self.current_trip_temps
+        return self.act_settings.sensor_registry.get_trip_temperatures()
 
     @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}')
     def get_trip_fan_speeds(self):
         """returns the current hysteresis fan speeds for all sensors"""
-        return self.current_trip_speeds
+        return self.act_settings.sensor_registry.get_trip_fan_speeds()
 
     def repoll(self, interval):
         """calls poll again after interval msecs"""
@@ -217,105 +301,276 @@ class Control(dbus.service.Object):
         if ival > self.act_settings.watchdog_time * 1000:
             ival = self.act_settings.watchdog_time * 1000
 
-        gobject.timeout_add(ival, self.poll)
+        self.poll_interval = ival
+        self.poll_source = self.clock.timeout_add(ival, self.poll)
+
+    def poll_now(self, inline=False):
+        """polls right away instead of waiting for the scheduled poll
+
+        with inline the fan and the sensors are read on the calling thread,
+        so the fan speed is set before this returns, e.g. at startup
+        before the main loop runs"""
+        if self.poll_source is not None:
+            self.clock.source_remove(self.poll_source)
+        if not inline:
+            self.poll()
+            return
+        executor = self.samples.executor
+        self.samples.executor = worker.InlineExecutor()
+        try:
+            self.poll()
+        finally:
+            self.samples.executor = executor
+
+    def on_threshold_crossed(self, sensor):
+        """polls immediately when a sensor crossed a hardware threshold"""
+        self.logger.debug('Threshold crossed by ' + sensor.sensor_id)
+        if self.poll_source is not None:
+            self.clock.source_remove(self.poll_source)
+        self.poll_source = self.clock.idle_add(self.poll)
+
+    def update_thresholds(self):
+        """programs the next hardware thresholds if the profile asks for event driven control"""
+        registry = self.act_settings.sensor_registry
+        if not self.act_settings.event_driven:
+            if self.thresholds.registry is not None:
+                self.thresholds.detach()
+            return False
+        if self.thresholds.registry is not registry:
+            self.thresholds.attach(registry)
+        self.thresholds.arm()
+        return self.thresholds.covers(registry)
+
+    def shutdown(self):
+        """gives the fan back to the EC and restores hardware thresholds"""
+        self.profiler.stop()
+        self.thresholds.detach()
+        self.set_speed(255)
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}')
+    def get_actuator_stats(self):
+        """returns the number of fan commands issued and suppressed, writes and failed writes"""
+        return self.actuator.get_stats()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{sa{sd}}')
+    def get_poll_stats(self):
+        """returns count, min, max, mean, percentiles and histogram buckets in usecs for every stage of the poll cycle"""
+        return self.poll_stats.to_dict()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='')
+    def reset_poll_stats(self):
+        """clears the poll cycle statistics"""
+        self.poll_stats.reset()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='i', out_signature='b')
+    def start_profiling(self, duration):
+        """samples the stack and counts objects for duration secs, returns False if already running"""
+        return self.profiler.start(duration)
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='s')
+    def stop_profiling(self):
+        """ends profiling early, returns the path of the report or '' if it was not running"""
+        return self.profiler.stop()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='(bds)')
+    def get_profiling_state(self):
+        """returns (running, secs left, path of the last report)"""
+        return self.profiler.get_state()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='d', out_signature='a(da{si}iia{si}a{si})')
+    def get_history(self, since):
+        """returns (timestamp, temperatures, fan level, fan rpm, trip temperatures, trip fan speeds) of all polls after since,
+        timestamps are monotonic secs that keep growing across clock changes"""
+        return self.history.get_since(since)
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='a{si}')
+    def get_throttle_stats(self):
+        """returns the cpu throttle events, the polls and the polls with throttling since the start,
+        the escalations of the performance mode and the fan speed it currently keeps"""
+        return self.throttle.get_stats()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='d', out_signature='a(di)')
+    def get_throttle_history(self, since):
+        """returns (timestamp, cpu throttle events since the previous poll) of all polls after since,
+        timestamps are monotonic secs like those of get_history"""
+        return self.history.get_throttles_since(since)
+
+    @dbus.service.signal('org.tpfanco.tpfancod.Control', signature='a{si}')
+    def temperatures_changed(self, temperatures):
+        """emitted when a temperature changed by at least signal_threshold"""
+        pass
+
+    @dbus.service.signal('org.tpfanco.tpfancod.Control', signature='a{si}')
+    def fan_state_changed(self, fan_state):
+        """emitted when the fan level or speed changed"""
+        pass
+
+    @dbus.service.signal('org.tpfanco.tpfancod.Control', signature='a{si}a{si}')
+    def trips_changed(self, trip_temperatures, trip_fan_speeds):
+        """emitted when the hysteresis temperatures or fan speeds changed"""
+        pass
+
+    def emit_changes(self, snapshot):
+        """signals the readings of the last poll cycle that changed enough since the last signal"""
+        now = self.clock.monotonic()
+        self.changes.interval = self.act_settings.signal_interval
+        self.changes.threshold = self.act_settings.signal_threshold
+        if snapshot.temperatures is not None and \
+                self.changes.check_temperatures(snapshot.temperatures, now):
+            self.temperatures_changed(snapshot.temperatures)
+        if snapshot.fan_state is not None and \
+                self.changes.check_fan_state(snapshot.fan_state, now):
+            self.fan_state_changed(snapshot.fan_state)
+        registry = self.act_settings.sensor_registry
+        trip_temperatures = registry.get_trip_temperatures()
+        trip_fan_speeds = registry.get_trip_fan_speeds()
+        if self.changes.check_trips(trip_temperatures, trip_fan_speeds, now):
+            self.trips_changed(trip_temperatures, trip_fan_speeds)
+
+    @dbus.service.method('org.tpfanco.tpfancod.Control', in_signature='', out_signature='i')
+    def get_poll_interval(self):
+        """returns the current time between two polls in msecs"""
+        return self.poll_interval
+
+    def get_headroom(self):
+        """returns the smallest distance in K to a trigger or hysteresis release temperature"""
+        headroom = None
+        for sensor in self.act_settings.sensor_registry.sensors:
+            temp = sensor.temp
+            if temp is None or temp in sensor.disconnected:
+                continue
+            distances = []
+            threshold = sensor.table.next_threshold(temp)
+            if threshold is not None:
+                distances.append(threshold - temp)
+            if sensor.trip_speed is not None:
+                distances.append(temp - sensor.trip_temp)
+            for distance in distances:
+                if headroom is None or distance < headroom:
+                    headroom = distance
+        return headroom
+
+    def get_max_interval(self):
+        """returns the longest poll interval that still rearms the watchdog in time"""
+        settings = self.act_settings
+        return max(settings.poll_min_time,
+                   min(settings.poll_max_time, settings.watchdog_time * 1000 - self.watchdog_margin))
+
+    def get_next_interval(self, temps):
+        """returns the time until the next poll, depending on how fast temperatures approach a trigger"""
+        settings = self.act_settings
+        if self.update_thresholds() and not self.act_settings.load_monitor.inputs:
+            # every sensor wakes us up on its own, poll only to rearm the
+            # watchdog, the load raises no events and has to be polled
+            self.logger.debug('All sensors raise threshold events')
+            return self.get_max_interval()
+        if self.scheduled_registry is not settings.sensor_registry:
+            # the trend of the sensors of another profile means nothing here
+            self.scheduler.reset(settings.poll_time)
+            self.scheduled_registry = settings.sensor_registry
+        interval = self.scheduler.next_interval(self.clock.monotonic(), temps, self.get_headroom(),
+                                                settings.poll_time, settings.poll_min_time,
+                                                self.get_max_interval(),
+                                                settings.poll_aggressiveness)
+        self.logger.debug('Next poll in ' + str(interval) + ' ms')
+        return interval
 
     def poll(self):
-        """main fan control routine"""
-        # get the current fan level
-        fan_state = self.get_fan_state()
+        """main fan control routine, reads the fan and the sensors off the main loop"""
+        # the source that called us is removed when we return False
+        self.poll_source = None
+        if self.polling:
+            # the running cycle repolls once its read arrives
+            return False
+        if self.samples.is_stuck():
+            # the fan is with the EC until the read returns
+            self.logger.debug('Still waiting for a stuck read')
+            self.repoll(self.act_settings.poll_time)
+            return False
+        self.polling = True
+        self.cycle_start = clock.monotonic()
+        # read the fan and all sensors once for this cycle
+        self.samples.fetch(self.on_snapshot, force=True)
+        # remove current timer
+        return False
+
+    def on_snapshot(self, snapshot):
+        """decides on the fan speed for the readings of a poll"""
+        self.polling = False
+        if snapshot is None:
+            self.logger.error('Reading the fan and the sensors takes longer than ' +
+                              str(self.read_deadline) + ' ms, giving the fan back to the EC')
+            self.fall_back()
+            self.repoll(self.act_settings.poll_time)
+            return
         self.logger.debug('')
         self.logger.debug('Polling the sensors')
-        self.logger.debug(
-            'Current fan level: ' + str(fan_state['level']) + ' (' + str(fan_state['rpm']) + ' RPM)')
+        throttles = self.throttle.update(snapshot.throttle_count)
+        if throttles:
+            self.logger.debug('The cpu throttled ' + str(throttles) + ' times')
+        if snapshot.fan_state is not None:
+            self.logger.debug(
+                'Current fan level: ' + str(snapshot.fan_state['level']) + ' (' + str(snapshot.fan_state['rpm']) + ' RPM)')
+        else:
+            self.logger.debug(
+                'Unable to read the fan state: ' + str(snapshot.fan_error))
         # fan control is activated only if it is enabled and there is a profile
         # or the user specified to override existing profile
         if (self.act_settings.enabled and self.act_settings.is_profile_exactly_matched()) or (self.act_settings.enabled and self.act_settings.override_profile):
             self.logger.debug('Fan control enabled')
-            try:
-                temps = self.get_temperatures()
-            except UnavailableException:
+            temps = snapshot.temperatures
+            if temps is None:
                 # temperature read failed
-                self.set_speed(255)
-                self.repoll(self.act_settings.poll_time)
-                return False
-            new_speed = 0
+                new_speed = 255
+                interval = self.act_settings.poll_time
             # check that we have at least one temperature sensor to monitor
-            if len(temps) != 0:
-
-                for tid in temps:
-                    # we look only at the sensors that are listed in the
-                    # profile
-                    if tid in self.act_settings.trigger_points and tid.isdigit():
-                        self.logger.debug(
-                            'ibm_thermal sensor: ' + tid + ' has value ' + str(temps[tid]))
-                        temp = temps[tid]
-                        # value is +/-128 or 0, if sensor is disconnected
-                        if abs(temp) != 128 and abs(temp) != 0:
-                            points = self.act_settings.trigger_points[tid]
-                            speed = 0
-                            self.logger.debug(
-                                'Sensor ' + str(tid) + ': ' + str(temp))
-                            # check if temperature is above hysteresis shutdown
-                            # point
-                            if tid in self.current_trip_temps:
-                                if temp >= self.current_trip_temps[tid]:
-                                    speed = self.current_trip_speeds[tid]
-                                else:
-                                    del self.current_trip_temps[tid]
-                                    del self.current_trip_speeds[tid]
-
-                            # check if temperature is over trigger point
-                            for trigger_temp, trigger_speed in points.iteritems():
-                                if temp >= trigger_temp and speed < trigger_speed:
-                                    self.current_trip_temps[
-                                        tid] = trigger_temp - self.act_settings.hysteresis
-                                    self.current_trip_speeds[
-                                        tid] = trigger_speed
-                                    speed = trigger_speed
-
-                            new_speed = max(new_speed, speed)
-
-                # we look only at the sensors that are listed in the profile
-                for sensor in temps:
-                    if not sensor.isdigit():
+            elif len(temps) != 0:
+                start = clock.monotonic()
+                new_speed = self.act_settings.sensor_registry.evaluate()
+                # ramp up ahead of the temperatures when the load jumps
+                load_speed = self.act_settings.load_monitor.evaluate()
+                if load_speed > new_speed:
+                    self.logger.debug(
+                        'Load ' + str(snapshot.load) + ' requires fan level ' + str(load_speed))
+                    new_speed = load_speed
+                if self.act_settings.performance_mode:
+                    speed = self.throttle.adjust(new_speed, throttles, self.clock.monotonic(),
+                                                 self.act_settings.throttle_relax_time)
+                    if speed != new_speed:
                         self.logger.debug(
-                            'hwmon sensor: ' + sensor + ' has value ' + str(temps[sensor]))
-                        temp = temps[sensor]
-                        # value is 0, if sensor is disconnected
-                        points = self.act_settings.trigger_points[sensor]
-                        speed = 0
-                        # check if temperature is above hysteresis shutdown
-                        # point
-                        if sensor in self.current_trip_temps:
-                            if temp >= self.current_trip_temps[sensor]:
-                                speed = self.current_trip_speeds[sensor]
-                            else:
-                                del self.current_trip_temps[sensor]
-                                del self.current_trip_speeds[sensor]
-
-                        # check if temperature is over trigger point
-                        for trigger_temp, trigger_speed in points.iteritems():
-                            if temp >= trigger_temp and speed < trigger_speed:
-                                self.current_trip_temps[
-                                    sensor] = trigger_temp - self.act_settings.hysteresis
-                                self.current_trip_speeds[
-                                    sensor] = trigger_speed
-                                speed = trigger_speed
-
-                        new_speed = max(new_speed, speed)
+                            'Performance mode requires fan level ' + str(speed))
+                    new_speed = speed
+                else:
+                    self.throttle.reset()
+                self.poll_stats.add('triggers', clock.monotonic() - start)
                 self.logger.debug(
                     'Trying to set fan level to ' + str(new_speed) + ':')
+                interval = self.get_next_interval(temps)
             else:
                 self.logger.debug(
                     'No sensors to monitor, giving fan control back to the EC control ')
                 new_speed = 255
+                interval = self.act_settings.poll_time
             # set fan speed
-            self.set_speed(new_speed)
-            self.repoll(self.act_settings.poll_time)
+            self.set_speed(new_speed, interval)
+            self.repoll(interval)
         else:
             self.logger.debug('Fan control disabled')
-            self.set_speed(255)
+            self.thresholds.detach()
+            self.set_speed(255, self.act_settings.poll_time)
             self.repoll(self.act_settings.poll_time)
 
-        # remove current timer
-        return False
+        self.history.append(self.clock.monotonic(), snapshot.fan_state, snapshot.temperatures,
+                            self.act_settings.sensor_registry.sensors, throttles)
+        self.emit_changes(snapshot)
+        self.poll_stats.add('cycle', clock.monotonic() - self.cycle_start)
+
+    def fall_back(self):
+        """gives the fan to the EC without waiting for it on the main loop"""
+        self.actuator.invalidate()
+        self.executor.submit(lambda: self.act_settings.backend.write(self.act_settings.ibm_fan, 'level auto'),
+                             self.on_fall_back_written)
+
+    def on_fall_back_written(self, result, error):
+        if error is not None:
+            self.logger.error('Unable to give the fan back to the EC: ' + str(error))
@@ -0,0 +1,256 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import glob
+import logging
+import os
+import re
+
+from tpfancod import hardware, uevent
+
+
+class ThresholdWatcher(object):
+
+    """programs hardware thresholds of one sensor and reports crossings
+
+    subclasses provide arm(up, down), which sets the temperatures at
+    which the next event is raised"""
+
+    def __init__(self, sensor, callback):
+        self.sensor = sensor
+        self.callback = callback
+        # original values of the attributes we modify, restored on close
+        self.original = {}
+        # last values we have written
+        self.written = {}
+
+    def to_raw(self, temp):
+        """converts degree Celsius to the unit of the sensor"""
+        return int(round(temp / self.sensor.scaling))
+
+    def program(self, path, temp):
+        """writes temp to the threshold attribute at path unless it is already set"""
+        if temp is None:
+            value = self.original[path]
+        else:
+            value = str(self.to_raw(temp))
+        if self.written.get(path) == value:
+            return
+        hardware.write_file(path, value)
+        self.written[path] = value
+
+    def save_original(self, path):
+        self.original[path] = hardware.read_file(path).strip()
+
+    def close(self):
+        """restores the original thresholds"""
+        for path, value in self.original.iteritems():
+            if self.written.get(path, value) != value:
+                try:
+                    hardware.write_file(path, value)
+                except IOError:
+                    pass
+        self.written = {}
+
+
+class HwmonAlarmWatcher(ThresholdWatcher):
+
+    """uses tempN_max and tempN_max_hyst of a hwmon sensor and waits for tempN_alarm to change"""
+
+    @staticmethod
+    def is_supported(path):
+        if not path.endswith('_input'):
+            return False
+        base = path[:-len('_input')]
+        return os.access(base + '_max', os.W_OK) and os.path.exists(base + '_alarm')
+
+    def __init__(self, sensor, callback):
+        ThresholdWatcher.__init__(self, sensor, callback)
+        base = sensor.path[:-len('_input')]
+        self.max_path = base + '_max'
+        self.hyst_path = base + '_max_hyst'
+        if not os.access(self.hyst_path, os.W_OK):
+            self.hyst_path = None
+        self.save_original(self.max_path)
+        if self.hyst_path is not None:
+            self.save_original(self.hyst_path)
+        # sysfs_notify() wakes up poll() with POLLPRI | POLLERR, the
+        # attribute has to be read before and after every notification
+        self.alarm = hardware.FileHandle(base + '_alarm')
+        self.alarm.read()
+        self.source = self.add_watch(self.alarm.open())
+
+    def add_watch(self, fd):
+        """calls on_alarm whenever the kernel notifies fd"""
+        # imported here so that loading the control module does not load glib
+        import gobject
+        return gobject.io_add_watch(fd, gobject.IO_PRI | gobject.IO_ERR, self.on_alarm)
+
+    def remove_watch(self, source):
+        import gobject
+        gobject.source_remove(source)
+
+    def on_alarm(self, fd, condition):
+        try:
+            self.alarm.read()
+        except IOError:
+            pass
+        self.callback(self.sensor)
+        return True
+
+    def arm(self, up, down):
+        self.program(self.max_path, up)
+        if self.hyst_path is not None:
+            if up is not None and (down is None or down >= up):
+                down = up - 1
+            self.program(self.hyst_path, down)
+
+    def close(self):
+        self.remove_watch(self.source)
+        self.alarm.close()
+        ThresholdWatcher.close(self)
+
+
+class ThermalZoneWatcher(ThresholdWatcher):
+
+    """uses the free passive trip points of a thermal zone and waits for its uevents"""
+
+    zone_pattern = re.compile(r'.*/(thermal_zone\d+)/temp$')
+    trip_pattern = re.compile(r'trip_point_(\d+)_temp$')
+    cdev_pattern = re.compile(r'cdev\d+_trip_point$')
+
+    # only passive trips without a cooling device are free for us, e.g.
+    # the notification thresholds of x86_pkg_temp_thermal. Moving any
+    # other trip would change when the kernel throttles or shuts down.
+    trip_types = ('passive',)
+
+    @classmethod
+    def get_trip_points(cls, path):
+        """returns the trip point attributes of the zone that path belongs to which we may program"""
+        match = cls.zone_pattern.match(path)
+        if match is None:
+            return []
+        zone = os.path.dirname(path)
+        bound = set()
+        for name in os.listdir(zone):
+            if cls.cdev_pattern.match(name):
+                try:
+                    bound.add(int(hardware.read_file(os.path.join(zone, name))))
+                except (IOError, ValueError):
+                    pass
+        trips = []
+        for trip in glob.glob(os.path.join(zone, 'trip_point_*_temp')):
+            match = cls.trip_pattern.search(trip)
+            if match is None or int(match.group(1)) in bound:
+                continue
+            try:
+                trip_type = hardware.read_file(trip[:-len('temp')] + 'type').strip()
+            except IOError:
+                continue
+            if trip_type in cls.trip_types and os.access(trip, os.W_OK):
+                trips.append((int(match.group(1)), trip))
+        return [trip for index, trip in sorted(trips)]
+
+    @classmethod
+    def is_supported(cls, path):
+        return len(cls.get_trip_points(path)) > 0
+
+    def __init__(self, sensor, callback):
+        ThresholdWatcher.__init__(self, sensor, callback)
+        self.zone = self.zone_pattern.match(sensor.path).group(1)
+        self.trips = self.get_trip_points(sensor.path)[:2]
+        for trip in self.trips:
+            self.save_original(trip)
+        if not uevent.monitor.subscribe('thermal', self.on_uevent):
+            self.close()
+            raise IOError('kernel uevents are not available')
+
+    def on_uevent(self, properties):
+        if properties.get('DEVPATH', '').endswith('/' + self.zone):
+            self.callback(self.sensor)
+
+    def arm(self, up, down):
+        self.program(self.trips[0], up)
+        if len(self.trips) > 1:
+            self.program(self.trips[1], down)
+
+    def close(self):
+        uevent.monitor.unsubscribe('thermal', self.on_uevent)
+        ThresholdWatcher.close(self)
+
+
+class ThresholdMonitor(object):
+
+    """programs the next up and down thresholds of the profile into the hardware"""
+
+    watcher_classes = [HwmonAlarmWatcher, ThermalZoneWatcher]
+
+    def __init__(self, callback):
+        self.logger = logging.getLogger(__name__)
+        self.callback = callback
+        self.registry = None
+        self.watchers = []
+
+    def attach(self, registry):
+        """starts watching all sensors of registry that support hardware thresholds"""
+        self.detach()
+        self.registry = registry
+        for sensor in registry.hwmon_sensors:
+            for watcher_class in self.watcher_classes:
+                if not watcher_class.is_supported(sensor.path):
+                    continue
+                try:
+                    self.watchers.append(
+                        watcher_class(sensor, self.callback))
+                    self.logger.debug(
+                        'Watching thresholds of ' + sensor.sensor_id)
+                    break
+                except IOError, e:
+                    self.logger.debug('Unable to watch thresholds of ' +
+                                      sensor.sensor_id + ': ' + str(e))
+
+    def detach(self):
+        """stops watching and restores the original thresholds"""
+        for watcher in self.watchers:
+            watcher.close()
+        self.watchers = []
+        self.registry = None
+
+    def covers(self, registry):
+        """returns True if every sensor of registry raises events"""
+        return (self.registry is registry and
+                len(self.watchers) == len(registry.sensors))
+
+    def arm(self):
+        """programs the thresholds around the last readings"""
+        for watcher in self.watchers:
+            sensor = watcher.sensor
+            if sensor.temp is None:
+                continue
+            up = sensor.table.next_threshold(sensor.temp)
+            down = None
+            if sensor.trip_speed is not None:
+                down = sensor.trip_temp
+            try:
+                watcher.arm(up, down)
+            except IOError, e:
+                self.logger.debug('Unable to program thresholds of ' +
+                                  sensor.sensor_id + ': ' + str(e))
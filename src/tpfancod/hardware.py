@@ -0,0 +1,509 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import errno
+import os
+import threading
+
+
+class FileHandle(object):
+
+    """persistent descriptor of a sysfs or procfs file"""
+
+    # errors after which the file must be opened again, e.g. because
+    # the hwmon device was renumbered or vanished during suspend/resume
+    reopen_errors = (errno.ENOENT, errno.ENODEV, errno.ENXIO, errno.EBADF)
+
+    # sensor and fan files are tiny, one read always returns the whole file
+    read_size = 4096
+
+    def __init__(self, path, flags=os.O_RDONLY):
+        self.path = path
+        self.flags = flags
+        self.fd = None
+
+    def open(self):
+        """opens the file unless it is already open"""
+        if self.fd is None:
+            self.fd = os.open(self.path, self.flags)
+        return self.fd
+
+    def close(self):
+        """closes the file descriptor"""
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def read(self):
+        """rereads the file from the beginning and returns its content"""
+        return self.retry(self.do_read)
+
+    def write(self, data):
+        """writes data to the file in a single write call"""
+        return self.retry(self.do_write, data)
+
+    def do_read(self):
+        fd = self.open()
+        os.lseek(fd, 0, os.SEEK_SET)
+        return os.read(fd, self.read_size)
+
+    def do_write(self, data):
+        fd = self.open()
+        return os.write(fd, data)
+
+    def forget(self, error):
+        """drops the descriptor after error, one that is no longer valid is not closed
+
+        its number may already belong to a file opened since"""
+        if error == errno.EBADF:
+            self.fd = None
+        else:
+            self.close()
+
+    def retry(self, operation, *args):
+        """runs operation, reopens the file once if it went away"""
+        try:
+            try:
+                return operation(*args)
+            except OSError, e:
+                if e.errno not in self.reopen_errors:
+                    raise
+                self.forget(e.errno)
+                return operation(*args)
+        except OSError, e:
+            # callers expect the same exception as from the builtin open()
+            if e.errno in self.reopen_errors:
+                self.forget(e.errno)
+            raise IOError(e.errno, e.strerror, self.path)
+
+
+def read_file(path):
+    """reads a sysfs or procfs file once"""
+    handle = FileHandle(path)
+    try:
+        return handle.read()
+    finally:
+        handle.close()
+
+
+def write_file(path, data):
+    """writes data to a sysfs or procfs file once"""
+    handle = FileHandle(path, os.O_WRONLY)
+    try:
+        return handle.write(data)
+    finally:
+        handle.close()
+
+
+class HandlePool(object):
+
+    """keeps the sensor and fan files of the loaded profile open
+
+    The files are read and written by the worker threads while the main
+    loop rebuilds the pool, so a handle that is in use when it is no longer
+    needed is only closed once its read or write has returned. Otherwise
+    the worker would read a closed descriptor or, worse, one that was
+    reused for another file in the meantime."""
+
+    def __init__(self):
+        self.handles = {}
+        # handle -> number of reads and writes running on it
+        self.users = {}
+        # handles removed from the pool while in use
+        self.retired = set()
+        self.lock = threading.Lock()
+
+    def create_handle(self, path, flags):
+        return FileHandle(path, flags)
+
+    def lookup(self, key):
+        """returns the handle for key, creating it if necessary, with the lock held"""
+        handle = self.handles.get(key)
+        if handle is None:
+            handle = self.create_handle(*key)
+            self.handles[key] = handle
+        return handle
+
+    def get(self, path, flags=os.O_RDONLY):
+        """returns the handle for path, creating it if necessary"""
+        with self.lock:
+            return self.lookup((path, flags))
+
+    def acquire(self, path, flags):
+        """returns the handle for path, which is not closed before release"""
+        with self.lock:
+            handle = self.lookup((path, flags))
+            self.users[handle] = self.users.get(handle, 0) + 1
+        return handle
+
+    def release(self, handle):
+        with self.lock:
+            self.users[handle] -= 1
+            if self.users[handle] > 0:
+                return
+            del self.users[handle]
+            if handle not in self.retired:
+                return
+            self.retired.remove(handle)
+        handle.close()
+
+    def read(self, path):
+        """returns the current content of path"""
+        handle = self.acquire(path, os.O_RDONLY)
+        try:
+            return handle.read()
+        finally:
+            self.release(handle)
+
+    def write(self, path, data):
+        """writes data to path"""
+        handle = self.acquire(path, os.O_WRONLY)
+        try:
+            return handle.write(data)
+        finally:
+            self.release(handle)
+
+    def retire(self, key):
+        """removes a handle from the pool, closing it once it is no longer in use"""
+        with self.lock:
+            handle = self.handles.pop(key)
+            if handle in self.users:
+                self.retired.add(handle)
+                return
+        handle.close()
+
+    def rebuild(self, read_paths, write_paths=()):
+        """opens the given paths and closes all handles that are no longer needed"""
+        wanted = set((path, os.O_RDONLY) for path in read_paths)
+        wanted.update((path, os.O_WRONLY) for path in write_paths)
+        for key in self.handles.keys():
+            if key not in wanted:
+                self.retire(key)
+        for key in wanted:
+            with self.lock:
+                handle = self.lookup(key)
+                if handle in self.users:
+                    # a handle in use is opened by its user
+                    continue
+                try:
+                    handle.open()
+                except OSError:
+                    # missing files are opened lazily on the next access
+                    pass
+
+    def close_all(self):
+        """closes all handles, the ones in use when their user is done"""
+        for key in self.handles.keys():
+            self.retire(key)
+
+
+class SysfsBackend(HandlePool):
+
+    """access to the real sysfs and procfs files"""
+
+    def exists(self, path):
+        return os.path.isfile(path)
+
+    def read_once(self, path):
+        """reads path without keeping it open"""
+        return read_file(path)
+
+
+class FakeHandle(object):
+
+    """handle of a file served by FakeBackend"""
+
+    def __init__(self, backend, path, flags):
+        self.backend = backend
+        self.path = path
+        self.flags = flags
+
+    def open(self):
+        if not self.backend.exists(self.path):
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), self.path)
+        return -1
+
+    def close(self):
+        pass
+
+    def read(self):
+        return self.backend.read_fake(self.path)
+
+    def write(self, data):
+        return self.backend.write_fake(self.path, data)
+
+
+class FakeFan(object):
+
+    """emulates the fan interface of thinkpad_acpi including its watchdog"""
+
+    levels = ['0', '1', '2', '3', '4', '5', '6', '7',
+              'auto', 'disengaged', 'full-speed']
+
+    def __init__(self):
+        self.level = 'auto'
+        self.watchdog = 0
+        self.deadline = None
+        # how often the watchdog gave the fan back to the EC
+        self.expired = 0
+
+    def expire(self, now):
+        if self.deadline is not None and now >= self.deadline:
+            if self.level != 'auto':
+                self.expired += 1
+            self.level = 'auto'
+            self.deadline = None
+
+    def command(self, data, now):
+        """executes the commands written to /proc/acpi/ibm/fan, separated by commas"""
+        self.expire(now)
+        for command in data.split(','):
+            words = command.split()
+            if words == ['enable']:
+                self.level = 'auto'
+            elif words == ['disable']:
+                self.level = '0'
+            elif len(words) == 2 and words[0] == 'level' and words[1] in self.levels:
+                self.level = words[1]
+            elif len(words) == 2 and words[0] == 'watchdog' and words[1].isdigit() and int(words[1]) <= 120:
+                self.watchdog = int(words[1])
+            else:
+                raise IOError(errno.EINVAL, os.strerror(errno.EINVAL))
+        # like the real driver, every successful write rearms the watchdog
+        if self.watchdog:
+            self.deadline = now + self.watchdog
+        else:
+            self.deadline = None
+
+    def get_rpm(self):
+        if self.level == '0':
+            return 0
+        if self.level.isdigit():
+            return 1800 + 400 * int(self.level)
+        if self.level == 'auto':
+            return 3000
+        return 5500
+
+    def render(self, now):
+        """returns the content of /proc/acpi/ibm/fan"""
+        self.expire(now)
+        if self.level == '0':
+            status = 'disabled'
+        else:
+            status = 'enabled'
+        return ('status:\t\t%s\n'
+                'speed:\t\t%d\n'
+                'level:\t\t%s\n'
+                'commands:\tlevel <level> (<level> is 0-7, auto, disengaged, full-speed)\n'
+                'commands:\tenable, disable\n'
+                'commands:\twatchdog <timeout> (<timeout> is 0 (off), 1-120 (seconds))\n'
+                % (status, self.get_rpm(), self.level))
+
+
+class FakeBackend(HandlePool):
+
+    """scripted stand-in for the sysfs and procfs files, used for simulations and benchmarks"""
+
+    def __init__(self, time_source, ibm_fan='/proc/acpi/ibm/fan'):
+        HandlePool.__init__(self)
+        # returns the current (virtual) time in seconds
+        self.time_source = time_source
+        self.ibm_fan = ibm_fan
+        self.fan = FakeFan()
+        # path -> content string or function of the time returning the content
+        self.files = {}
+        # (timestamp, command) of every fan command
+        self.commands = []
+        self.reads = 0
+        self.writes = 0
+
+    def create_handle(self, path, flags):
+        return FakeHandle(self, path, flags)
+
+    def set_file(self, path, content):
+        """serves content, either a string or a function of the time, at path"""
+        self.files[path] = content
+
+    def exists(self, path):
+        return path == self.ibm_fan or path in self.files
+
+    def read_once(self, path):
+        return self.read_fake(path)
+
+    def read_fake(self, path):
+        self.reads += 1
+        now = self.time_source()
+        if path == self.ibm_fan:
+            return self.fan.render(now)
+        if path not in self.files:
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        content = self.files[path]
+        if callable(content):
+            content = content(now)
+        return content
+
+    def write_fake(self, path, data):
+        self.writes += 1
+        if path != self.ibm_fan:
+            raise IOError(errno.EACCES, os.strerror(errno.EACCES), path)
+        now = self.time_source()
+        self.commands.append((now, data))
+        self.fan.command(data, now)
+        return len(data)
+
+
+class Snapshot(object):
+
+    """fan and sensor readings captured once per poll cycle"""
+
+    def __init__(self, timestamp, fan_state=None, temperatures=None, fan_error=None, temperature_error=None,
+                 load=None, throttle_count=None):
+        self.timestamp = timestamp
+        self.fan_state = fan_state
+        self.temperatures = temperatures
+        # cpu load in percent by load input, see load.py
+        if load is None:
+            load = {}
+        self.load = load
+        # sum of the cpu throttle counters, None if they can not be read
+        self.throttle_count = throttle_count
+        # error messages if the corresponding read failed
+        self.fan_error = fan_error
+        self.temperature_error = temperature_error
+        # what the worker read, taken over on the main loop: clock.monotonic()
+        # of the read, raw sensor and load readings, durations of the stages
+        # as (stage, secs)
+        self.read_time = None
+        self.readings = None
+        self.load_samples = {}
+        self.durations = []
+
+    def get_level(self):
+        """returns the fan level or None if it is unknown"""
+        if self.fan_state is None:
+            return None
+        return self.fan_state['level']
+
+
+class SampleCache(object):
+
+    """latest Snapshot, shared by the poll loop and the d-bus getters
+
+    Snapshots are taken by executor, see worker.py, so a slow EC never
+    blocks the main loop. take_snapshot must therefore only read, the new
+    snapshot is passed to apply_snapshot on the main loop before anyone
+    gets it. Readers get the cached snapshot while it is
+    younger than max_age msecs, otherwise a new one is taken: callers that
+    arrive while it is taken wait for the same one. If it is not taken
+    within deadline msecs, the waiting callers get None. The read keeps
+    running and until it returns, no further read is started and all
+    callers get None right away."""
+
+    def __init__(self, take_snapshot, main_clock, max_age, executor, deadline, apply_snapshot=None):
+        self.take_snapshot = take_snapshot
+        self.apply_snapshot = apply_snapshot
+        self.clock = main_clock
+        self.max_age = max_age
+        self.executor = executor
+        self.deadline = deadline
+        self.snapshot = None
+        # clock.monotonic() when the snapshot was taken
+        self.taken = None
+        # True while the executor takes a snapshot
+        self.in_flight = False
+        # called with the next snapshot
+        self.waiters = []
+        self.timeout_source = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.timeouts = 0
+
+    def is_fresh(self, max_age):
+        return self.snapshot is not None and \
+            (self.clock.monotonic() - self.taken) * 1000 <= max_age
+
+    def is_stuck(self):
+        """returns True if a read timed out and did not return yet"""
+        return self.in_flight and self.timeout_source is None
+
+    def fetch(self, callback, force=False):
+        """calls callback with a snapshot that is at most max_age msecs old or None if the read timed out
+
+        with force a new snapshot is taken in any case, used by the poll loop"""
+        if not force and self.is_fresh(self.max_age):
+            self.hits += 1
+            callback(self.snapshot)
+            return
+        if not force:
+            self.misses += 1
+        if self.is_stuck():
+            callback(None)
+            return
+        self.waiters.append(callback)
+        if self.in_flight:
+            return
+        self.in_flight = True
+        self.timeout_source = self.clock.timeout_add(self.deadline, self.on_timeout)
+        self.executor.submit(self.take_snapshot, self.on_taken)
+
+    def on_taken(self, snapshot, error):
+        self.in_flight = False
+        if self.timeout_source is not None:
+            self.clock.source_remove(self.timeout_source)
+            self.timeout_source = None
+        if error is None:
+            if self.apply_snapshot is not None:
+                self.apply_snapshot(snapshot)
+            self.snapshot = snapshot
+            self.taken = self.clock.monotonic()
+            self.refreshes += 1
+        else:
+            snapshot = None
+        self.deliver(snapshot)
+
+    def on_timeout(self):
+        self.timeout_source = None
+        self.timeouts += 1
+        self.deliver(None)
+        return False
+
+    def deliver(self, snapshot):
+        waiters = self.waiters
+        self.waiters = []
+        for callback in waiters:
+            callback(snapshot)
+
+    def latest(self):
+        """returns the last snapshot regardless of its age, an empty one if there is none yet"""
+        if self.snapshot is None:
+            return Snapshot(0.0)
+        return self.snapshot
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'timeouts': self.timeouts,
+                'max_age': self.max_age}
@@ -0,0 +1,161 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import array
+
+# marks a value that was not available when the sample was taken
+MISSING = -32768
+
+
+class History(object):
+
+    """ring buffer of the readings of every poll cycle
+
+    All columns are preallocated arrays, appending a sample only overwrites
+    the oldest slot. Every sensor has its own columns, so samples survive a
+    change of the sensors, e.g. when the power source switches the profile:
+    a new sensor gets columns that are missing in the older samples and
+    the columns of a sensor that is gone are dropped once none of its
+    samples is left. Timestamps are clock.monotonic() values, so they
+    always grow and wall clock jumps do not break get_since."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array.array('d', [0.0] * capacity)
+        self.levels = array.array('i', [MISSING] * capacity)
+        self.rpms = array.array('i', [MISSING] * capacity)
+        # cpu throttle events since the previous sample
+        self.throttles = array.array('i', [MISSING] * capacity)
+        # sensor_id -> (temperatures, trip temperatures, trip fan speeds)
+        self.columns = {}
+        # sensors of the last sample and the other sensors with columns
+        self.sensor_ids = []
+        self.absent = []
+        # samples appended so far and the count when each sensor was last sampled
+        self.appended = 0
+        self.last_seen = {}
+        self.clear()
+
+    def set_sensors(self, sensor_ids):
+        """adds columns for new sensors in sensor_ids, keeping all samples"""
+        self.sensor_ids = list(sensor_ids)
+        for sensor_id in self.sensor_ids:
+            if sensor_id not in self.columns:
+                self.columns[sensor_id] = tuple(array.array('i', [MISSING] * self.capacity)
+                                                for column in range(3))
+        self.prune()
+
+    def prune(self):
+        """drops the columns of sensors that are gone and have no samples left"""
+        current = set(self.sensor_ids)
+        for sensor_id in self.columns.keys():
+            if sensor_id not in current and \
+                    self.appended - self.last_seen.get(sensor_id, 0) >= self.capacity:
+                del self.columns[sensor_id]
+                del self.last_seen[sensor_id]
+        self.absent = [sensor_id for sensor_id in self.columns if sensor_id not in current]
+
+    def clear(self):
+        # slot that the next sample is written to
+        self.head = 0
+        self.length = 0
+
+    def append(self, timestamp, fan_state, temperatures, sensors, throttles=None):
+        """stores a sample, sensors are the Sensor objects of the registry"""
+        if len(sensors) != len(self.sensor_ids) or \
+                any(sensor.sensor_id != sensor_id for sensor, sensor_id in zip(sensors, self.sensor_ids)):
+            self.set_sensors([sensor.sensor_id for sensor in sensors])
+        slot = self.head
+        self.timestamps[slot] = timestamp
+        if fan_state is not None:
+            self.levels[slot] = fan_state['level']
+            self.rpms[slot] = fan_state['rpm']
+        else:
+            self.levels[slot] = MISSING
+            self.rpms[slot] = MISSING
+        if throttles is None:
+            throttles = MISSING
+        self.throttles[slot] = throttles
+        if temperatures is None:
+            temperatures = {}
+        for sensor in sensors:
+            temps, trip_temps, trip_speeds = self.columns[sensor.sensor_id]
+            temps[slot] = temperatures.get(sensor.sensor_id, MISSING)
+            if sensor.trip_speed is None:
+                trip_temps[slot] = MISSING
+                trip_speeds[slot] = MISSING
+            else:
+                trip_temps[slot] = sensor.trip_temp
+                trip_speeds[slot] = sensor.trip_speed
+        for sensor_id in self.absent:
+            for column in self.columns[sensor_id]:
+                column[slot] = MISSING
+        self.head = (slot + 1) % self.capacity
+        if self.length < self.capacity:
+            self.length += 1
+        self.appended += 1
+        for sensor in sensors:
+            self.last_seen[sensor.sensor_id] = self.appended
+        if self.absent:
+            self.prune()
+
+    def get_since(self, since):
+        """returns the samples taken after since, oldest first
+
+        every sample is a tuple (timestamp, temperatures, fan level, fan rpm,
+        trip temperatures, trip fan speeds), missing values are left out of
+        the dicts and are -1 for the fan"""
+        return [self.get_sample(slot) for slot in self.get_slots_since(since)]
+
+    def get_slots_since(self, since):
+        """returns the slots of the samples taken after since, oldest first"""
+        # walk backwards from the newest sample until we reach since
+        slots = []
+        for age in range(1, self.length + 1):
+            slot = (self.head - age) % self.capacity
+            if self.timestamps[slot] <= since:
+                break
+            slots.append(slot)
+        slots.reverse()
+        return slots
+
+    def get_throttles_since(self, since):
+        """returns (timestamp, throttle events) of the samples taken after since, oldest first
+
+        samples without readable throttle counters are left out"""
+        return [(self.timestamps[slot], self.throttles[slot])
+                for slot in self.get_slots_since(since) if self.throttles[slot] != MISSING]
+
+    def get_sample(self, slot):
+        temps = {}
+        trip_temps = {}
+        trip_speeds = {}
+        for sensor_id, (temp_column, trip_temp_column, trip_speed_column) in self.columns.iteritems():
+            if temp_column[slot] != MISSING:
+                temps[sensor_id] = temp_column[slot]
+            if trip_speed_column[slot] != MISSING:
+                trip_temps[sensor_id] = trip_temp_column[slot]
+                trip_speeds[sensor_id] = trip_speed_column[slot]
+        level = self.levels[slot]
+        rpm = self.rpms[slot]
+        if level == MISSING:
+            level = rpm = -1
+        return (self.timestamps[slot], temps, level, rpm, trip_temps, trip_speeds)
@@ -0,0 +1,192 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""index of the hwmon temperature inputs by stable keys
+
+The hwmonN numbering depends on the order in which drivers are loaded, so
+profiles can refer to a temperature input by one of these keys instead of
+its path:
+
+    hwmon/<driver>/<label>          e.g. hwmon/coretemp/Package id 0
+    hwmon/<driver>/<input>          e.g. hwmon/thinkpad/temp1
+    hwmon/<device>/<input>          e.g. hwmon/platform/coretemp.0/temp1
+
+<device> is the path of the parent device below /sys/devices. Keys that
+match more than one input are left out of the index.
+"""
+
+import glob
+import logging
+import os
+import re
+
+PREFIX = 'hwmon/'
+
+# drivers of cpu temperatures, best first, see find_cpu_sensor
+CPU_DRIVERS = ['coretemp', 'k10temp', 'zenpower', 'thinkpad', 'acpitz']
+
+input_pattern = re.compile(r'^(temp\d+)_input$')
+
+
+def read_attribute(path):
+    """returns the stripped content of a sysfs attribute, None if it can not be read"""
+    try:
+        with open(path, 'r') as f:
+            return f.read(256).strip()
+    except IOError:
+        return None
+
+
+def clean(part):
+    """makes part usable in a key and as an option name of a profile"""
+    return re.sub(r'[:=\[\]]', '_', part.strip())
+
+
+class HwmonInput(object):
+
+    """a single temperature input"""
+
+    def __init__(self, path, driver, label, device):
+        self.path = path
+        self.driver = driver
+        self.label = label
+        self.device = device
+        self.name = input_pattern.match(os.path.basename(path)).group(1)
+
+    def get_keys(self):
+        """returns the stable keys of this input, preferred one first"""
+        keys = []
+        if self.label:
+            keys.append(PREFIX + self.driver + '/' + clean(self.label))
+        keys.append(PREFIX + self.driver + '/' + self.name)
+        keys.append(PREFIX + self.device + '/' + self.name)
+        return keys
+
+
+class HwmonIndex(object):
+
+    """all temperature inputs below /sys/class/hwmon, rescanned on hwmon uevents"""
+
+    def __init__(self, root='/sys/class/hwmon', devices_root='/sys/devices'):
+        self.logger = logging.getLogger(__name__)
+        self.root = root
+        self.devices_root = devices_root
+        self.inputs = []
+        # key -> path of the input
+        self.keys = {}
+        # called without arguments after every rescan
+        self.listeners = []
+        self.watching = False
+        self.scan()
+
+    def get_device(self, hwmon_dir):
+        """returns the path of the device that registered hwmon_dir below devices_root"""
+        real = os.path.realpath(hwmon_dir)
+        parent = os.path.dirname(real)
+        # usually <device>/hwmon/hwmonN, some drivers omit the hwmon directory
+        if os.path.basename(parent) == 'hwmon':
+            parent = os.path.dirname(parent)
+        prefix = os.path.join(self.devices_root, '')
+        if parent.startswith(prefix):
+            parent = parent[len(prefix):]
+        return clean(parent)
+
+    def scan(self):
+        """builds the index from scratch"""
+        inputs = []
+        for hwmon_dir in sorted(glob.glob(os.path.join(self.root, 'hwmon*'))):
+            real = os.path.realpath(hwmon_dir)
+            driver = read_attribute(os.path.join(real, 'name'))
+            # older drivers keep their attributes in the device directory
+            attribute_dirs = [real, os.path.join(real, 'device')]
+            if driver is None:
+                driver = read_attribute(os.path.join(real, 'device', 'name'))
+            if driver is None:
+                continue
+            device = self.get_device(hwmon_dir)
+            seen = set()
+            for attribute_dir in attribute_dirs:
+                for path in sorted(glob.glob(os.path.join(attribute_dir, 'temp*_input'))):
+                    if not input_pattern.match(os.path.basename(path)) or \
+                            os.path.realpath(path) in seen:
+                        continue
+                    seen.add(os.path.realpath(path))
+                    label = read_attribute(path[:-len('_input')] + '_label')
+                    inputs.append(HwmonInput(
+                        os.path.realpath(path), clean(driver), label, device))
+
+        keys = {}
+        ambiguous = set()
+        for hwmon_input in inputs:
+            for key in hwmon_input.get_keys():
+                if key in keys and keys[key] != hwmon_input.path:
+                    ambiguous.add(key)
+                keys[key] = hwmon_input.path
+        for key in ambiguous:
+            self.logger.debug('Ambiguous hwmon key ' + key)
+            del keys[key]
+        self.inputs = inputs
+        self.keys = keys
+        self.logger.debug('Found ' + str(len(inputs)) + ' hwmon temperature inputs')
+
+    def resolve(self, sensor_id):
+        """returns the path of the input that sensor_id refers to, None if there is none"""
+        return self.keys.get(sensor_id)
+
+    def get_key(self, path):
+        """returns the preferred unambiguous key of the input at path, None if there is none"""
+        for hwmon_input in self.inputs:
+            if hwmon_input.path == os.path.realpath(path):
+                for key in hwmon_input.get_keys():
+                    if key in self.keys:
+                        return key
+        return None
+
+    def find_cpu_sensor(self):
+        """returns the key of the most likely cpu temperature input, None if there is none"""
+        for driver in CPU_DRIVERS:
+            for hwmon_input in self.inputs:
+                if hwmon_input.driver == driver:
+                    key = self.get_key(hwmon_input.path)
+                    if key is not None:
+                        return key
+        return None
+
+    def watch(self, listener):
+        """rescans on hwmon uevents and calls listener afterwards"""
+        # uevent needs the glib main loop, the index itself does not
+        from tpfancod import uevent
+
+        self.listeners.append(listener)
+        if not self.watching:
+            self.watching = True
+            if not uevent.monitor.subscribe('hwmon', self.on_uevent):
+                self.logger.debug(
+                    'No uevents, hwmon inputs are only scanned at startup')
+
+    def on_uevent(self, properties):
+        if properties.get('ACTION') not in ('add', 'remove', 'change'):
+            return
+        self.logger.debug('hwmon ' + properties.get('ACTION') + ' of ' +
+                          str(properties.get('DEVPATH')) + ', rescanning')
+        self.scan()
+        for listener in list(self.listeners):
+            listener()
@@ -0,0 +1,171 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""cpu load as a feed-forward input of the fan control
+
+Temperatures follow a load jump only after seconds, often too late to
+keep the cpu from throttling. A profile can therefore raise the fan level
+as soon as the load rises:
+
+    [Load]
+    utilization = {70: 3, 90: 5}
+    pressure = {10: 4, 40: 7}
+
+utilization is the share of busy cpu time since the previous poll from
+/proc/stat, pressure the share of time in which runnable tasks waited for
+a cpu during the last 10 s ('some avg10' of /proc/pressure/cpu, needs a
+kernel with PSI). Both are in percent and are evaluated like temperatures,
+so the fan slows down again under the hysteresis of the profile.
+"""
+
+from tpfancod import sensors
+
+STAT = '/proc/stat'
+PRESSURE = '/proc/pressure/cpu'
+# load input -> file it is read from
+PATHS = {'utilization': STAT, 'pressure': PRESSURE}
+
+
+def parse_stat(content):
+    """returns (busy, total) jiffies of all cpus from the content of /proc/stat"""
+    fields = content.split('\n', 1)[0].split()
+    if not fields or fields[0] != 'cpu':
+        raise ValueError('No cpu line in ' + STAT)
+    # user nice system idle iowait irq softirq steal, guest time is already
+    # counted in user and nice
+    values = [int(value) for value in fields[1:9]]
+    total = sum(values)
+    return total - values[3] - values[4], total
+
+
+def parse_pressure(content):
+    """returns the 'some avg10' value of /proc/pressure/cpu in percent"""
+    for line in content.splitlines():
+        fields = line.split()
+        if fields and fields[0] == 'some':
+            for field in fields[1:]:
+                key, value = field.split('=', 1)
+                if key == 'avg10':
+                    return float(value)
+    raise ValueError('No some avg10 in ' + PRESSURE)
+
+
+class LoadMonitor(object):
+
+    """load inputs of the loaded profile together with their hysteresis state
+
+    The inputs are Sensor objects whose readings are the load in percent."""
+
+    def __init__(self, trigger_tables, handles, previous=None):
+        self.inputs = []
+        for name, table in sorted(trigger_tables.iteritems()):
+            path = PATHS[name]
+            self.inputs.append(sensors.Sensor(name, sensors.LOAD, path, handles.get(path),
+                                              None, 1.0, table))
+        # (busy, total) jiffies of the previous read of /proc/stat
+        self.last_stat = None
+        self.reads = 0
+        self.errors = 0
+
+        # keep the hysteresis state of inputs that are still present
+        if previous is not None:
+            self.last_stat = previous.last_stat
+            self.reads = previous.reads
+            self.errors = previous.errors
+            old = dict((sensor.sensor_id, sensor) for sensor in previous.inputs)
+            for sensor in self.inputs:
+                if sensor.sensor_id in old:
+                    sensor.temp = old[sensor.sensor_id].temp
+                    sensor.trip_temp = old[sensor.sensor_id].trip_temp
+                    sensor.trip_speed = old[sensor.sensor_id].trip_speed
+
+    def read(self):
+        """reads the load inputs, returns a dict with the load in percent
+
+        inputs that can not be read are left out, so is the utilization on
+        the first read because it needs two samples"""
+        return self.apply(self.sample())
+
+    def sample(self):
+        """reads the load inputs, returns a dict name -> (busy, total) jiffies or pressure
+
+        Only reads the files and changes nothing, so it can run on a worker
+        thread. Inputs that can not be read map to None."""
+        samples = {}
+        for sensor in self.inputs:
+            try:
+                content = sensor.handle.read()
+                if sensor.sensor_id == 'utilization':
+                    samples[sensor.sensor_id] = parse_stat(content)
+                else:
+                    samples[sensor.sensor_id] = parse_pressure(content)
+            except (IOError, ValueError):
+                # e.g. a kernel without PSI
+                samples[sensor.sensor_id] = None
+        return samples
+
+    def apply(self, samples):
+        """takes over the samples of sample(), returns a dict with the load in percent"""
+        res = {}
+        for sensor in self.inputs:
+            if sensor.sensor_id not in samples:
+                # added by a profile change after the sample was taken
+                continue
+            self.reads += 1
+            value = samples[sensor.sensor_id]
+            if value is None:
+                self.errors += 1
+                sensor.temp = None
+            elif sensor.sensor_id == 'utilization':
+                sensor.temp = self.get_utilization(value)
+            else:
+                sensor.temp = int(round(value))
+            if sensor.temp is not None:
+                res[sensor.sensor_id] = sensor.temp
+        return res
+
+    def get_utilization(self, stat):
+        """returns the busy share in percent since the previous sample, None without one"""
+        last = self.last_stat
+        self.last_stat = stat
+        if last is None or stat[1] <= last[1]:
+            return None
+        return int(round(100.0 * (stat[0] - last[0]) / (stat[1] - last[1])))
+
+    def evaluate(self):
+        """returns the highest fan speed required by the last readings"""
+        new_speed = 0
+        for sensor in self.inputs:
+            if sensor.temp is None:
+                continue
+            speed = sensor.evaluate(sensor.temp)
+            if speed > new_speed:
+                new_speed = speed
+        return new_speed
+
+    def reset_trips(self):
+        for sensor in self.inputs:
+            sensor.reset_trip()
+
+    def get_trip_fan_speeds(self):
+        return dict((sensor.sensor_id, sensor.trip_speed)
+                    for sensor in self.inputs if sensor.trip_speed is not None)
@@ -0,0 +1,119 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import stat
+import tempfile
+
+
+def write_atomically(path, content):
+    """replaces path with content, after a crash the file is either old or new but never truncated"""
+    directory = os.path.dirname(path) or '.'
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = 0644
+    fd, tmp_path = tempfile.mkstemp(
+        prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # make the rename itself durable
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class WriteBehind(object):
+
+    """calls write after changes stopped coming in for delay msecs
+
+    A steady stream of changes is written at least every max_delay msecs."""
+
+    def __init__(self, main_clock, write, delay, max_delay):
+        self.clock = main_clock
+        # returns True if everything was written
+        self.write = write
+        self.delay = delay
+        self.max_delay = max_delay
+        self.source = None
+        self.pending = False
+        # clock.monotonic() of the first change that is not written yet
+        self.first_change = None
+        self.flushes = 0
+        # clock.time() of the last successful write, 0 if there was none
+        self.last_flush = 0.0
+        self.last_error = ''
+
+    def schedule(self):
+        """notes a change, restarting the debounce window"""
+        now = self.clock.monotonic()
+        if not self.pending:
+            self.pending = True
+            self.first_change = now
+        if self.source is not None:
+            self.clock.source_remove(self.source)
+        waited = (now - self.first_change) * 1000
+        delay = max(0, min(self.delay, self.max_delay - waited))
+        self.source = self.clock.timeout_add(int(delay), self.on_timeout)
+
+    def on_timeout(self):
+        self.source = None
+        if not self.flush() and self.pending:
+            # try again after the next debounce window
+            self.first_change = self.clock.monotonic()
+            self.source = self.clock.timeout_add(self.delay, self.on_timeout)
+        return False
+
+    def flush(self, force=False):
+        """writes pending changes now, with force also if nothing is pending
+
+        returns False if the write failed, the changes stay pending then"""
+        if self.source is not None:
+            self.clock.source_remove(self.source)
+            self.source = None
+        if not (self.pending or force):
+            return True
+        self.pending = False
+        if not self.write():
+            self.pending = True
+            self.last_error = 'Unable to write the configuration or profile'
+            return False
+        self.flushes += 1
+        self.last_flush = self.clock.time()
+        self.last_error = ''
+        return True
+
+    def get_state(self):
+        """returns (pending, time of the last write, number of writes, last error)"""
+        return (self.pending, self.last_flush, self.flushes, self.last_error)
@@ -0,0 +1,104 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""power source of the machine
+
+The source is 'docked' while a dock reports docked=1, 'ac' while an
+external supply (Mains or USB power delivery) is online and 'battery'
+otherwise. Machines without external supplies, e.g. desktops, count as
+'ac'. It is read again on power_supply and dock uevents.
+"""
+
+import glob
+import logging
+import os
+
+from tpfancod.hwmon import read_attribute
+
+AC = 'ac'
+BATTERY = 'battery'
+DOCKED = 'docked'
+SOURCES = [AC, BATTERY, DOCKED]
+# types of the supplies that power the machine from outside
+EXTERNAL_TYPES = ('Mains', 'USB')
+
+
+class PowerMonitor(object):
+
+    """current power source, updated on uevents"""
+
+    def __init__(self, supply_root='/sys/class/power_supply', dock_root='/sys/devices/platform'):
+        self.logger = logging.getLogger(__name__)
+        self.supply_root = supply_root
+        self.dock_root = dock_root
+        # called with the new source after every change
+        self.listeners = []
+        self.watching = False
+        self.source = self.read_source()
+
+    def is_docked(self):
+        return any(read_attribute(os.path.join(dock, 'docked')) == '1'
+                   for dock in glob.glob(os.path.join(self.dock_root, 'dock.*')))
+
+    def read_source(self):
+        """returns the power source according to sysfs"""
+        if self.is_docked():
+            return DOCKED
+        external = False
+        for supply in sorted(glob.glob(os.path.join(self.supply_root, '*'))):
+            if read_attribute(os.path.join(supply, 'type')) not in EXTERNAL_TYPES:
+                continue
+            external = True
+            if read_attribute(os.path.join(supply, 'online')) == '1':
+                return AC
+        if external:
+            return BATTERY
+        return AC
+
+    def update(self):
+        """reads the power source again and tells the listeners if it changed"""
+        source = self.read_source()
+        if source == self.source:
+            return
+        self.logger.debug('Power source changed from ' + self.source + ' to ' + source)
+        self.source = source
+        for listener in list(self.listeners):
+            listener(source)
+
+    def watch(self, listener):
+        """reads the power source on power_supply and dock uevents and calls listener on changes"""
+        # uevent needs the glib main loop, the monitor itself does not
+        from tpfancod import uevent
+
+        self.listeners.append(listener)
+        if not self.watching:
+            self.watching = True
+            if not uevent.monitor.subscribe('power_supply', self.on_uevent):
+                self.logger.debug(
+                    'No uevents, the power source is only read at startup')
+            uevent.monitor.subscribe('platform', self.on_uevent)
+
+    def on_uevent(self, properties):
+        if properties.get('SUBSYSTEM') == 'platform' and \
+                not os.path.basename(properties.get('DEVPATH', '')).startswith('dock.'):
+            return
+        self.update()
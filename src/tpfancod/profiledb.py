@@ -0,0 +1,205 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""compiled database of the community profiles
+
+The database is a single file that is mapped into memory:
+
+    header   magic, fingerprint of the profile files, number of buckets,
+             offset of the first record
+    buckets  (crc32 of key, offset of index entry) per bucket, open addressing
+    entries  length + marshal of (key, [(record offset relative to the
+             first record, name of the profile file)])
+    records  length + marshal of the dict returned by Settings.read_profile
+
+Keys are 'id:' + product_id (the lowercased name of the profile file), 'name:' +
+vendor_version of the model and 'prefix:' + every shorter word prefix of
+vendor_version, e.g. 'prefix:lenovo_thinkpad'. Looking up a key costs one
+crc32 and usually one bucket, records are unmarshalled without parsing
+any text.
+
+The database is rebuilt when the fingerprint changes, i.e. when profiles
+are added, removed, replaced or edited in place.
+"""
+
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import zlib
+
+from tpfancod import persist
+
+MAGIC = 'TPFANDB3'
+HEADER = struct.Struct('<8s16sII')
+BUCKET = struct.Struct('<II')
+LENGTH = struct.Struct('<I')
+
+# kinds of matches from best to worst
+ID_MATCH = 'id'
+NAME_MATCH = 'name'
+PREFIX_MATCH = 'prefix'
+
+
+def model_name(vendor, version):
+    """returns the vendor_version name of a model as used for profile lookups"""
+    return (vendor.lower() + '_' + version.lower()).replace('/', '-').replace(' ', '_')
+
+
+def prefixes(name):
+    """returns the word prefixes of name that are shorter than name, longest first"""
+    words = name.split('_')
+    return ['_'.join(words[:count]) for count in range(len(words) - 1, 0, -1)]
+
+
+def key_hash(key):
+    return zlib.crc32(key) & 0xffffffff
+
+
+def list_profiles(profile_dir):
+    """returns the names of the profile files in profile_dir, sorted"""
+    return [name for name in sorted(os.listdir(profile_dir))
+            if not name.startswith('.') and os.path.isfile(os.path.join(profile_dir, name))]
+
+
+def fingerprint(profile_dir):
+    """returns a digest of the names, sizes and mtimes of the profile files in profile_dir"""
+    digest = hashlib.md5()
+    for name in list_profiles(profile_dir):
+        st = os.stat(os.path.join(profile_dir, name))
+        digest.update('%s\0%d\0%r\0' % (name, st.st_size, st.st_mtime))
+    return digest.digest()
+
+
+def build(profile_dir, db_path, read_profile):
+    """compiles all profiles in profile_dir into db_path, read_profile parses a single file
+
+    returns the number of profiles in the database"""
+    # taken before reading, a profile edited meanwhile is compiled next time
+    stamp = fingerprint(profile_dir)
+    records = []
+    for name in list_profiles(profile_dir):
+        profile = read_profile(os.path.join(profile_dir, name))
+        if not profile.get('status'):
+            continue
+        records.append((name, profile))
+
+    # key -> (offset of the record relative to the first one, file name)
+    index = {}
+    blobs = []
+    offset = 0
+    for file_name, profile in records:
+        blob = marshal.dumps(profile)
+        # product ids are lowercase, the file name may not be
+        keys = ['id:' + file_name.lower()]
+        if 'product_pretty_vendor' in profile and 'product_pretty_name' in profile:
+            name = model_name(profile['product_pretty_vendor'],
+                              profile['product_pretty_name'])
+            keys.append('name:' + name)
+            keys.extend('prefix:' + prefix for prefix in prefixes(name))
+        for key in keys:
+            index.setdefault(key, []).append((offset, file_name))
+        blobs.append(LENGTH.pack(len(blob)) + blob)
+        offset += LENGTH.size + len(blob)
+
+    # keep the table at most half full so that probes stay short
+    bucket_count = max(1, 2 * len(index))
+    entries = []
+    entries_size = 0
+    buckets = [(0, 0)] * bucket_count
+    entries_start = HEADER.size + bucket_count * BUCKET.size
+    for key, offsets in sorted(index.iteritems()):
+        entry = marshal.dumps((key, offsets))
+        slot = key_hash(key) % bucket_count
+        while buckets[slot][1] != 0:
+            slot = (slot + 1) % bucket_count
+        buckets[slot] = (key_hash(key), entries_start + entries_size)
+        entries.append(LENGTH.pack(len(entry)) + entry)
+        entries_size += LENGTH.size + len(entry)
+
+    persist.write_atomically(db_path, ''.join(
+        [HEADER.pack(MAGIC, stamp, bucket_count, entries_start + entries_size)] +
+        [BUCKET.pack(*bucket) for bucket in buckets] + entries + blobs))
+    return len(records)
+
+
+class ProfileDatabase(object):
+
+    """read-only view of a database written by build()"""
+
+    def __init__(self, db_path):
+        with open(db_path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            self.close()
+            raise ValueError('Truncated profile database ' + db_path)
+        magic, self.fingerprint, self.bucket_count, self.records_start = HEADER.unpack_from(
+            self.data)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('Not a profile database: ' + db_path)
+
+    def close(self):
+        self.data.close()
+
+    def read_blob(self, offset):
+        length = LENGTH.unpack_from(self.data, offset)[0]
+        start = offset + LENGTH.size
+        return marshal.loads(self.data[start:start + length])
+
+    def probe(self, key):
+        """returns (record, file name) of the profiles stored for key"""
+        crc = key_hash(key)
+        slot = crc % self.bucket_count
+        for _ in range(self.bucket_count):
+            bucket_crc, offset = BUCKET.unpack_from(
+                self.data, HEADER.size + slot * BUCKET.size)
+            if offset == 0:
+                return []
+            if bucket_crc == crc:
+                entry_key, records = self.read_blob(offset)
+                if entry_key == key:
+                    return records
+            slot = (slot + 1) % self.bucket_count
+        return []
+
+    def load(self, record):
+        """returns the profile stored at record, as returned by Settings.read_profile"""
+        return self.read_blob(self.records_start + record)
+
+    def lookup(self, product_id, product_name):
+        """returns (kind of match, record, file name) for all matching profiles, best match first"""
+        res = [(ID_MATCH, entry) for entry in self.probe('id:' + product_id.lower())]
+        if product_name:
+            res.extend((NAME_MATCH, entry)
+                       for entry in self.probe('name:' + product_name))
+            for prefix in [product_name] + prefixes(product_name):
+                res.extend((PREFIX_MATCH, entry)
+                           for entry in self.probe('prefix:' + prefix))
+        # the same profile can match in several ways, keep the best one
+        seen = set()
+        ranked = []
+        for kind, (record, file_name) in res:
+            if record not in seen:
+                seen.add(record)
+                ranked.append((kind, record, file_name))
+        return ranked
@@ -0,0 +1,202 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""sampling profiler and allocation tracer for the running daemon
+
+Python 2.7 has neither a sampling profiler nor tracemalloc, so the
+profiler samples the python stack from a SIGPROF interval timer, i.e.
+every interval secs of cpu time, and the allocation tracer compares the
+number of gc tracked objects per type at the start and at the end of the
+window. Python runs signal handlers between bytecodes, so cpu time spent
+in C code is attributed to the next python line that runs.
+"""
+
+import gc
+import logging
+import os
+import resource
+import signal
+import time
+
+# frames of a sample beyond this depth are dropped
+MAX_DEPTH = 32
+
+# number of lines in every section of the report
+REPORT_LINES = 30
+
+
+def count_objects():
+    """returns type name -> number of gc tracked objects"""
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def format_frame(code_key):
+    filename, lineno, function = code_key
+    return '%s:%d(%s)' % (filename, lineno, function)
+
+
+class Profiler(object):
+
+    """samples the stack and counts objects for a bounded window"""
+
+    # secs of cpu time between two samples
+    interval = 0.005
+    # longest window in secs, the timer is never left running
+    max_duration = 600
+    # reports are written to tmpfs, they are only useful until reboot
+    output_dir = '/run/tpfancod'
+
+    def __init__(self, main_clock, output_dir=None):
+        self.logger = logging.getLogger(__name__)
+        self.clock = main_clock
+        if output_dir is not None:
+            self.output_dir = output_dir
+        self.running = False
+        self.source = None
+        self.started = 0.0
+        self.duration = 0
+        self.last_report = ''
+        self.reset()
+
+    def reset(self):
+        # stack of (filename, line, function), innermost first -> samples
+        self.stacks = {}
+        self.samples = 0
+        self.objects = {}
+        self.cpu_start = 0.0
+
+    def start(self, duration):
+        """starts sampling for duration secs, returns False if already running"""
+        if self.running:
+            return False
+        self.reset()
+        self.duration = max(1, min(int(duration), self.max_duration))
+        self.objects = count_objects()
+        self.cpu_start = time.clock()
+        self.started = self.clock.monotonic()
+        signal.signal(signal.SIGPROF, self.on_sample)
+        # let interrupted reads and writes of sysfs files restart
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+        self.source = self.clock.timeout_add(self.duration * 1000, self.on_timeout)
+        self.logger.debug('Profiling for ' + str(self.duration) + ' s')
+        return True
+
+    def stop(self):
+        """stops sampling and writes the report, returns its path or '' if not running"""
+        if not self.running:
+            return ''
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        self.running = False
+        if self.source is not None:
+            self.clock.source_remove(self.source)
+            self.source = None
+        try:
+            self.last_report = self.write_report()
+            self.logger.debug('Wrote profile to ' + self.last_report)
+        except EnvironmentError, e:
+            self.logger.error('Unable to write the profile: ' + str(e))
+            self.last_report = ''
+        self.reset()
+        return self.last_report
+
+    def toggle(self, duration=60):
+        """starts a window if none is running, otherwise ends it early"""
+        if self.running:
+            self.stop()
+        else:
+            self.start(duration)
+
+    def on_timeout(self):
+        self.source = None
+        self.stop()
+        return False
+
+    def on_sample(self, signum, frame):
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_filename, frame.f_lineno, code.co_name))
+            frame = frame.f_back
+        if not stack:
+            return
+        stack = tuple(stack)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def get_state(self):
+        """returns (running, secs left in the window, path of the last report)"""
+        left = 0.0
+        if self.running:
+            left = max(0.0, self.duration - (self.clock.monotonic() - self.started))
+        return (self.running, left, self.last_report)
+
+    def get_report(self):
+        """returns the report of the running window as a list of lines"""
+        own = {}
+        inclusive = {}
+        for stack, count in self.stacks.iteritems():
+            own[stack[0]] = own.get(stack[0], 0) + count
+            # recursive functions count once per sample
+            for frame in set(stack):
+                inclusive[frame] = inclusive.get(frame, 0) + count
+
+        lines = ['tpfancod profile, %d s window, %d samples every %.1f ms of cpu time, %.3f s cpu'
+                 % (self.duration, self.samples, self.interval * 1000,
+                    time.clock() - self.cpu_start),
+                 'max rss: %d kB' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                 '']
+        for title, counts in [('own samples', own), ('inclusive samples', inclusive)]:
+            lines.append('lines by ' + title + ':')
+            for code_key, count in sorted(counts.iteritems(), key=lambda item: -item[1])[:REPORT_LINES]:
+                lines.append('%8d  %s' % (count, format_frame(code_key)))
+            lines.append('')
+        lines.append('hottest stacks:')
+        for stack, count in sorted(self.stacks.iteritems(), key=lambda item: -item[1])[:REPORT_LINES]:
+            lines.append('%8d  %s' % (count, ' <- '.join(format_frame(code_key) for code_key in stack)))
+        lines.append('')
+
+        objects = count_objects()
+        growth = [(objects.get(name, 0) - self.objects.get(name, 0), name)
+                  for name in set(objects) | set(self.objects)]
+        lines.append('gc tracked objects by type, change during the window:')
+        for delta, name in sorted(growth, key=lambda item: -abs(item[0]))[:REPORT_LINES]:
+            if delta:
+                lines.append('%+8d  %8d  %s' % (delta, objects.get(name, 0), name))
+        lines.append('gc generation counts: ' + str(gc.get_count()) +
+                     ', uncollectable: ' + str(len(gc.garbage)))
+        return lines
+
+    def write_report(self):
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        path = os.path.join(self.output_dir, time.strftime(
+            'profile-%Y%m%d-%H%M%S.txt', time.localtime(self.clock.time())))
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.get_report()) + '\n')
+        return path
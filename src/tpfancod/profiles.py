@@ -0,0 +1,44 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+class ResidentProfile(object):
+
+    """a profile that was parsed, verified and compiled once and is kept in memory
+
+    The profile is a snapshot of the Settings attributes that make it up,
+    switching profiles only swaps these attributes, see Settings.switch_profile."""
+
+    def __init__(self, name):
+        self.name = name
+        # attribute -> value
+        self.values = {}
+
+    def capture(self, settings, attributes):
+        """takes the given attributes from settings"""
+        self.values = dict((attribute, getattr(settings, attribute))
+                           for attribute in attributes)
+
+    def restore(self, settings):
+        """makes this profile the one of settings"""
+        for attribute, value in self.values.iteritems():
+            setattr(settings, attribute, value)
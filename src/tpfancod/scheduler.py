@@ -0,0 +1,78 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+class AdaptiveScheduler(object):
+
+    """chooses the time until the next poll from the temperature trend"""
+
+    # factor by which the interval may grow per poll when nothing happens
+    growth = 1.5
+
+    def __init__(self, poll_time):
+        # current poll interval in msecs
+        self.interval = poll_time
+        self.last_time = None
+        self.last_temps = {}
+
+    def reset(self, poll_time):
+        """forgets the temperature history, e.g. after a profile change"""
+        self.__init__(poll_time)
+
+    def get_slope(self, now, temps):
+        """returns the fastest temperature rise in K/s since the last poll"""
+        slope = 0.0
+        if self.last_time is not None and now > self.last_time:
+            elapsed = now - self.last_time
+            for sensor, temp in temps.iteritems():
+                if sensor in self.last_temps:
+                    slope = max(
+                        slope, (temp - self.last_temps[sensor]) / elapsed)
+        self.last_time = now
+        self.last_temps = dict(temps)
+        return slope
+
+    def next_interval(self, now, temps, headroom, poll_time, min_time, max_time, aggressiveness):
+        """returns the next poll interval in msecs
+
+        headroom is the distance in K between the current temperatures and
+        the nearest trigger or hysteresis release temperature, None if
+        no trigger can be reached"""
+        slope = self.get_slope(now, temps)
+        if aggressiveness == 0:
+            self.interval = poll_time
+            return self.interval
+
+        target = max_time
+        if headroom is not None:
+            if headroom <= aggressiveness / 2.0:
+                # sitting right at a trigger point
+                target = min_time
+            elif slope > 0:
+                # poll a few times before the next trigger is reached
+                eta = headroom / slope * 1000
+                target = min(target, eta / (1 + aggressiveness / 2.0))
+
+        # shorten immediately, but lengthen only gradually
+        if target > self.interval:
+            target = min(target, self.interval * self.growth)
+        self.interval = int(max(min_time, min(max_time, target)))
+        return self.interval
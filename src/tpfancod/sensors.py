@@ -0,0 +1,233 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# sensor sources
+IBM_THERMAL = 0
+HWMON = 1
+# cpu load in percent, see load.py
+LOAD = 2
+
+
+class Sensor(object):
+
+    """temperature sensor of the loaded profile together with its hysteresis state"""
+
+    __slots__ = ('sensor_id', 'source', 'path', 'handle', 'index', 'scaling', 'table',
+                 'interval', 'next_read', 'disconnected', 'temp', 'trip_temp', 'trip_speed')
+
+    def __init__(self, sensor_id, source, path, handle, index, scaling, table, interval=None):
+        self.sensor_id = sensor_id
+        self.source = source
+        # file the sensor is read from, sensor_id may be a stable hwmon key
+        self.path = path
+        self.handle = handle
+        # position of the sensor in /proc/acpi/ibm/thermal
+        self.index = index
+        self.scaling = scaling
+        self.table = table
+        # msecs between two reads, None to read on every poll
+        self.interval = interval
+        # time of the poll that reads the sensor next, None if due now
+        self.next_read = None
+        # ibm_thermal reports +/-128 or 0 if the sensor is disconnected
+        if source == IBM_THERMAL:
+            self.disconnected = (0, 128, -128)
+        else:
+            self.disconnected = ()
+        # last reading
+        self.temp = None
+        # value that temperature has to fall below to slow down fan
+        self.trip_temp = None
+        # current fan speed required by this sensor
+        self.trip_speed = None
+
+    def is_due(self, now):
+        """returns True if the sensor has to be read at now, None reads every sensor"""
+        return now is None or self.next_read is None or now >= self.next_read
+
+    def mark_read(self, now):
+        if now is not None and self.interval is not None:
+            self.next_read = now + self.interval / 1000.0
+
+    def reset_trip(self):
+        self.trip_temp = None
+        self.trip_speed = None
+
+    def evaluate(self, temp):
+        """returns the fan speed required by temp, taking the hysteresis into account"""
+        speed = 0
+        # check if temperature is above hysteresis shutdown point
+        if self.trip_speed is not None:
+            if temp >= self.trip_temp:
+                speed = self.trip_speed
+            else:
+                self.trip_temp = None
+                self.trip_speed = None
+        # check if temperature is over trigger point
+        trip = self.table.lookup(temp)
+        if trip is not None and speed < trip[0]:
+            speed, self.trip_temp = trip
+            self.trip_speed = speed
+        return speed
+
+
+class SensorRegistry(object):
+
+    """all sensors of the loaded profile, built once per profile load"""
+
+    def __init__(self, trigger_tables, sensor_scalings, ibm_thermal, handles, previous=None, paths={},
+                 intervals={}):
+        """paths maps hwmon sensor ids that are not paths themselves to the files to read,
+        intervals maps sensor ids to the msecs between two reads"""
+        self.ibm_thermal = handles.get(ibm_thermal)
+        self.ibm_sensors = []
+        self.hwmon_sensors = []
+        for sensor_id, table in trigger_tables.iteritems():
+            # ibm_thermal sensors are numbered, hwmon sensors are paths
+            if sensor_id.isdigit():
+                sensor = Sensor(sensor_id, IBM_THERMAL, ibm_thermal,
+                                self.ibm_thermal, int(sensor_id), 1.0, table,
+                                intervals.get(sensor_id))
+                self.ibm_sensors.append(sensor)
+            else:
+                path = paths.get(sensor_id, sensor_id)
+                sensor = Sensor(sensor_id, HWMON, path, handles.get(path),
+                                None, float(sensor_scalings[sensor_id]), table,
+                                intervals.get(sensor_id))
+                self.hwmon_sensors.append(sensor)
+        self.ibm_sensors.sort(key=lambda sensor: sensor.index)
+        self.hwmon_sensors.sort(key=lambda sensor: sensor.sensor_id)
+        self.sensors = self.ibm_sensors + self.hwmon_sensors
+
+        # files read and reads saved by the sensor intervals
+        self.reads = 0
+        self.skipped_reads = 0
+
+        # keep the hysteresis state of sensors that are still present
+        if previous is not None:
+            self.reads = previous.reads
+            self.skipped_reads = previous.skipped_reads
+            old = dict((sensor.sensor_id, sensor)
+                       for sensor in previous.sensors)
+            for sensor in self.sensors:
+                if sensor.sensor_id in old:
+                    # a read that is in flight while the profile changes
+                    # is evaluated with the new registry
+                    sensor.temp = old[sensor.sensor_id].temp
+                    sensor.trip_temp = old[sensor.sensor_id].trip_temp
+                    sensor.trip_speed = old[sensor.sensor_id].trip_speed
+                    if sensor.interval == old[sensor.sensor_id].interval:
+                        sensor.next_read = old[sensor.sensor_id].next_read
+
+    def read(self, now=None):
+        """reads the sensors that are due at now, returns a dict with the temperatures in degree Celsius
+
+        sensors that are not due yet keep their last reading, without now
+        all sensors are read. A failed read of /proc/acpi/ibm/thermal only
+        drops the ibm_thermal sensors, a failed hwmon read raises IOError"""
+        return self.apply(self.sample(now), now)
+
+    def sample(self, now=None):
+        """reads the sensors that are due at now, returns a dict sensor_id -> temperature
+
+        Only reads the files and changes nothing, so it can run on a worker
+        thread while the main loop uses the registry. The readings are taken
+        over by apply(). Sensors that are not due are left out."""
+        readings = {}
+        self.sample_ibm_thermal(readings, now)
+        self.sample_hwmon(readings, now)
+        return readings
+
+    def sample_ibm_thermal(self, readings, now=None):
+        """reads the ibm_thermal sensors into readings, None for sensors missing from the file"""
+        # all ibm_thermal sensors are in the same file, so a single due
+        # sensor updates all of them
+        if not any(sensor.is_due(now) for sensor in self.ibm_sensors):
+            return
+        try:
+            elements = self.ibm_thermal.read().split('\n', 1)[0].split()[1:]
+        except IOError:
+            # sometimes read fails during suspend/resume
+            elements = []
+        count = len(elements)
+        for sensor in self.ibm_sensors:
+            if sensor.index < count:
+                readings[sensor.sensor_id] = int(elements[sensor.index])
+            else:
+                readings[sensor.sensor_id] = None
+
+    def sample_hwmon(self, readings, now=None):
+        """reads the hwmon sensors into readings"""
+        for sensor in self.hwmon_sensors:
+            if sensor.is_due(now):
+                # need to convert the value of the sensor to degree Celsius
+                readings[sensor.sensor_id] = int(
+                    round(float(sensor.handle.read().strip()) * sensor.scaling))
+
+    def apply(self, readings, now=None):
+        """takes over the readings that sample() took at now, returns a dict with the temperatures of all sensors
+
+        sensors without a reading keep their last one. Readings taken
+        before the profile changed are matched by sensor_id."""
+        res = {}
+        if self.ibm_sensors:
+            if any(sensor.sensor_id in readings for sensor in self.ibm_sensors):
+                self.reads += 1
+            else:
+                self.skipped_reads += 1
+        for sensor in self.sensors:
+            if sensor.sensor_id in readings:
+                if sensor.source == HWMON:
+                    self.reads += 1
+                sensor.temp = readings[sensor.sensor_id]
+                if sensor.temp is None:
+                    sensor.next_read = None
+                else:
+                    sensor.mark_read(now)
+            elif sensor.source == HWMON:
+                self.skipped_reads += 1
+            if sensor.temp is not None:
+                res[sensor.sensor_id] = sensor.temp
+        return res
+
+    def evaluate(self):
+        """returns the highest fan speed required by the last readings"""
+        new_speed = 0
+        for sensor in self.sensors:
+            temp = sensor.temp
+            if temp is None or temp in sensor.disconnected:
+                continue
+            speed = sensor.evaluate(temp)
+            if speed > new_speed:
+                new_speed = speed
+        return new_speed
+
+    def reset_trips(self):
+        for sensor in self.sensors:
+            sensor.reset_trip()
+
+    def get_trip_temperatures(self):
+        return dict((sensor.sensor_id, sensor.trip_temp)
+                    for sensor in self.sensors if sensor.trip_speed is not None)
+
+    def get_trip_fan_speeds(self):
+        return dict((sensor.sensor_id, sensor.trip_speed)
+                    for sensor in self.sensors if sensor.trip_speed is not None)
@@ -25,6 +25,8 @@ import logging
 import os.path
 import dbus.service
 
+from tpfancod import clock, hardware, hwmon, load, persist, power, profiledb, profiles, sensors, startup, throttle, triggers
+
 
 class ProfileNotOverriddenException(dbus.DBusException):
     _dbus_error_name = 'org.thinkpad.fancontrol.ProfileNotOverriddenException'
@@ -33,7 +35,26 @@ class ProfileNotOverriddenException(dbus.DBusException):
 class Settings(dbus.service.Object):
 
     max_temp = 100
-    option_limits = {'hysteresis': [0, 10]}
+    option_limits = {'hysteresis': [0, 10],
+                     'poll_min_time': [100, 5000],
+                     'poll_max_time': [100, 120000],
+                     'poll_aggressiveness': [0, 10],
+                     'event_driven': [0, 1],
+                     'signal_threshold': [0, 20],
+                     'signal_interval': [0, 60000],
+                     'performance_mode': [0, 1],
+                     'throttle_relax_time': [1000, 600000]}
+    # options from the [Options] section of a profile, all of them integers
+    profile_options = ['hysteresis', 'poll_min_time',
+                       'poll_max_time', 'poll_aggressiveness', 'event_driven',
+                       'signal_threshold', 'signal_interval', 'performance_mode',
+                       'throttle_relax_time']
+    # config options naming the profile used on each power source
+    power_profile_options = [source + '_profile' for source in power.SOURCES]
+    # Settings attributes that make up a profile, see profiles.py
+    resident_attributes = ['profile_comment', 'trigger_points', 'sensor_names',
+                           'sensor_scalings', 'sensor_intervals', 'load_triggers', 'trigger_tables',
+                           'load_tables', 'compiled_profile'] + profile_options
     profile_path = ''
 
     """profile and config settings"""
@@ -42,13 +63,85 @@ class Settings(dbus.service.Object):
     enabled = False
     override_profile = False
     current_profile = ''
+    # power source -> profile used while the machine runs from it
+    power_profiles = {}
 
     # profile / user overrideable options
     sensor_names = {}
     trigger_points = {}
     sensor_scalings = {}
+    # msecs between two reads of a sensor, sensors without one are read on
+    # every poll
+    sensor_intervals = {}
+    sensor_interval_limits = [100, 600000]
+    # load input -> {load in percent: fan level}, see load.py
+    load_triggers = {}
     hysteresis = 2
+    # bounds of the adaptive poll interval in msecs, the upper bound is
+    # further limited by the watchdog time
+    poll_min_time = 1000
+    poll_max_time = 4000
+    # how quickly polling speeds up near triggers, 0 means fixed poll_time
+    poll_aggressiveness = 5
+    # program the next thresholds into hwmon alarms and thermal zone trip
+    # points and wake up on crossings instead of relying on polling alone
+    event_driven = 0
+    # change of a temperature in K that makes Control emit
+    # temperatures_changed and the minimal time in msecs between two
+    # signals of the same kind
+    signal_threshold = 1
+    signal_interval = 1000
+    # escalate the fan whenever the cpu throttles and relax it after
+    # throttle_relax_time msecs without throttling, see throttle.py
+    performance_mode = 0
+    throttle_relax_time = 30000
+    # trigger points compiled into step tables, see compile_trigger_points
+    trigger_tables = {}
+    load_tables = {}
+    compiled_profile = None
+    # profile name -> ResidentProfile of all profiles kept in memory, empty
+    # if only current_profile is used
+    resident_profiles = {}
+    # name of the profile in effect
+    active_profile = ''
+    # profile chosen with select_profile, '' to follow the power source
+    selected_profile = ''
+    # power source of the machine, see power.py
+    power_monitor = None
+    # sensors of the loaded profile, see build_sensor_registry
+    sensor_registry = None
+    # load inputs of the loaded profile, built together with the registry
+    load_monitor = None
+    # used for a new standard profile if the hwmon index knows no cpu sensor
     trial_sensor = '/sys/devices/virtual/hwmon/hwmon0/temp1_input'
+    # temperature inputs by stable keys, see hwmon.py
+    hwmon_index = None
+    # directory with the cpus and their throttle counters
+    cpu_path = '/sys/devices/system/cpu'
+    # cpu throttle counters, see throttle.py
+    throttle_counters = None
+    # hwmon sensor id -> file of the loaded profile, see resolve_sensor
+    sensor_paths = {}
+    # directory with the hardware product info
+    dmi_path = '/sys/class/dmi/id'
+    # compiled community profiles, see profiledb.py
+    profile_db_path = '/var/cache/tpfancod/profiles.db'
+    # (kind of match, path) of all community profiles that match this
+    # system, best match first
+    profile_candidates = []
+    # msecs between two checks whether config or profile were changed on disk
+    file_check_interval = 5000
+    # path -> mtime of the watched files after the last load or save
+    file_mtimes = {}
+    # changes are saved once no further change came in for save_delay msecs,
+    # but at most save_max_delay msecs after the first one
+    save_delay = 2000
+    save_max_delay = 10000
+    # durations of the startup phases, see startup.py
+    startup_phases = None
+    # True until the constructor returns, a stale profile database is not
+    # rebuilt before the first poll then
+    starting = False
 
     # hardware product info
     product_name = None
@@ -60,7 +153,7 @@ class Settings(dbus.service.Object):
     # comments for the last loaded profile
     profile_comment = ''
 
-    def __init__(self, bus, path, debug, quiet, no_ibm_thermal, version, config_path, current_profile, ibm_fan, ibm_thermal, supplied_profile_dir, poll_time, watchdog_time):
+    def __init__(self, bus, path, debug, quiet, no_ibm_thermal, version, config_path, current_profile, ibm_fan, ibm_thermal, supplied_profile_dir, poll_time, watchdog_time, backend=None, profile_db_path=None, main_clock=None, phases=None):
 
         self.logger = logging.getLogger(__name__)
         if not (bus is 'Dummy'):
@@ -76,6 +169,18 @@ class Settings(dbus.service.Object):
             self.poll_time = poll_time
             self.watchdog_time = watchdog_time
             self.id_match = False
+            # access to the sensor and fan files, see hardware.py
+            if backend is None:
+                backend = hardware.SysfsBackend()
+            self.backend = backend
+            if profile_db_path is not None:
+                self.profile_db_path = profile_db_path
+            # main loop that runs deferred saves and file checks, see clock.py
+            if main_clock is None:
+                main_clock = clock.GlibClock()
+            self.clock = main_clock
+            self.persistence = persist.WriteBehind(self.clock, self.write_files,
+                                                   self.save_delay, self.save_max_delay)
 
             self.profile_path = os.path.split(
                 config_path)[0] + '/' + self.current_profile
@@ -87,8 +192,27 @@ class Settings(dbus.service.Object):
             else:
                 self.logger.setLevel(logging.ERROR)
 
+            if phases is None:
+                phases = startup.StartupPhases()
+            self.startup_phases = phases
+            self.starting = True
+            phases.begin('model_info')
             self.read_model_info()
+            phases.begin('hwmon_scan')
+            self.hwmon_index = hwmon.HwmonIndex()
+            phases.begin('cpu_scan')
+            self.throttle_counters = throttle.ThrottleCounters(
+                throttle.find_counters(self.cpu_path), self.backend)
+            phases.begin('power_source')
+            self.power_monitor = power.PowerMonitor()
+            phases.begin('load')
             self.load()
+            phases.end()
+            self.starting = False
+            self.hwmon_index.watch(self.on_hwmon_changed)
+            self.power_monitor.watch(self.on_power_changed)
+            self.clock.timeout_add(
+                self.file_check_interval, self.reload_if_changed)
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a{ss}')
     def get_model_info(self):
@@ -101,8 +225,30 @@ class Settings(dbus.service.Object):
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='as')
     def get_loaded_profiles(self):
-        """returns a list of the given profiles"""
-        return [self.current_profile]
+        """returns the profiles kept in memory"""
+        if not self.resident_profiles:
+            return [self.current_profile]
+        return sorted(self.resident_profiles)
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='(sss)')
+    def get_active_profile(self):
+        """returns (profile in effect, power source, profile chosen with select_profile or '')"""
+        return (self.active_profile, self.power_monitor.source, self.selected_profile)
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a{ss}')
+    def get_power_profiles(self):
+        """returns the profiles used on the power sources ac, battery and docked"""
+        return self.power_profiles
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='s', out_signature='')
+    def select_profile(self, profile):
+        """makes one of the loaded profiles the active one until it is called with '' to follow the power source again"""
+        profile = str(profile)
+        if profile != '' and profile not in self.resident_profiles:
+            raise SyntaxError(
+                'The profile ' + profile + ' is not loaded')
+        self.selected_profile = profile
+        self.switch_profile(self.get_wanted_profile())
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='s')
     def get_profile_comment(self):
@@ -144,15 +290,14 @@ class Settings(dbus.service.Object):
                 'Looking for sensors that can be used for fan control...')
 
             try:
-                tempfile = open(self.ibm_thermal, 'r')
-                tempfile.readline()
-                tempfile.close()
+                self.backend.read_once(self.ibm_thermal)
             except IOError:
                 ibm_thermal_available = False
+            cpu_sensor = self.hwmon_index.find_cpu_sensor()
+            if cpu_sensor is None:
+                cpu_sensor = self.trial_sensor
             try:
-                tempfile = open(self.trial_sensor, 'r')
-                tempfile.readline()
-                tempfile.close()
+                self.backend.read_once(self.resolve_sensor(cpu_sensor))
             except IOError:
                 hwmon_cpu_sensor_available = False
 
@@ -167,10 +312,10 @@ class Settings(dbus.service.Object):
 
             if not ibm_thermal_available and hwmon_cpu_sensor_available and self.sensor_names == {}:
                 self.logger.debug(
-                    'Found a working hwmon sensor: ' + self.trial_sensor)
-                self.sensor_names[self.trial_sensor] = 'CPU'
-                self.sensor_scalings[self.trial_sensor] = 0.001
-                self.trigger_points[self.trial_sensor] = {0: 255}
+                    'Found a working hwmon sensor: ' + cpu_sensor)
+                self.sensor_names[cpu_sensor] = 'CPU'
+                self.sensor_scalings[cpu_sensor] = 0.001
+                self.trigger_points[cpu_sensor] = {0: 255}
 
             self.write_profile(self.profile_path)
 
@@ -189,6 +334,148 @@ class Settings(dbus.service.Object):
                     'This custom profile will not be used, unless the override_profile option is set to True!')
 
         self.verify_tpfancod_settings()
+        self.load_resident_profiles()
+        self.update_handles()
+        self.build_sensor_registry()
+        self.file_mtimes = self.get_file_mtimes()
+
+    def load_resident_profiles(self):
+        """parses and compiles the profiles of the power sources, the loaded profile stays resident as current_profile
+
+        the profile for the current power source is made the active one"""
+        self.resident_profiles = {}
+        self.active_profile = self.current_profile
+        if not (self.enabled and self.override_profile and self.power_profiles):
+            self.selected_profile = ''
+            return
+        current = profiles.ResidentProfile(self.current_profile)
+        current.capture(self, self.resident_attributes)
+        self.resident_profiles[current.name] = current
+        for name in sorted(set(self.power_profiles.values())):
+            if name in self.resident_profiles:
+                continue
+            self.logger.debug('Loading the profile ' + name)
+            self.load_profile(self.read_profile(self.get_profile_path(name)))
+            self.verify_tpfancod_settings()
+            profile = profiles.ResidentProfile(name)
+            profile.capture(self, self.resident_attributes)
+            self.resident_profiles[name] = profile
+        if self.selected_profile not in self.resident_profiles:
+            self.selected_profile = ''
+        self.active_profile = self.get_wanted_profile()
+        self.resident_profiles[self.active_profile].restore(self)
+
+    def get_wanted_profile(self):
+        """returns the profile that should be in effect"""
+        if self.selected_profile:
+            return self.selected_profile
+        return self.power_profiles.get(self.power_monitor.source, self.current_profile)
+
+    def switch_profile(self, name):
+        """makes the resident profile name the active one without reading or compiling anything"""
+        if name == self.active_profile or name not in self.resident_profiles:
+            return
+        self.logger.debug('Switching from profile ' + self.active_profile + ' to ' + name)
+        # changes that are not saved yet belong to the file of the old profile
+        if self.persistence.pending:
+            self.persistence.flush()
+        self.resident_profiles[self.active_profile].capture(
+            self, self.resident_attributes)
+        self.resident_profiles[name].restore(self)
+        self.active_profile = name
+        # the files of all resident profiles are kept open, only the
+        # hysteresis state moves over to the new sensors
+        self.sensor_paths = self.resolve_sensors()
+        self.build_sensor_registry()
+
+    def on_power_changed(self, source):
+        """switches to the profile of the new power source unless a profile was selected"""
+        self.switch_profile(self.get_wanted_profile())
+
+    def apply_profile(self):
+        """makes changes to the in-memory profile effective without reading any files"""
+        self.compile_trigger_points()
+        self.update_handles()
+        self.build_sensor_registry()
+
+    def get_watched_files(self):
+        """returns the files that load() reads and save() writes"""
+        files = [self.config_path, self.profile_path]
+        if self.override_profile:
+            files.append(self.get_profile_path(self.current_profile))
+        for name in sorted(self.resident_profiles):
+            files.append(self.get_profile_path(name))
+        return files
+
+    def get_file_mtimes(self):
+        mtimes = {}
+        for path in self.get_watched_files():
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def reload_if_changed(self):
+        """reloads config and profile if somebody else changed them on disk, called periodically"""
+        if not self.persistence.pending and self.get_file_mtimes() != self.file_mtimes:
+            self.logger.debug(
+                'Configuration or profile changed on disk, reloading')
+            try:
+                self.load()
+            except SyntaxError, e:
+                self.logger.error('Unable to reload the settings: ' + str(e))
+                self.file_mtimes = self.get_file_mtimes()
+        return True
+
+    def build_sensor_registry(self):
+        """collects the sensors and load inputs of the loaded profile, keeping the current hysteresis state"""
+        self.sensor_registry = sensors.SensorRegistry(self.trigger_tables, self.sensor_scalings,
+                                                      self.ibm_thermal, self.backend,
+                                                      self.sensor_registry, self.sensor_paths,
+                                                      self.sensor_intervals)
+        self.load_monitor = load.LoadMonitor(self.load_tables, self.backend, self.load_monitor)
+
+    def update_handles(self):
+        """keeps the files of the loaded profiles open and closes the ones that are no longer used"""
+        self.sensor_paths = self.resolve_sensors()
+        sensors = [self.ibm_thermal] + self.sensor_paths.values() + \
+            [load.PATHS[name] for name in self.load_triggers] + self.throttle_counters.paths
+        # so that switching to another resident profile opens nothing
+        for name, profile in self.resident_profiles.iteritems():
+            if name != self.active_profile:
+                sensors += self.resolve_sensors(profile.values['trigger_points']).values()
+                sensors += [load.PATHS[load_input] for load_input in profile.values['load_triggers']]
+        sensors = sorted(set(sensors))
+        self.logger.debug('Keeping open: ' + str(sensors + [self.ibm_fan]))
+        self.backend.rebuild(sensors + [self.ibm_fan], [self.ibm_fan])
+
+    def resolve_sensor(self, sensor_id):
+        """returns the file of a hwmon sensor, stable keys are looked up in the hwmon index"""
+        if sensor_id.startswith(hwmon.PREFIX):
+            path = self.hwmon_index.resolve(sensor_id)
+            if path is not None:
+                return path
+        return sensor_id
+
+    def resolve_sensors(self, trigger_points=None):
+        """returns the files of all hwmon sensors of the profile or of the given trigger points"""
+        if trigger_points is None:
+            trigger_points = self.trigger_points
+        return dict((sensor_id, self.resolve_sensor(sensor_id))
+                    for sensor_id in trigger_points if not sensor_id.isdigit())
+
+    def on_hwmon_changed(self):
+        """reopens the sensors of the profile if a hwmon device came or went"""
+        if self.resolve_sensors() != self.sensor_paths:
+            self.logger.debug('hwmon sensors of the profile moved, reopening')
+            self.update_handles()
+            self.build_sensor_registry()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a{ss}')
+    def get_hwmon_sensors(self):
+        """returns the stable keys of all hwmon temperature inputs and the files they refer to"""
+        return self.hwmon_index.keys
 
     def auto_load_profile(self):
         # load the profile
@@ -200,46 +487,140 @@ class Settings(dbus.service.Object):
                 profile_from_db, id_match = self.get_profile_file_list()
                 if id_match:
                     self.id_match = True
-                    self.current_profile = profile_from_db
-                    self.load_profile(self.read_profile(
-                        profile_from_db))
+                    self.current_profile = profile_from_db['file_path']
+                    self.load_profile(profile_from_db)
                 else:
                     self.id_match = False
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='')
     def save(self):
-        """saves configuration and profile to disk"""
-        self.write_config(self.config_path)
-        self.write_profile(self.profile_path)
+        """saves configuration and profile to disk now"""
+        self.persistence.flush(force=True)
+
+    def schedule_save(self):
+        """saves configuration and profile once the changes settle, see persist.WriteBehind"""
+        self.persistence.schedule()
+
+    def flush_pending(self):
+        """saves changes that are not written yet, called on shutdown"""
+        return self.persistence.flush()
+
+    def write_files(self):
+        """writes configuration and profile, returns True on success"""
+        written = self.write_config(self.config_path)
+        profile_path = self.profile_path
+        if self.resident_profiles:
+            profile_path = self.get_profile_path(self.active_profile)
+        written = self.write_profile(profile_path) and written
+        # our own writes must not trigger a reload
+        self.file_mtimes = self.get_file_mtimes()
+        return written
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='(bdis)')
+    def get_save_state(self):
+        """returns (changes pending, time of the last save, number of saves, last error)"""
+        return self.persistence.get_state()
 
     def get_profile_file_list(self):
-        """returns a list of profile files to load for this system"""
-        profile_file = ''
-        id_match = False
-        model_path = self.supplied_profile_dir + self.product_id
-        self.logger.debug('Looking for a profile in ' + model_path)
-        if os.path.isfile(model_path):
-            profile_file = model_path
-            self.logger.debug('Profile found!')
-            id_match = True
-        else:
+        """returns the community profile for this system and whether it matches the machine type exactly
+
+        all matching profiles are collected in profile_candidates, only an
+        exact match is loaded"""
+        self.profile_candidates = []
+        db = self.open_profile_db()
+        if db is None:
+            # no database, fall back to reading the profile file
+            model_path = self.supplied_profile_dir + self.product_id
+            self.logger.debug('Looking for a profile in ' + model_path)
+            if os.path.isfile(model_path):
+                self.logger.debug('Profile found!')
+                self.profile_candidates = [(profiledb.ID_MATCH, model_path)]
+                return self.read_profile(model_path), True
             self.logger.debug('No profile available.')
-        return profile_file, id_match
+            return None, False
+
+        try:
+            matches = db.lookup(self.product_id, self.product_name)
+            self.profile_candidates = [(kind, self.supplied_profile_dir + match_id)
+                                       for kind, record, match_id in matches]
+            self.logger.debug(
+                'Matching profiles: ' + str(self.profile_candidates))
+            if matches and matches[0][0] == profiledb.ID_MATCH:
+                self.logger.debug('Profile found!')
+                return db.load(matches[0][1]), True
+        finally:
+            db.close()
+        self.logger.debug('No profile available.')
+        return None, False
+
+    def open_profile_db(self):
+        """returns the compiled community profiles, compiling them first if the profile directory changed
+
+        returns None if there is no profile directory or the database can not be written"""
+        try:
+            stamp = profiledb.fingerprint(self.supplied_profile_dir)
+        except OSError:
+            return None
+        try:
+            db = profiledb.ProfileDatabase(self.profile_db_path)
+            if db.fingerprint == stamp:
+                return db
+            db.close()
+        except (EnvironmentError, ValueError):
+            pass
+        if self.starting:
+            # compiling all profiles takes long, the exact match is read
+            # directly and the candidates are collected after the first poll
+            self.logger.debug('Profile database is stale, compiling it later')
+            self.clock.idle_add(self.update_profile_candidates)
+            return None
+        return self.build_profile_db()
+
+    def update_profile_candidates(self):
+        """compiles the profile database if necessary and collects the profile candidates"""
+        self.get_profile_file_list()
+        return False
+
+    def build_profile_db(self):
+        """compiles the community profiles into profile_db_path, returns the database or None"""
+        self.logger.debug('Compiling the profiles in ' +
+                          self.supplied_profile_dir + ' into ' + self.profile_db_path)
+        try:
+            db_dir = os.path.dirname(self.profile_db_path)
+            if not os.path.isdir(db_dir):
+                os.makedirs(db_dir)
+            profiledb.build(self.supplied_profile_dir,
+                            self.profile_db_path, self.read_profile)
+            return profiledb.ProfileDatabase(self.profile_db_path)
+        except (EnvironmentError, ValueError), e:
+            self.logger.debug('Unable to compile the profiles: ' + str(e))
+            return None
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a(sd)')
+    def get_startup_phases(self):
+        """returns (phase, msecs) of the daemon startup in the order the phases ended"""
+        return self.startup_phases.get_phases()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a(ss)')
+    def get_profile_candidates(self):
+        """returns (kind of match, path) of the community profiles for this system, best match first
+
+        kind is 'id' for the machine type, 'name' for the model name and
+        'prefix' for models of the same series"""
+        return self.profile_candidates
 
     def read_model_info(self):
         """reads model info from /sys/class/dmi/id"""
         try:
-            with open("/sys/class/dmi/id/product_name", 'r') as f:
-                hw_product = f.read(256).rstrip()
-            with open("/sys/class/dmi/id/board_vendor", 'r') as f:
-                hw_vendor = f.read(256).rstrip()
-            with open("/sys/class/dmi/id/product_version", 'r') as f:
-                hw_version = f.read(256).rstrip()
+            hw_product = self.backend.read_once(
+                self.dmi_path + '/product_name')[:256].rstrip()
+            hw_vendor = self.backend.read_once(
+                self.dmi_path + '/board_vendor')[:256].rstrip()
+            hw_version = self.backend.read_once(
+                self.dmi_path + '/product_version')[:256].rstrip()
             product_id = hw_vendor + '_' + hw_product
             self.product_id = product_id.lower()
-            product_name = hw_vendor.lower() + '_' + hw_version.lower()
-            self.product_name = product_name.lower().replace(
-                '/', '-').replace(' ', '_')
+            self.product_name = profiledb.model_name(hw_vendor, hw_version)
 
             self.product_pretty_vendor = hw_vendor
             self.product_pretty_name = hw_version
@@ -264,33 +645,45 @@ class Settings(dbus.service.Object):
         self.verify_profile_overridden()
         self.sensor_names = tset
         self.verify_tpfancod_settings()
-        self.save()
+        self.schedule_save()
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='a{sa{ss}}', out_signature='')
     def add_new_sensor(self, tset):
         """adds a new sensor"""
-        sensor_id = tset['name'].iterkeys().next()
+        sensor_id = str(tset['name'].iterkeys().next())
         new_trigger_points = {}
 
         self.logger.debug('Adding new sensor: ' + str(tset))
 
-        self.sensor_names[sensor_id] = tset['name'][sensor_id]
+        sensor_names = dict(self.sensor_names)
+        sensor_names[sensor_id] = str(tset['name'][sensor_id])
 
-        for n in tset[tset['name'].iterkeys().next()]:
-            new_trigger_points[int(n)] = int(
-                tset[tset['name'].iterkeys().next()][n])
-        self.trigger_points[sensor_id] = new_trigger_points
+        for n in tset[sensor_id]:
+            new_trigger_points[int(n)] = int(tset[sensor_id][n])
+        trigger_points = dict(self.trigger_points)
+        trigger_points[sensor_id] = new_trigger_points
+        sensor_scalings = dict(self.sensor_scalings)
         if tset['scaling'][sensor_id] != '':
-            self.sensor_scalings[sensor_id] = float(
-                tset['scaling'][sensor_id])
+            sensor_scalings[sensor_id] = float(tset['scaling'][sensor_id])
+        sensor_intervals = dict(self.sensor_intervals)
+        sensor_intervals.pop(sensor_id, None)
+        if tset.get('interval', {}).get(sensor_id, '') != '':
+            sensor_intervals[sensor_id] = int(tset['interval'][sensor_id])
+        self.check_sensors_and_triggers(
+            trigger_points, sensor_names, sensor_scalings)
+        self.check_sensor_intervals(sensor_intervals, trigger_points)
 
+        self.sensor_names = sensor_names
+        self.trigger_points = trigger_points
+        self.sensor_scalings = sensor_scalings
+        self.sensor_intervals = sensor_intervals
         self.logger.debug('New sensor names: ' + str(self.sensor_names))
         self.logger.debug('New scalings: ' + str(self.sensor_scalings))
         self.logger.debug('New trigger points: ' + str(self.trigger_points))
 
-        self.save()
-        # now load new custom profile into memory
-        self.load()
+        # only the new sensor needs to be compiled and opened
+        self.apply_profile()
+        self.schedule_save()
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a{sa{ii}}')
     def get_trigger_points(self):
@@ -303,11 +696,49 @@ class Settings(dbus.service.Object):
         self.verify_profile_overridden()
         self.check_sensors_and_triggers(
             tset, self.sensor_names, self.sensor_scalings)
-        self.trigger_points = tset
+        self.trigger_points = dict((str(sensor), dict((int(temp), int(speed))
+                                                      for temp, speed in points.iteritems()))
+                                   for sensor, points in tset.iteritems())
+        self.sensor_intervals = dict((sensor, interval)
+                                     for sensor, interval in self.sensor_intervals.iteritems()
+                                     if sensor in self.trigger_points)
         self.verify_tpfancod_settings()
-        self.save()
-        # now load new custom profile into memory
-        self.load()
+        # only the sensors with changed trigger points are compiled again
+        self.apply_profile()
+        self.schedule_save()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a{si}')
+    def get_sensor_intervals(self):
+        """returns the msecs between two reads of the sensors that are not read on every poll"""
+        return self.sensor_intervals
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='a{si}', out_signature='')
+    def set_sensor_intervals(self, tset):
+        """sets the msecs between two reads of the sensors, sensors that are left out are read on every poll"""
+        self.verify_profile_overridden()
+        sensor_intervals = dict((str(sensor), int(interval))
+                                for sensor, interval in tset.iteritems())
+        self.check_sensor_intervals(sensor_intervals, self.trigger_points)
+        self.sensor_intervals = sensor_intervals
+        self.apply_profile()
+        self.schedule_save()
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='a{sa{ii}}')
+    def get_load_triggers(self):
+        """returns the fan levels triggered by the cpu load in percent"""
+        return self.load_triggers
+
+    @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='a{sa{ii}}', out_signature='')
+    def set_load_triggers(self, tset):
+        """sets the fan levels triggered by the cpu load, an empty dict disables the load inputs"""
+        self.verify_profile_overridden()
+        load_triggers = dict((str(name), dict((int(percent), int(speed))
+                                              for percent, speed in points.iteritems()))
+                             for name, points in tset.iteritems())
+        self.check_load_triggers(load_triggers)
+        self.load_triggers = load_triggers
+        self.apply_profile()
+        self.schedule_save()
 
     def get_profile_path(self, profile):
         return os.path.split(
@@ -329,7 +760,7 @@ class Settings(dbus.service.Object):
 
             # some special checks for hwmon senesors
             if not sensor.isdigit():
-                if not os.path.isfile(sensor):
+                if not self.backend.exists(self.resolve_sensor(sensor)):
                     raise SyntaxError(
                         'The sensor ' + sensor + 'doesn\'t exist')
 
@@ -362,6 +793,34 @@ class Settings(dbus.service.Object):
                     raise SyntaxError(
                         'The fan_level ' + str(fan_level) + 'is out of bounds')
 
+    def check_sensor_intervals(self, sensor_intervals, trigger_points):
+        """Verifies that the sampling intervals belong to sensors of the profile and are in bounds"""
+        lmin, lmax = self.sensor_interval_limits
+        for sensor, interval in sensor_intervals.iteritems():
+            if sensor not in trigger_points:
+                raise SyntaxError(
+                    'The interval of the sensor ' + sensor + ' belongs to no sensor of the profile')
+            if not isinstance(interval, (int, long)) or interval < lmin or interval > lmax:
+                raise SyntaxError(
+                    'The interval ' + str(interval) + ' of the sensor ' + sensor + ' is out of bounds')
+
+    def check_load_triggers(self, load_triggers):
+        """Verifies that the load triggers refer to known load inputs and are in bounds"""
+        for name, points in load_triggers.iteritems():
+            if name not in load.PATHS:
+                raise SyntaxError(
+                    'The load input ' + str(name) + ' doesn\'t exist')
+            if len(points) == 0:
+                raise SyntaxError(
+                    'The load input ' + name + ' doesn\'t have triggers attached to it')
+            for percent, fan_level in points.iteritems():
+                if not isinstance(percent, (int, long)) or percent < 0 or percent > 100:
+                    raise SyntaxError(
+                        'The load ' + str(percent) + ' of ' + name + ' is out of bounds')
+                if not isinstance(fan_level, (int, long)) or fan_level < 0 or fan_level > 256:
+                    raise SyntaxError(
+                        'The fan level ' + str(fan_level) + ' of ' + name + ' is out of bounds')
+
     def check_setting(self, setting_name, setting_value):
         """Verifies that the value of the given setting is allowed"""
         # some settings are boolean, so we just need to check their type
@@ -372,7 +831,10 @@ class Settings(dbus.service.Object):
             else:
                 return
         # other settings point to files, so we need to check if they exist
-        if setting_name in ['current_profile']:
+        if setting_name in self.power_profile_options and setting_value == '':
+            # the power source uses current_profile
+            return
+        if setting_name in ['current_profile'] + self.power_profile_options:
             if not (os.path.isfile(os.path.split(self.config_path)[0] + '/' + setting_value) or
                     os.path.isfile(setting_value)):
                 raise SyntaxError(
@@ -391,11 +853,20 @@ class Settings(dbus.service.Object):
         # check sensors, triggers and sensor names
         self.check_sensors_and_triggers(
             self.trigger_points, self.sensor_names, self.sensor_scalings)
+        self.check_sensor_intervals(self.sensor_intervals, self.trigger_points)
+        self.check_load_triggers(self.load_triggers)
 
         # check single settings
-        for opt in ['hysteresis', 'enabled', 'override_profile', 'current_profile']:
+        for opt in self.profile_options + ['enabled', 'override_profile', 'current_profile']:
             val = eval('self.' + opt)
             self.check_setting(opt, val)
+        self.check_poll_times(self.poll_min_time, self.poll_max_time)
+
+    def check_poll_times(self, poll_min_time, poll_max_time):
+        """Verifies that the bounds of the poll interval are ordered"""
+        if poll_min_time > poll_max_time:
+            raise SyntaxError(
+                'poll_min_time must not be larger than poll_max_time')
 
     def verify_profile_overridden(self):
         """verifies that override_profile is true, raises ProfileNotOverriddenException if it is not"""
@@ -422,7 +893,15 @@ class Settings(dbus.service.Object):
         ret = {'hysteresis': self.hysteresis,
                'enabled': int(self.enabled),
                'override_profile': int(self.override_profile),
-               'poll_time': int(self.poll_time)}
+               'poll_time': int(self.poll_time),
+               'poll_min_time': self.poll_min_time,
+               'poll_max_time': self.poll_max_time,
+               'poll_aggressiveness': self.poll_aggressiveness,
+               'event_driven': self.event_driven,
+               'signal_threshold': self.signal_threshold,
+               'signal_interval': self.signal_interval,
+               'performance_mode': self.performance_mode,
+               'throttle_relax_time': self.throttle_relax_time}
         return ret
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='a{ss}', out_signature='')
@@ -431,9 +910,20 @@ class Settings(dbus.service.Object):
         # check that all the settings are OK
         for setting in tset:
             val = tset[setting]
-            if setting in ['enabled', 'override_profile', 'hysteresis']:
+            if setting in ['enabled', 'override_profile'] + self.profile_options:
                 val = ast.literal_eval(val)
             self.check_setting(setting, val)
+        # these settings decide which profile is used, so changing them
+        # needs a full reload
+        reload_needed = False
+        for setting, current in [('enabled', self.enabled), ('override_profile', self.override_profile)]:
+            if setting in tset and ast.literal_eval(tset[setting]) != current:
+                reload_needed = True
+        if 'current_profile' in tset and tset['current_profile'] != self.current_profile:
+            reload_needed = True
+        for source, opt in zip(power.SOURCES, self.power_profile_options):
+            if opt in tset and tset[opt] != self.power_profiles.get(source, ''):
+                reload_needed = True
         # now let us set the values
         self.logger.debug(
             'Updating settings to ' + str(tset))
@@ -445,20 +935,34 @@ class Settings(dbus.service.Object):
             self.logger.debug(
                 'Changing override_profile to ' + str(ast.literal_eval(tset['override_profile'])))
             self.override_profile = ast.literal_eval(tset['override_profile'])
-        if 'hysteresis' in tset:
-            self.verify_profile_overridden()
-            self.logger.debug(
-                'Changing hysteresis to ' + str(ast.literal_eval(tset['hysteresis'])))
-            self.hysteresis = ast.literal_eval(tset['hysteresis'])
+        for opt in self.profile_options:
+            if opt in tset:
+                self.verify_profile_overridden()
+                self.logger.debug(
+                    'Changing ' + opt + ' to ' + str(ast.literal_eval(tset[opt])))
+                setattr(self, opt, ast.literal_eval(tset[opt]))
         if 'current_profile' in tset:
             self.verify_profile_overridden()
             self.logger.debug(
                 'Changing current_profile to ' + str(ast.literal_eval(tset['current_profile'])))
             self.current_profile = tset['current_profile']
+        power_profiles = dict(self.power_profiles)
+        for source, opt in zip(power.SOURCES, self.power_profile_options):
+            if opt in tset:
+                self.verify_profile_overridden()
+                self.logger.debug('Changing ' + opt + ' to ' + tset[opt])
+                power_profiles.pop(source, None)
+                if tset[opt] != '':
+                    power_profiles[source] = str(tset[opt])
+        self.power_profiles = power_profiles
         self.verify_tpfancod_settings()
-        self.save()
-        # now load new custom profile into memory
-        self.load()
+        if reload_needed:
+            self.save()
+            # now load new custom profile into memory
+            self.load()
+        else:
+            self.apply_profile()
+            self.schedule_save()
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='s')
     def get_profile_string(self):
@@ -492,6 +996,14 @@ class Settings(dbus.service.Object):
                     settings_from_config['current_profile'] = current_config.get(
                         'General', 'current_profile')
 
+                power_profiles = {}
+                for source, opt in zip(power.SOURCES, self.power_profile_options):
+                    if current_config.has_option('General', opt) and \
+                            current_config.get('General', opt) != '':
+                        power_profiles[source] = current_config.get(
+                            'General', opt)
+                settings_from_config['power_profiles'] = power_profiles
+
         except Exception, e:
             print 'Error parsing config file: %s' % path
             print e
@@ -537,19 +1049,22 @@ class Settings(dbus.service.Object):
                         'General', 'product_id')
 
             if current_profile.has_section('Options'):
-                if current_profile.has_option('Options', 'hysteresis'):
-                    settings_from_profile['hysteresis'] = current_profile.getint(
-                        'Options', 'hysteresis')
+                for opt in self.profile_options:
+                    if current_profile.has_option('Options', opt):
+                        settings_from_profile[opt] = current_profile.getint(
+                            'Options', opt)
 
             if current_profile.has_section('Sensors'):
                 trigger_points = {}
                 sensor_names = {}
                 sensor_scalings = {}
+                sensor_intervals = {}
 
                 for sensor in current_profile.options('Sensors'):
 
                     self.logger.debug('Parsing sensor ' + sensor)
-                    if not sensor.startswith('ibm_thermal_sensor') and not sensor.startswith('/'):
+                    if not sensor.startswith('ibm_thermal_sensor') and not sensor.startswith('/') and \
+                            not sensor.startswith(hwmon.PREFIX):
                         continue
                     tid_conf = ast.literal_eval(
                         current_profile.get('Sensors', sensor))
@@ -559,15 +1074,27 @@ class Settings(dbus.service.Object):
                         tid = sensor.split('_')[3]
                         sensor_names[tid] = tid_conf['name']
                         trigger_points[tid] = trigger_dict
+                        if 'interval' in tid_conf:
+                            sensor_intervals[tid] = tid_conf['interval']
 
-                    if sensor.startswith('/'):
+                    if sensor.startswith('/') or sensor.startswith(hwmon.PREFIX):
                         sensor_names[sensor] = tid_conf['name']
                         sensor_scalings[sensor] = tid_conf['scaling']
                         trigger_points[sensor] = trigger_dict
+                        if 'interval' in tid_conf:
+                            sensor_intervals[sensor] = tid_conf['interval']
 
                 settings_from_profile['trigger_points'] = trigger_points
                 settings_from_profile['sensor_names'] = sensor_names
                 settings_from_profile['sensor_scalings'] = sensor_scalings
+                settings_from_profile['sensor_intervals'] = sensor_intervals
+
+            if current_profile.has_section('Load'):
+                load_triggers = {}
+                for name in current_profile.options('Load'):
+                    load_triggers[name] = ast.literal_eval(
+                        current_profile.get('Load', name))
+                settings_from_profile['load_triggers'] = load_triggers
 
         except Exception, e:
             print 'Error parsing profile file: %s' % path
@@ -607,6 +1134,17 @@ class Settings(dbus.service.Object):
                                '# override_profile is set to True.')
             current_config.set(
                 'General', 'current_profile', self.current_profile)
+            current_config.set('General',
+                               '# Profiles used while the machine runs on AC power, on battery or')
+            current_config.set('General',
+                               '# in a dock. They are loaded together with current_profile and')
+            current_config.set('General',
+                               '# tpfancod switches between them when the power source changes.')
+            current_config.set('General',
+                               '# Leave them empty to use current_profile on that power source.')
+            for source, opt in zip(power.SOURCES, self.power_profile_options):
+                current_config.set(
+                    'General', opt, self.power_profiles.get(source, ''))
 
         except Exception, e:
             print 'Error reading current configuration'
@@ -614,12 +1152,12 @@ class Settings(dbus.service.Object):
             return False
 
         try:
-            config_file = open(path, 'w')
+            config_file = StringIO.StringIO()
             config_file.write(
                 '# This file provides the general configuration of tpfancod')
             config_file.write('\n\n\n')
             current_config.write(config_file)
-            config_file.close()
+            persist.write_atomically(path, config_file.getvalue())
 
         except Exception, e:
             print 'Error writing config file: %s' % path
@@ -666,6 +1204,40 @@ class Settings(dbus.service.Object):
                                 '# Set the hysteresis temperature difference.')
             current_profile.set(
                 'Options', 'hysteresis', str(self.hysteresis))
+            current_profile.set('Options',
+                                '# Bounds of the adaptive poll interval in msecs.')
+            current_profile.set(
+                'Options', 'poll_min_time', str(self.poll_min_time))
+            current_profile.set(
+                'Options', 'poll_max_time', str(self.poll_max_time))
+            current_profile.set('Options',
+                                '# How quickly polling speeds up when temperatures rise or')
+            current_profile.set('Options',
+                                '# approach a trigger point (0-10). 0 disables adaptive polling.')
+            current_profile.set(
+                'Options', 'poll_aggressiveness', str(self.poll_aggressiveness))
+            current_profile.set('Options',
+                                '# Set to 1 to program the next trigger temperatures into hwmon alarms')
+            current_profile.set('Options',
+                                '# and thermal zone trip points and react to crossings immediately.')
+            current_profile.set(
+                'Options', 'event_driven', str(self.event_driven))
+            current_profile.set('Options',
+                                '# Temperature change in K and minimal time in msecs between two')
+            current_profile.set('Options',
+                                '# change signals sent to d-bus clients.')
+            current_profile.set(
+                'Options', 'signal_threshold', str(self.signal_threshold))
+            current_profile.set(
+                'Options', 'signal_interval', str(self.signal_interval))
+            current_profile.set('Options',
+                                '# Set to 1 to raise the fan level whenever the cpu throttles and to')
+            current_profile.set('Options',
+                                '# lower it again after throttle_relax_time msecs without throttling.')
+            current_profile.set(
+                'Options', 'performance_mode', str(self.performance_mode))
+            current_profile.set(
+                'Options', 'throttle_relax_time', str(self.throttle_relax_time))
             current_profile.add_section('Sensors')
             for sensor_id in sorted(set(self.sensor_names.keys()), key=self.sensor_sort):
                 ntp = {}
@@ -674,11 +1246,23 @@ class Settings(dbus.service.Object):
                 nname = str(self.sensor_names[sensor_id])
 
                 if sensor_id.isdigit():
-                    current_profile.set('Sensors', 'ibm_thermal_sensor_' + str(sensor_id), str(
-                        {'name': nname, 'triggers': ntp}))
+                    sensor_conf = {'name': nname, 'triggers': ntp}
+                    option = 'ibm_thermal_sensor_' + str(sensor_id)
                 else:
-                    current_profile.set('Sensors', str(sensor_id), str(
-                        {'name': nname, 'scaling': self.sensor_scalings[sensor_id], 'triggers': ntp}))
+                    sensor_conf = {'name': nname, 'scaling': self.sensor_scalings[sensor_id],
+                                   'triggers': ntp}
+                    option = str(sensor_id)
+                if sensor_id in self.sensor_intervals:
+                    sensor_conf['interval'] = self.sensor_intervals[sensor_id]
+                current_profile.set('Sensors', option, str(sensor_conf))
+            if self.load_triggers:
+                current_profile.add_section('Load')
+                current_profile.set('Load',
+                                    '# Fan levels triggered by the cpu utilization and the cpu pressure')
+                current_profile.set('Load',
+                                    '# (PSI some avg10) in percent, before temperatures rise.')
+                for name in sorted(self.load_triggers):
+                    current_profile.set('Load', name, str(self.load_triggers[name]))
 
         except Exception, e:
             print 'Error writing current profile to ' + path
@@ -686,14 +1270,16 @@ class Settings(dbus.service.Object):
             return False
 
         try:
-            if not is_a_string_buffer:
-                path = open(path, 'w')
-            path.write(
+            profile_file = StringIO.StringIO()
+            profile_file.write(
                 '# This file contains a fan profile for tpfancod')
-            path.write('\n\n\n')
-            current_profile.write(path)
+            profile_file.write('\n\n\n')
+            current_profile.write(profile_file)
             if is_a_string_buffer:
+                path.write(profile_file.getvalue())
                 self.profile_as_string = path.getvalue()
+            else:
+                persist.write_atomically(path, profile_file.getvalue())
 
         except Exception, e:
             print 'Error writing profile file: %s' % path
@@ -708,6 +1294,7 @@ class Settings(dbus.service.Object):
             self.enabled = settings_from_config['enabled']
             self.override_profile = settings_from_config['override_profile']
             self.current_profile = settings_from_config['current_profile']
+            self.power_profiles = settings_from_config.get('power_profiles', {})
 
         else:
             raise SyntaxError(
@@ -719,33 +1306,73 @@ class Settings(dbus.service.Object):
         if settings_from_profile['status']:
             self.profile_comment = settings_from_profile['comment']
             self.hysteresis = settings_from_profile['hysteresis']
+            for opt in self.profile_options[1:]:
+                setattr(self, opt, settings_from_profile.get(
+                    opt, getattr(Settings, opt)))
             self.trigger_points = settings_from_profile['trigger_points']
             self.sensor_names = settings_from_profile['sensor_names']
             self.sensor_scalings = settings_from_profile['sensor_scalings']
+            self.sensor_intervals = settings_from_profile.get(
+                'sensor_intervals', {})
+            self.load_triggers = settings_from_profile.get('load_triggers', {})
+            self.compile_trigger_points()
         else:
             raise SyntaxError(
                 'Error loading values from ' + settings_from_profile['file_path'])
 
+    def compile_trigger_points(self):
+        """compiles the trigger points into step tables, reusing the tables of unchanged sensors"""
+        profile = (self.hysteresis, dict((sensor, dict(points))
+                                         for sensor, points in self.trigger_points.iteritems()))
+        self.load_tables = triggers.compile_trigger_points(
+            self.load_triggers, self.hysteresis)
+        if profile == self.compiled_profile:
+            return
+        if self.compiled_profile is not None and self.compiled_profile[0] == self.hysteresis:
+            old_points = self.compiled_profile[1]
+            changed = dict((sensor, points) for sensor, points in profile[1].iteritems()
+                           if old_points.get(sensor) != points or sensor not in self.trigger_tables)
+            self.logger.debug(
+                'Compiling trigger points of ' + str(changed.keys()))
+            tables = dict((sensor, self.trigger_tables[sensor])
+                          for sensor in profile[1] if sensor not in changed)
+            tables.update(triggers.compile_trigger_points(
+                changed, self.hysteresis))
+            self.trigger_tables = tables
+        else:
+            self.logger.debug('Compiling trigger points')
+            self.trigger_tables = triggers.compile_trigger_points(
+                self.trigger_points, self.hysteresis)
+        self.compiled_profile = profile
+
     def verify_config(self, settings_from_config):
         """checks that settings form a configuration file are correct"""
         for opt in ['enabled', 'override_profile', 'current_profile']:
             self.check_setting(opt, settings_from_config[opt])
+        for source, profile in settings_from_config.get('power_profiles', {}).iteritems():
+            self.check_setting(source + '_profile', profile)
 
     def verify_profile(self, settings_from_profile):
         """checks that settings form a profile file are correct"""
         self.check_sensors_and_triggers(settings_from_profile['trigger_points'],
                                         settings_from_profile['sensor_names'],
                                         settings_from_profile['sensor_scalings'])
-        for opt in ['hysteresis']:
-            self.check_setting(opt, settings_from_profile[opt])
+        self.check_sensor_intervals(settings_from_profile.get('sensor_intervals', {}),
+                                    settings_from_profile['trigger_points'])
+        self.check_load_triggers(settings_from_profile.get('load_triggers', {}))
+        self.check_setting('hysteresis', settings_from_profile['hysteresis'])
+        for opt in self.profile_options[1:]:
+            if opt in settings_from_profile:
+                self.check_setting(opt, settings_from_profile[opt])
+        self.check_poll_times(settings_from_profile.get('poll_min_time', Settings.poll_min_time),
+                              settings_from_profile.get('poll_max_time', Settings.poll_max_time))
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='as')
     def get_available_ibm_thermal_sensors(self):
         res = []
         try:
-            tempfile = open(self.ibm_thermal, 'r')
-            elements = tempfile.readline().split()[1:]
-            tempfile.close()
+            elements = self.backend.read_once(
+                self.ibm_thermal).split('\n', 1)[0].split()[1:]
             for idx, val in enumerate(elements):
                 # value is +/-128 or 0, if sensor is disconnected
                 if abs(int(val)) != 128 and abs(int(val)) != 0:
@@ -753,13 +1380,8 @@ class Settings(dbus.service.Object):
         except IOError:
             # sometimes read fails during suspend/resume
             pass
-        finally:
-            try:
-                tempfile.close()
-            except:
-                pass
         return res
 
     @dbus.service.method('org.tpfanco.tpfancod.Settings', in_signature='', out_signature='b')
     def check_if_hwmon_sensor_exists(self, sensor):
-        return os.path.isfile(sensor)
+        return self.backend.exists(self.resolve_sensor(sensor))
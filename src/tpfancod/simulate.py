@@ -0,0 +1,169 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""runs the fan controller against scripted sensors in virtual time
+
+A sensor script contains one key frame per line:
+
+    # time in s   sensor=value ...
+    0     0=45 1=40 /sys/devices/virtual/hwmon/hwmon0/temp1_input=45000
+    60    0=70 /sys/devices/virtual/hwmon/hwmon0/temp1_input=72000
+    120   0=50
+
+Numeric sensors are ibm_thermal sensors in degree Celsius, paths are
+hwmon files whose raw content is given, utilization and pressure are the
+cpu load in percent served through /proc/stat and /proc/pressure/cpu.
+Values are interpolated linearly between key frames and kept constant
+after the last one.
+"""
+
+import bisect
+
+from tpfancod import clock, control, hardware, load, settings, worker
+
+# number of sensors reported by /proc/acpi/ibm/thermal
+IBM_THERMAL_SENSORS = 16
+
+
+class ScriptedSensors(object):
+
+    """sensor values from a script, interpolated between key frames"""
+
+    def __init__(self, frames):
+        # sensor -> ([times], [values])
+        self.tracks = {}
+        # (time, busy jiffies, total jiffies) of the last read of /proc/stat
+        self.stat = (0.0, 0.0, 0.0)
+        for when, values in sorted(frames):
+            for sensor, value in values.iteritems():
+                times, track = self.tracks.setdefault(sensor, ([], []))
+                times.append(when)
+                track.append(value)
+
+    @classmethod
+    def from_file(cls, path):
+        frames = []
+        with open(path, 'r') as f:
+            for number, line in enumerate(f):
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                fields = line.split()
+                try:
+                    values = dict((sensor, float(value)) for sensor, value in
+                                  (field.rsplit('=', 1) for field in fields[1:]))
+                    frames.append((float(fields[0]), values))
+                except ValueError:
+                    raise SyntaxError('Invalid key frame in line ' +
+                                      str(number + 1) + ' of ' + path)
+        return cls(frames)
+
+    def value(self, sensor, now):
+        times, track = self.tracks[sensor]
+        idx = bisect.bisect_right(times, now)
+        if idx == 0:
+            return track[0]
+        if idx == len(times):
+            return track[-1]
+        t0, t1 = times[idx - 1], times[idx]
+        v0, v1 = track[idx - 1], track[idx]
+        return v0 + (v1 - v0) * (now - t0) / (t1 - t0)
+
+    def render_ibm_thermal(self, now):
+        values = [-128] * IBM_THERMAL_SENSORS
+        for sensor in self.tracks:
+            if sensor.isdigit() and int(sensor) < IBM_THERMAL_SENSORS:
+                values[int(sensor)] = int(round(self.value(sensor, now)))
+        return 'temperatures:\t' + ' '.join(str(value) for value in values) + '\n'
+
+    def render_stat(self, now):
+        # busy and total jiffies at 100 per second, busy grows with the
+        # scripted utilization since the previous read
+        when, busy, total = self.stat
+        elapsed = max(0.0, now - when) * 100
+        busy += elapsed * self.value('utilization', now) / 100.0
+        total += elapsed
+        self.stat = (now, busy, total)
+        return 'cpu  %d 0 0 %d 0 0 0 0 0 0\n' % (busy, total - busy)
+
+    def render_pressure(self, now):
+        return ('some avg10=%.2f avg60=0.00 avg300=0.00 total=0\n'
+                'full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n'
+                % self.value('pressure', now))
+
+    def install(self, backend, ibm_thermal):
+        """serves the scripted sensors through backend"""
+        if any(sensor.isdigit() for sensor in self.tracks):
+            backend.set_file(ibm_thermal, self.render_ibm_thermal)
+        if 'utilization' in self.tracks:
+            backend.set_file(load.STAT, self.render_stat)
+        if 'pressure' in self.tracks:
+            backend.set_file(load.PRESSURE, self.render_pressure)
+        for sensor in self.tracks:
+            if sensor in load.PATHS:
+                continue
+            if not sensor.isdigit():
+                backend.set_file(sensor, lambda now, sensor=sensor: '%d\n' %
+                                 int(round(self.value(sensor, now))))
+
+
+def percentile(values, fraction):
+    """returns the given percentile of a sorted list"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(script, duration, config_path, current_profile, supplied_profile_dir, poll_time, watchdog_time,
+        version, debug=False, ibm_fan='/proc/acpi/ibm/fan', ibm_thermal='/proc/acpi/ibm/thermal'):
+    """polls the scripted sensors for duration virtual seconds and returns a report"""
+    virtual_clock = clock.VirtualClock()
+    backend = hardware.FakeBackend(virtual_clock.monotonic, ibm_fan)
+    if not isinstance(script, ScriptedSensors):
+        script = ScriptedSensors.from_file(script)
+    script.install(backend, ibm_thermal)
+    for name, value in [('product_name', 'simulated'), ('board_vendor', 'LENOVO'),
+                        ('product_version', 'ThinkPad')]:
+        backend.set_file(settings.Settings.dmi_path + '/' + name, value)
+
+    act_settings = settings.Settings(None, None, debug, True, False, version, config_path, current_profile,
+                                     ibm_fan, ibm_thermal, supplied_profile_dir, poll_time, watchdog_time,
+                                     backend=backend, main_clock=virtual_clock)
+    # reads run in virtual time, i.e. take no time at all
+    controller = control.Control(None, None, act_settings, virtual_clock,
+                                 worker.InlineExecutor())
+    virtual_clock.run(duration)
+
+    durations = sorted(virtual_clock.durations)
+    level_changes = [(when, command) for when, command in backend.commands
+                     if any(not part.startswith('watchdog') for part in command.split(','))]
+    return {'ticks': len(durations),
+            'tick_min': percentile(durations, 0.0),
+            'tick_median': percentile(durations, 0.5),
+            'tick_p95': percentile(durations, 0.95),
+            'tick_max': percentile(durations, 1.0),
+            'reads': backend.reads,
+            'writes': backend.writes,
+            'commands': backend.commands,
+            'level_commands': len(level_changes),
+            'watchdog_expired': backend.fan.expired,
+            'final_level': backend.fan.level,
+            'controller': controller}
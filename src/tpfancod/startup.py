@@ -0,0 +1,74 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import logging
+
+from tpfancod import clock
+
+
+def set_log_level(debug):
+    """sets the level of the loggers of all tpfancod modules, DEBUG in debug mode"""
+    # the modules only create their loggers, without a level they would
+    # inherit WARNING from the root logger and drop their debug messages
+    if debug:
+        logging.getLogger('tpfancod').setLevel(logging.DEBUG)
+    else:
+        logging.getLogger('tpfancod').setLevel(logging.ERROR)
+
+
+class StartupPhases(object):
+
+    """durations of the phases of the daemon startup"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        # (name, duration in msecs) in the order the phases ended
+        self.phases = []
+        self.started = clock.monotonic()
+        self.current = None
+        self.current_start = None
+
+    def begin(self, name):
+        """ends the running phase and starts the next one"""
+        self.end()
+        self.current = name
+        self.current_start = clock.monotonic()
+
+    def end(self):
+        """ends the running phase, if there is one"""
+        if self.current is None:
+            return
+        duration = (clock.monotonic() - self.current_start) * 1000
+        self.phases.append((self.current, duration))
+        self.logger.debug('Startup phase ' + self.current + ' took %.1f ms' % duration)
+        self.current = None
+
+    def finish(self):
+        """ends the running phase and records the total duration of the startup"""
+        self.end()
+        total = (clock.monotonic() - self.started) * 1000
+        self.phases.append(('total', total))
+        self.logger.debug('Startup took %.1f ms' % total)
+
+    def get_phases(self):
+        """returns (name, msecs) of all finished phases"""
+        return list(self.phases)
@@ -0,0 +1,98 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import array
+import bisect
+
+
+class Histogram(object):
+
+    """fixed-size histogram of durations with logarithmic buckets"""
+
+    # upper bounds of the buckets in usecs, the last bucket is unbounded
+    bounds = array.array('d', [base * 10 ** exp for exp in range(7)
+                               for base in (1, 2, 5)])
+
+    def __init__(self):
+        self.counts = array.array('L', [0] * (len(self.bounds) + 1))
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, seconds):
+        usecs = seconds * 1e6
+        self.counts[bisect.bisect_left(self.bounds, usecs)] += 1
+        self.count += 1
+        self.total += usecs
+        if self.min is None or usecs < self.min:
+            self.min = usecs
+        if usecs > self.max:
+            self.max = usecs
+
+    def percentile(self, fraction):
+        """returns the upper bound of the bucket that contains the given percentile"""
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if idx < len(self.bounds):
+                    return min(self.bounds[idx], self.max)
+                return self.max
+        return self.max
+
+    def to_dict(self):
+        """returns counters, percentiles and buckets in usecs"""
+        res = {'count': float(self.count),
+               'min_us': self.min or 0.0,
+               'max_us': self.max,
+               'mean_us': self.total / self.count if self.count else 0.0,
+               'p50_us': self.percentile(0.5),
+               'p90_us': self.percentile(0.9),
+               'p99_us': self.percentile(0.99)}
+        for bound, count in zip(self.bounds, self.counts):
+            res['le_%d_us' % bound] = float(count)
+        res['le_inf_us'] = float(self.counts[-1])
+        return res
+
+
+class PollStats(object):
+
+    """durations of the stages of a poll cycle"""
+
+    stages = ['fan_read', 'ibm_thermal', 'hwmon', 'load', 'throttle',
+              'triggers', 'fan_write', 'cycle']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.histograms = dict((stage, Histogram()) for stage in self.stages)
+
+    def add(self, stage, seconds):
+        self.histograms[stage].add(seconds)
+
+    def to_dict(self):
+        return dict((stage, histogram.to_dict())
+                    for stage, histogram in self.histograms.iteritems())
@@ -0,0 +1,176 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+"""thermal throttling of the cpus and the performance mode
+
+The cpus count how often they throttled themselves because they got too
+hot in thermal_throttle/core_throttle_count of every cpu and in
+package_throttle_count, which every cpu of a package shares. tpfancod adds
+them up on every poll, the difference to the previous poll is the number
+of throttle events in that interval.
+
+In performance mode the fan is escalated one level above the one the
+profile requires whenever the counters advance, and relaxed by one level
+after throttle_relax_time msecs without throttling.
+"""
+
+import glob
+import os
+import re
+
+from tpfancod.hwmon import read_attribute
+
+CORE = 'core_throttle_count'
+PACKAGE = 'package_throttle_count'
+# fan speeds in the order the performance mode escalates them
+LADDER = [0, 2, 3, 4, 5, 6, 7, 8, 256]
+
+
+def find_counters(cpu_root='/sys/devices/system/cpu'):
+    """returns the files of the throttle counters, a package counter only once per package"""
+    cpu_dirs = [path for path in glob.glob(os.path.join(cpu_root, 'cpu*'))
+                if re.match(r'^cpu\d+$', os.path.basename(path))]
+    cpu_dirs.sort(key=lambda path: int(os.path.basename(path)[3:]))
+    paths = []
+    packages = set()
+    for cpu_dir in cpu_dirs:
+        directory = os.path.join(cpu_dir, 'thermal_throttle')
+        core = os.path.join(directory, CORE)
+        if os.path.isfile(core):
+            paths.append(core)
+        package = os.path.join(directory, PACKAGE)
+        if os.path.isfile(package):
+            package_id = read_attribute(os.path.join(cpu_dir, 'topology', 'physical_package_id'))
+            if package_id not in packages:
+                packages.add(package_id)
+                paths.append(package)
+    return paths
+
+
+def escalate(speed):
+    """returns the next fan speed above speed, the EC mode is escalated to full speed"""
+    if speed == 255:
+        return 256
+    for step in LADDER:
+        if step > speed:
+            return step
+    return 256
+
+
+def relax(speed):
+    """returns the next fan speed below speed"""
+    lower = 0
+    for step in LADDER:
+        if step >= speed:
+            break
+        lower = step
+    return lower
+
+
+def apply_floor(speed, floor):
+    """returns speed raised to floor, the EC mode is only overridden by full speed"""
+    if floor == 0 or speed == 256:
+        return speed
+    if floor == 256:
+        return floor
+    if speed == 255:
+        return speed
+    return max(speed, floor)
+
+
+class ThrottleCounters(object):
+
+    """the throttle counters of all cpus, kept open like the sensors"""
+
+    def __init__(self, paths, handles):
+        self.paths = list(paths)
+        self.handles = [handles.get(path) for path in self.paths]
+
+    def read(self):
+        """returns the sum of all counters, None if there are none or one can not be read"""
+        if not self.handles:
+            return None
+        total = 0
+        for handle in self.handles:
+            try:
+                total += int(handle.read().strip())
+            except (IOError, ValueError):
+                return None
+        return total
+
+
+class ThrottleGovernor(object):
+
+    """counts the throttle events per poll interval and escalates the fan in performance mode"""
+
+    def __init__(self):
+        # counter sum of the previous poll, None if it could not be read
+        self.last_count = None
+        # speed that the performance mode keeps the fan at, 0 for none
+        self.floor = 0
+        # time of the last escalation or relaxation
+        self.last_change = 0.0
+        self.events = 0
+        self.intervals = 0
+        self.throttled_intervals = 0
+        self.escalations = 0
+
+    def update(self, count):
+        """notes the counter sum of a poll, returns the throttle events since the previous poll
+
+        returns None if the counters could not be read"""
+        last = self.last_count
+        self.last_count = count
+        if count is None or last is None:
+            return None
+        # the counters restart at 0 when a cpu comes back online
+        events = max(0, count - last)
+        self.intervals += 1
+        self.events += events
+        if events:
+            self.throttled_intervals += 1
+        return events
+
+    def adjust(self, speed, events, now, relax_time):
+        """returns the fan speed for the performance mode, speed is the one the profile requires
+
+        events are the throttle events of the last interval, relax_time the
+        msecs without throttling after which the fan is relaxed by one level"""
+        if events:
+            self.floor = escalate(apply_floor(speed, self.floor))
+            self.escalations += 1
+            self.last_change = now
+        elif self.floor and (now - self.last_change) * 1000 >= relax_time:
+            self.floor = relax(self.floor)
+            self.last_change = now
+        return apply_floor(speed, self.floor)
+
+    def reset(self):
+        """drops the escalation, e.g. when the performance mode is switched off"""
+        self.floor = 0
+
+    def get_stats(self):
+        return {'events': self.events,
+                'intervals': self.intervals,
+                'throttled_intervals': self.throttled_intervals,
+                'escalations': self.escalations,
+                'floor': self.floor}
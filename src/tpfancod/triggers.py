@@ -0,0 +1,66 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import array
+import bisect
+
+
+class TriggerTable(object):
+
+    """trigger points of one sensor compiled into a sorted step table"""
+
+    def __init__(self, trigger_points, hysteresis):
+        # trigger temperatures in ascending order
+        self.thresholds = array.array('i')
+        # highest fan speed triggered at or above each threshold
+        self.speeds = array.array('i')
+        # temperature that has to be undercut to release that speed
+        self.releases = array.array('i')
+
+        speed = None
+        release = None
+        for temp in sorted(trigger_points):
+            if speed is None or trigger_points[temp] > speed:
+                speed = trigger_points[temp]
+                release = temp - hysteresis
+            self.thresholds.append(temp)
+            self.speeds.append(speed)
+            self.releases.append(release)
+
+    def lookup(self, temp):
+        """returns (speed, release temperature) for temp or None if temp is below all triggers"""
+        idx = bisect.bisect_right(self.thresholds, temp) - 1
+        if idx < 0:
+            return None
+        return self.speeds[idx], self.releases[idx]
+
+    def next_threshold(self, temp):
+        """returns the lowest trigger temperature above temp or None if there is none"""
+        idx = bisect.bisect_right(self.thresholds, temp)
+        if idx == len(self.thresholds):
+            return None
+        return self.thresholds[idx]
+
+
+def compile_trigger_points(trigger_points, hysteresis):
+    """returns a dict with a TriggerTable for every sensor"""
+    return dict((sensor, TriggerTable(points, hysteresis))
+                for sensor, points in trigger_points.iteritems())
@@ -0,0 +1,111 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import logging
+import socket
+
+NETLINK_KOBJECT_UEVENT = 15
+# multicast group of the kernel (as opposed to udev) uevents
+UEVENT_KERNEL_GROUP = 1
+
+
+def parse_uevent(message):
+    """returns the properties of a kernel uevent message as a dict"""
+    fields = message.split('\0')
+    properties = {}
+    for field in fields[1:]:
+        if '=' in field:
+            key, value = field.split('=', 1)
+            properties[key] = value
+    if '@' in fields[0] and 'ACTION' not in properties:
+        properties['ACTION'], properties['DEVPATH'] = fields[0].split('@', 1)
+    return properties
+
+
+class UeventMonitor(object):
+
+    """listens for kernel uevents in the glib main loop and dispatches them by subsystem"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.callbacks = {}
+        self.sock = None
+        self.source = None
+
+    def start(self):
+        """opens the netlink socket, returns False if uevents are not available"""
+        if self.sock is not None:
+            return True
+        try:
+            self.sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            self.sock.bind((0, UEVENT_KERNEL_GROUP))
+        except (socket.error, AttributeError), e:
+            self.logger.debug('Unable to listen for uevents: ' + str(e))
+            self.sock = None
+            return False
+        self.source = self.add_watch(self.sock.fileno())
+        return True
+
+    def add_watch(self, fd):
+        """calls on_readable whenever fd has a message"""
+        # imported here so that loading the control module does not load glib
+        import gobject
+        return gobject.io_add_watch(fd, gobject.IO_IN, self.on_readable)
+
+    def remove_watch(self, source):
+        import gobject
+        gobject.source_remove(source)
+
+    def stop(self):
+        if self.source is not None:
+            self.remove_watch(self.source)
+            self.source = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def subscribe(self, subsystem, callback):
+        """calls callback(properties) for every uevent of subsystem"""
+        self.callbacks.setdefault(subsystem, []).append(callback)
+        return self.start()
+
+    def unsubscribe(self, subsystem, callback):
+        if callback in self.callbacks.get(subsystem, []):
+            self.callbacks[subsystem].remove(callback)
+            if not self.callbacks[subsystem]:
+                del self.callbacks[subsystem]
+        if not self.callbacks:
+            self.stop()
+
+    def on_readable(self, fd, condition):
+        try:
+            message = self.sock.recv(16384)
+        except socket.error:
+            return True
+        properties = parse_uevent(message)
+        for callback in list(self.callbacks.get(properties.get('SUBSYSTEM'), [])):
+            callback(properties)
+        return True
+
+
+# uevents are multicast, one socket per daemon is enough
+monitor = UeventMonitor()
@@ -0,0 +1,94 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2015 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import Queue
+import logging
+import threading
+
+
+class WorkerPool(object):
+
+    """runs blocking hardware access in threads and delivers the results on the main loop
+
+    The glib main loop must be initialized for threads, see
+    gobject.threads_init."""
+
+    def __init__(self, main_clock, size=2):
+        self.logger = logging.getLogger(__name__)
+        self.clock = main_clock
+        self.queue = Queue.Queue()
+        # number of functions that are running right now
+        self.busy = 0
+        self.lock = threading.Lock()
+        self.threads = []
+        for idx in range(size):
+            thread = threading.Thread(target=self.run, name='tpfancod-worker-%d' % idx)
+            # a stuck read must not keep the daemon from exiting
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, function, callback):
+        """runs function in a worker, then callback(result, error) on the main loop
+
+        error is None if function returned, otherwise the exception it raised"""
+        self.queue.put((function, callback))
+
+    def run(self):
+        while True:
+            function, callback = self.queue.get()
+            with self.lock:
+                self.busy += 1
+            result = error = None
+            try:
+                result = function()
+            except Exception, e:
+                self.logger.exception('Worker failed')
+                error = e
+            with self.lock:
+                self.busy -= 1
+            self.clock.idle_add(self.deliver, callback, result, error)
+
+    def deliver(self, callback, result, error):
+        callback(result, error)
+        return False
+
+    def get_stats(self):
+        return {'workers': len(self.threads),
+                'busy': self.busy,
+                'queued': self.queue.qsize()}
+
+
+class InlineExecutor(object):
+
+    """runs functions right away on the calling thread, used by simulations and benchmarks"""
+
+    def submit(self, function, callback):
+        result = error = None
+        try:
+            result = function()
+        except Exception, e:
+            error = e
+        callback(result, error)
+
+    def get_stats(self):
+        return {'workers': 0, 'busy': 0, 'queued': 0}
@@ -0,0 +1,46 @@
+"""shared fixtures of the unit tests"""
+
+import logging
+
+
+class ManualClock(object):
+
+    """timers that only fire when the test advances the clock"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = {}
+        self.next_source = 1
+
+    def time(self):
+        return 1000.0 + self.now
+
+    def monotonic(self):
+        return self.now
+
+    def timeout_add(self, interval, callback):
+        source = self.next_source
+        self.next_source += 1
+        self.timers[source] = (self.now + interval / 1000.0, callback)
+        return source
+
+    def source_remove(self, source):
+        return self.timers.pop(source, None) is not None
+
+    def advance(self, seconds):
+        self.now += seconds
+        for source, (due, callback) in sorted(self.timers.items()):
+            if due <= self.now and self.timers.pop(source, None) is not None:
+                callback()
+
+
+class RecordingHandler(logging.Handler):
+
+    """keeps the messages of the log records it receives"""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
@@ -0,0 +1,89 @@
+import logging
+import unittest
+
+from tpfancod import actuator, hardware, startup
+from helpers import RecordingHandler
+
+FAN = '/proc/acpi/ibm/fan'
+
+
+class FanActuatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.backend = hardware.FakeBackend(lambda: self.now)
+        self.actuator = actuator.FanActuator(self.backend, FAN, lambda: self.now, 5, 1.0)
+
+    def get_level(self):
+        for line in self.backend.read(FAN).splitlines():
+            if line.startswith('level:'):
+                return line.split()[1]
+
+    def test_level_command(self):
+        self.assertEqual(actuator.level_command(0), 'level 0')
+        self.assertEqual(actuator.level_command(4), 'level 3')
+        self.assertEqual(actuator.level_command(256), 'level full-speed')
+        self.assertTrue(actuator.reached(254, 256))
+
+    def test_first_write(self):
+        self.actuator.set_speed(4, None, 1.0)
+        self.assertEqual(self.backend.commands, [(0.0, 'level 3,watchdog 5')])
+        self.assertEqual(self.get_level(), '3')
+
+    def test_command_trace(self):
+        logger = logging.getLogger('tpfancod')
+        handler = RecordingHandler()
+        logger.addHandler(handler)
+        try:
+            startup.set_log_level(True)
+            self.actuator.set_speed(4, None, 1.0)
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(logging.NOTSET)
+        self.assertTrue('Fan commands: level 3,watchdog 5' in handler.messages)
+
+    def test_suppress(self):
+        self.actuator.set_speed(4, None, 1.0)
+        for tick in range(1, 4):
+            self.now = tick
+            self.actuator.set_speed(4, 4, 1.0)
+        # 3 s after the last write, 2 s are left, enough for 1 s until the next call
+        self.assertEqual(len(self.backend.commands), 1)
+        self.now = 3.5
+        self.actuator.set_speed(4, 4, 1.0)
+        self.assertEqual(self.backend.commands[-1], (3.5, 'watchdog 5'))
+        stats = self.actuator.get_stats()
+        self.assertEqual(stats['level_commands'], 1)
+        self.assertEqual(stats['level_suppressed'], 4)
+        self.assertEqual(stats['watchdog_commands'], 2)
+        self.assertEqual(stats['watchdog_suppressed'], 3)
+
+    def test_level_change_rearms(self):
+        self.actuator.set_speed(4, None, 1.0)
+        self.now = 3.5
+        self.actuator.set_speed(5, 4, 1.0)
+        self.now = 6.0
+        self.assertEqual(self.backend.commands[-1], (3.5, 'level 4'))
+        self.assertEqual(self.get_level(), '4')
+        self.assertEqual(self.backend.fan.expired, 0)
+
+    def test_level_changed_behind_our_back(self):
+        self.actuator.set_speed(4, None, 1.0)
+        self.backend.write(FAN, 'level auto')
+        self.actuator.set_speed(4, 255, 1.0)
+        self.assertEqual(self.backend.commands[-1], (0.0, 'level 3'))
+
+    def test_auto_needs_no_watchdog(self):
+        self.actuator.set_speed(255, None, 4.0)
+        self.now = 30.0
+        self.actuator.set_speed(255, 255, 4.0)
+        self.assertEqual(len(self.backend.commands), 1)
+
+    def test_write_error(self):
+        self.actuator.set_speed(9, None, 1.0)
+        self.assertEqual(self.actuator.get_stats()['errors'], 1)
+        self.assertEqual(self.actuator.speed, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
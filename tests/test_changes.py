@@ -0,0 +1,41 @@
+import unittest
+
+from tpfancod import changes
+
+
+class ChangeFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.changes = changes.ChangeFilter(1000, 2)
+
+    def test_first_reading(self):
+        self.assertTrue(self.changes.check_temperatures({'0': 40}, 0.0))
+
+    def test_threshold(self):
+        self.changes.check_temperatures({'0': 40}, 0.0)
+        self.assertFalse(self.changes.check_temperatures({'0': 41}, 5.0))
+        # drift adds up against the last emitted value
+        self.assertTrue(self.changes.check_temperatures({'0': 42}, 6.0))
+
+    def test_new_sensor(self):
+        self.changes.check_temperatures({'0': 40}, 0.0)
+        self.assertTrue(self.changes.check_temperatures({'0': 40, '1': 30}, 5.0))
+
+    def test_rate_limit(self):
+        self.changes.check_temperatures({'0': 40}, 0.0)
+        self.assertFalse(self.changes.check_temperatures({'0': 50}, 0.5))
+        self.assertTrue(self.changes.check_temperatures({'0': 50}, 1.0))
+
+    def test_fan_state(self):
+        self.changes.check_fan_state({'level': 2, 'rpm': 2000}, 0.0)
+        self.assertFalse(self.changes.check_fan_state({'level': 2, 'rpm': 2050}, 5.0))
+        self.assertTrue(self.changes.check_fan_state({'level': 3, 'rpm': 2050}, 6.0))
+
+    def test_trips(self):
+        self.assertTrue(self.changes.check_trips({}, {}, 0.0))
+        self.assertFalse(self.changes.check_trips({}, {}, 5.0))
+        self.assertTrue(self.changes.check_trips({'0': 48}, {'0': 4}, 6.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tpfancod import clock, control, hardware, settings, simulate
+
+CONFIG = """[General]
+enabled = True
+override_profile = True
+current_profile = profile_test
+"""
+
+PROFILE = """[General]
+comment = test
+product_vendor = LENOVO
+product_name = ThinkPad
+product_id = simulated
+
+[Options]
+hysteresis = 2
+
+[Sensors]
+ibm_thermal_sensor_0 = {'name': 'CPU', 'triggers': {0: 0, 40: 3, 60: 255}}
+"""
+
+
+class HeldExecutor(object):
+
+    """keeps the submitted functions until the test runs them, like a worker that hangs"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, function, callback):
+        self.jobs.append((function, callback))
+
+    def run(self, idx=0):
+        function, callback = self.jobs.pop(idx)
+        callback(function(), None)
+
+    def get_stats(self):
+        return {'workers': 1, 'busy': len(self.jobs), 'queued': 0}
+
+
+class ControlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        config_path = os.path.join(self.root, 'settings.conf')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG)
+        with open(os.path.join(self.root, 'profile_test'), 'w') as f:
+            f.write(PROFILE)
+        self.clock = clock.VirtualClock()
+        self.backend = hardware.FakeBackend(self.clock.monotonic)
+        simulate.ScriptedSensors([(0.0, {'0': 50.0})]).install(
+            self.backend, '/proc/acpi/ibm/thermal')
+        act_settings = settings.Settings(None, None, False, True, False, '1.0.0', config_path,
+                                         'profile_test', '/proc/acpi/ibm/fan',
+                                         '/proc/acpi/ibm/thermal', self.root, 2000, 5,
+                                         backend=self.backend, main_clock=self.clock)
+        self.executor = HeldExecutor()
+        self.controller = control.Control(None, None, act_settings, self.clock, self.executor)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def get_levels(self):
+        return [command for when, command in self.backend.commands if 'level' in command]
+
+    def test_stuck_read_falls_back(self):
+        self.clock.run(0.1)
+        self.executor.run()
+        self.assertEqual(self.backend.fan.level, '2')
+        # the next read hangs in the driver
+        self.clock.run(self.controller.poll_interval / 1000.0)
+        self.assertEqual(len(self.executor.jobs), 1)
+        self.clock.run(self.controller.read_deadline / 1000.0)
+        # the fallback is written by the other worker
+        self.assertEqual(len(self.executor.jobs), 2)
+        self.executor.run(1)
+        self.assertEqual(self.get_levels()[-1], 'level auto')
+        self.assertEqual(self.backend.fan.level, 'auto')
+        # no further reads while the stuck one has not returned
+        self.clock.run(10)
+        self.assertEqual(len(self.executor.jobs), 1)
+        self.assertEqual(self.backend.fan.level, 'auto')
+        # the fan is taken over again once the read returns
+        self.executor.run()
+        while not self.executor.jobs:
+            self.clock.run(0.1)
+        self.executor.run()
+        self.assertEqual(self.backend.fan.level, '2')
+
+    def test_snapshot_keeps_level_read(self):
+        self.clock.run(0.1)
+        self.executor.run()
+        # the fan was still with the EC when it was read
+        self.assertEqual(self.controller.samples.latest().fan_state['level'], 255)
+        self.assertEqual(self.controller.actuator.speed, 3)
+        self.assertEqual(self.controller.history.get_since(0.0)[-1][2], 255)
+
+    def test_profile_change_resets_scheduler(self):
+        for idx in range(3):
+            while not self.executor.jobs:
+                self.clock.run(0.1)
+            self.executor.run()
+        self.assertEqual(self.controller.poll_interval, 4000)
+        self.controller.act_settings.build_sensor_registry()
+        while not self.executor.jobs:
+            self.clock.run(0.1)
+        self.executor.run()
+        # lengthened again from poll_time
+        self.assertEqual(self.controller.poll_interval, 3000)
+
+    def test_inline_poll(self):
+        # at startup the fan is taken over before the main loop runs
+        self.controller.poll_now(inline=True)
+        self.assertEqual(self.executor.jobs, [])
+        self.assertEqual(self.backend.fan.level, '2')
+        self.assertEqual(self.controller.samples.executor, self.executor)
+
+    def test_readings_applied_on_main_loop(self):
+        self.clock.run(0.1)
+        registry = self.controller.act_settings.sensor_registry
+        function, callback = self.executor.jobs.pop()
+        snapshot = function()
+        # the worker only read the sensors
+        self.assertEqual(snapshot.readings, {'0': 50})
+        self.assertEqual(registry.sensors[0].temp, None)
+        self.assertEqual(registry.reads, 0)
+        callback(snapshot, None)
+        self.assertEqual(snapshot.temperatures, {'0': 50})
+        self.assertEqual(registry.sensors[0].temp, 50)
+        self.assertEqual(registry.reads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
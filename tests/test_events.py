@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tpfancod import events, sensors, uevent
+
+
+class FakeMonitor(uevent.UeventMonitor):
+
+    available = True
+
+    def start(self):
+        return self.available
+
+    def stop(self):
+        pass
+
+
+class WatchedAlarmWatcher(events.HwmonAlarmWatcher):
+
+    removed = []
+
+    def add_watch(self, fd):
+        return fd
+
+    def remove_watch(self, source):
+        self.removed.append(source)
+
+
+class SysfsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        # directory that write() and read() refer to
+        self.dir = self.root
+        self.crossings = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content):
+        with open(os.path.join(self.dir, name), 'w') as f:
+            f.write(content + '\n')
+
+    def read(self, name):
+        with open(os.path.join(self.dir, name)) as f:
+            return f.read().strip()
+
+    def get_sensor(self, path):
+        return sensors.Sensor('hwmon/test', sensors.HWMON, path, None, None, 0.001, None)
+
+
+class HwmonAlarmWatcherTestCase(SysfsTestCase):
+
+    def setUp(self):
+        SysfsTestCase.setUp(self)
+        self.write('temp1_input', '45000')
+        self.write('temp1_max', '90000')
+        self.write('temp1_max_hyst', '85000')
+        self.write('temp1_alarm', '0')
+        self.path = os.path.join(self.root, 'temp1_input')
+        WatchedAlarmWatcher.removed = []
+
+    def test_supported(self):
+        self.assertTrue(events.HwmonAlarmWatcher.is_supported(self.path))
+        os.remove(os.path.join(self.root, 'temp1_alarm'))
+        self.assertFalse(events.HwmonAlarmWatcher.is_supported(self.path))
+
+    def test_arm_and_restore(self):
+        watcher = WatchedAlarmWatcher(self.get_sensor(self.path), self.crossings.append)
+        watcher.arm(60, 55)
+        self.assertEqual(self.read('temp1_max'), '60000')
+        self.assertEqual(self.read('temp1_max_hyst'), '55000')
+        # the hysteresis must stay below the alarm temperature
+        watcher.arm(70, None)
+        self.assertEqual(self.read('temp1_max'), '70000')
+        self.assertEqual(self.read('temp1_max_hyst'), '69000')
+        watcher.on_alarm(None, None)
+        self.assertEqual(self.crossings, [watcher.sensor])
+        watcher.close()
+        self.assertEqual(self.read('temp1_max'), '90000')
+        self.assertEqual(self.read('temp1_max_hyst'), '85000')
+        self.assertEqual(WatchedAlarmWatcher.removed, [watcher.source])
+
+    def test_close_keeps_untouched_thresholds(self):
+        watcher = WatchedAlarmWatcher(self.get_sensor(self.path), self.crossings.append)
+        watcher.arm(60, 55)
+        # another tool changed the limit after we gave it back
+        watcher.arm(None, None)
+        self.write('temp1_max', '95000')
+        watcher.close()
+        self.assertEqual(self.read('temp1_max'), '95000')
+
+
+class ThermalZoneWatcherTestCase(SysfsTestCase):
+
+    def setUp(self):
+        SysfsTestCase.setUp(self)
+        self.zone = os.path.join(self.root, 'thermal_zone3')
+        os.mkdir(self.zone)
+        self.dir = self.zone
+        self.write('temp', '45000')
+        self.add_trip(0, 'critical', '99000')
+        self.add_trip(1, 'passive', '95000')
+        self.add_trip(2, 'passive', '00000')
+        self.add_trip(10, 'passive', '00000')
+        self.write('cdev0_trip_point', '1')
+        self.path = os.path.join(self.zone, 'temp')
+        self.saved_monitor = uevent.monitor
+        uevent.monitor = FakeMonitor()
+
+    def tearDown(self):
+        uevent.monitor = self.saved_monitor
+        SysfsTestCase.tearDown(self)
+
+    def add_trip(self, index, trip_type, temp):
+        self.write('trip_point_%d_type' % index, trip_type)
+        self.write('trip_point_%d_temp' % index, temp)
+
+    def test_trip_points(self):
+        # the critical trip and the one of the cooling device are left alone
+        self.assertEqual(events.ThermalZoneWatcher.get_trip_points(self.path),
+                         [os.path.join(self.zone, 'trip_point_2_temp'),
+                          os.path.join(self.zone, 'trip_point_10_temp')])
+
+    def test_unsupported(self):
+        self.write('trip_point_2_type', 'active')
+        self.write('trip_point_10_type', 'hot')
+        self.assertFalse(events.ThermalZoneWatcher.is_supported(self.path))
+        self.assertFalse(events.ThermalZoneWatcher.is_supported(
+            os.path.join(self.zone, 'trip_point_0_temp')))
+
+    def test_arm_and_restore(self):
+        watcher = events.ThermalZoneWatcher(self.get_sensor(self.path), self.crossings.append)
+        watcher.arm(60, 55)
+        self.assertEqual(self.read('trip_point_2_temp'), '60000')
+        self.assertEqual(self.read('trip_point_10_temp'), '55000')
+        self.assertEqual(self.read('trip_point_1_temp'), '95000')
+        watcher.on_uevent({'DEVPATH': '/devices/virtual/thermal/thermal_zone30'})
+        self.assertEqual(self.crossings, [])
+        watcher.on_uevent({'DEVPATH': '/devices/virtual/thermal/thermal_zone3'})
+        self.assertEqual(self.crossings, [watcher.sensor])
+        watcher.close()
+        self.assertEqual(self.read('trip_point_2_temp'), '00000')
+        self.assertEqual(self.read('trip_point_10_temp'), '00000')
+        self.assertEqual(uevent.monitor.callbacks, {})
+
+    def test_without_uevents(self):
+        uevent.monitor.available = False
+        self.assertRaises(IOError, events.ThermalZoneWatcher,
+                          self.get_sensor(self.path), self.crossings.append)
+        self.assertEqual(uevent.monitor.callbacks, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tpfancod import hardware
+from helpers import ManualClock
+
+
+class HangingHandle(hardware.FileHandle):
+
+    """file handle whose reads hang in the driver until the test lets them return"""
+
+    def __init__(self, path, flags):
+        hardware.FileHandle.__init__(self, path, flags)
+        self.reading = threading.Event()
+        self.returning = threading.Event()
+
+    def do_read(self):
+        self.reading.set()
+        self.returning.wait(10)
+        return hardware.FileHandle.do_read(self)
+
+
+class HangingPool(hardware.HandlePool):
+
+    def create_handle(self, path, flags):
+        return HangingHandle(path, flags)
+
+
+class HandlePoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sensor = os.path.join(self.directory, 'temp1_input')
+        with open(self.sensor, 'w') as f:
+            f.write('42000\n')
+        self.pool = hardware.HandlePool()
+
+    def tearDown(self):
+        self.pool.close_all()
+        shutil.rmtree(self.directory)
+
+    def test_reread_without_reopening(self):
+        self.assertEqual(self.pool.read(self.sensor), '42000\n')
+        fd = self.pool.get(self.sensor).fd
+        with open(self.sensor, 'r+') as f:
+            f.write('43000\n')
+        self.assertEqual(self.pool.read(self.sensor), '43000\n')
+        self.assertEqual(self.pool.get(self.sensor).fd, fd)
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, self.pool.read,
+                          os.path.join(self.directory, 'temp2_input'))
+
+    def test_rebuild(self):
+        self.pool.rebuild([self.sensor])
+        self.assertTrue(self.pool.get(self.sensor).fd is not None)
+        self.pool.rebuild([])
+        self.assertEqual(self.pool.handles, {})
+
+    def test_rebuild_during_read(self):
+        self.pool = HangingPool()
+        self.pool.rebuild([self.sensor])
+        handle = self.pool.get(self.sensor)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.pool.read(self.sensor)))
+        thread.start()
+        self.assertTrue(handle.reading.wait(10))
+        # the profile changed while the worker reads
+        self.pool.rebuild([])
+        self.assertEqual(self.pool.handles, {})
+        self.assertTrue(handle.fd is not None)
+        os.fstat(handle.fd)
+        handle.returning.set()
+        thread.join(10)
+        self.assertEqual(results, ['42000\n'])
+        # closed by the worker once it was done
+        self.assertEqual(handle.fd, None)
+        self.assertEqual(self.pool.users, {})
+        self.assertEqual(self.pool.retired, set())
+
+    def test_bad_descriptor_not_closed(self):
+        self.pool.read(self.sensor)
+        handle = self.pool.get(self.sensor)
+        fd = handle.fd
+        os.close(fd)
+        closed = []
+        handle.close = lambda: closed.append(handle.fd)
+        # the number may belong to another file by now, so it is only forgotten
+        self.assertEqual(self.pool.read(self.sensor), '42000\n')
+        self.assertEqual(closed, [])
+        del handle.close
+
+
+class FakeBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.backend = hardware.FakeBackend(lambda: self.now)
+
+    def test_fan_commands(self):
+        self.backend.write('/proc/acpi/ibm/fan', 'watchdog 5')
+        self.backend.write('/proc/acpi/ibm/fan', 'level 3')
+        self.assertTrue('level:\t\t3' in self.backend.read('/proc/acpi/ibm/fan'))
+        self.assertEqual(self.backend.commands,
+                         [(0, 'watchdog 5'), (0, 'level 3')])
+        self.assertRaises(IOError, self.backend.write,
+                          '/proc/acpi/ibm/fan', 'level 9')
+
+    def test_watchdog_expires(self):
+        self.backend.write('/proc/acpi/ibm/fan', 'watchdog 5')
+        self.backend.write('/proc/acpi/ibm/fan', 'level 3')
+        self.now = 5
+        self.assertTrue('level:\t\tauto' in self.backend.read('/proc/acpi/ibm/fan'))
+        self.assertEqual(self.backend.fan.expired, 1)
+
+    def test_scripted_file(self):
+        self.backend.set_file('/sys/temp1_input', lambda now: '%d\n' % (40000 + now))
+        self.now = 3
+        self.assertEqual(self.backend.read('/sys/temp1_input'), '40003\n')
+        self.assertRaises(IOError, self.backend.read, '/sys/temp2_input')
+
+
+
+class ManualExecutor(object):
+
+    """holds submitted functions until the test runs them"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, function, callback):
+        self.jobs.append((function, callback))
+
+    def run_all(self):
+        jobs = self.jobs
+        self.jobs = []
+        for function, callback in jobs:
+            callback(function(), None)
+
+
+class SampleCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = ManualClock()
+        self.taken = 0
+        self.executor = ManualExecutor()
+        self.cache = hardware.SampleCache(self.take_snapshot, self.clock, 1000,
+                                          self.executor, 500)
+        self.received = []
+
+    def take_snapshot(self):
+        self.taken += 1
+        return hardware.Snapshot(self.clock.now)
+
+    def test_max_age(self):
+        self.cache.fetch(self.received.append)
+        self.executor.run_all()
+        first = self.received[0]
+        self.clock.advance(1.0)
+        self.cache.fetch(self.received.append)
+        self.assertTrue(self.received[1] is first)
+        self.clock.advance(0.5)
+        self.cache.fetch(self.received.append)
+        self.executor.run_all()
+        self.assertFalse(self.received[2] is first)
+        self.assertEqual(self.taken, 2)
+        self.assertEqual(self.cache.get_stats(),
+                         {'hits': 1, 'misses': 2, 'refreshes': 2, 'timeouts': 0, 'max_age': 1000})
+
+    def test_refresh_shared(self):
+        self.cache.fetch(self.received.append, force=True)
+        self.cache.fetch(self.received.append)
+        self.executor.run_all()
+        self.assertEqual(self.taken, 1)
+        self.assertTrue(self.received[0] is self.received[1])
+        self.assertTrue(self.cache.latest() is self.received[0])
+
+    def test_apply_before_delivery(self):
+        applied = []
+        self.cache.apply_snapshot = lambda snapshot: applied.append(list(self.received))
+        self.cache.fetch(self.received.append)
+        self.executor.run_all()
+        self.assertEqual(applied, [[]])
+        self.assertEqual(len(self.received), 1)
+
+    def test_timeout(self):
+        self.assertEqual(self.cache.latest().get_level(), None)
+        self.cache.fetch(self.received.append, force=True)
+        self.clock.advance(0.5)
+        self.assertEqual(self.received, [None])
+        self.assertTrue(self.cache.is_stuck())
+        # no second read while the first one is stuck
+        self.cache.fetch(self.received.append, force=True)
+        self.assertEqual(self.received, [None, None])
+        self.assertEqual(len(self.executor.jobs), 1)
+        self.executor.run_all()
+        self.assertFalse(self.cache.is_stuck())
+        self.assertEqual(self.cache.get_stats()['timeouts'], 1)
+        self.cache.fetch(self.received.append)
+        self.assertEqual(self.received[2].timestamp, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
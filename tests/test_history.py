@@ -0,0 +1,71 @@
+import unittest
+
+from tpfancod import history, sensors, triggers
+
+
+def make_sensors(*sensor_ids):
+    table = triggers.TriggerTable({0: 0, 50: 4}, 2)
+    return [sensors.Sensor(sensor_id, sensors.IBM_THERMAL, None, None, idx, 1.0, table)
+            for idx, sensor_id in enumerate(sensor_ids)]
+
+
+class HistoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.history = history.History(3)
+        self.sensors = make_sensors('0', '1')
+
+    def test_empty(self):
+        self.assertEqual(self.history.get_since(0), [])
+
+    def test_sample(self):
+        self.sensors[1].evaluate(55)
+        self.history.append(10.0, {'level': 5, 'rpm': 3000},
+                            {'0': 40, '1': 55}, self.sensors)
+        self.assertEqual(self.history.get_since(0),
+                         [(10.0, {'0': 40, '1': 55}, 5, 3000, {'1': 48}, {'1': 4})])
+
+    def test_missing_values(self):
+        self.history.append(10.0, None, None, self.sensors)
+        self.assertEqual(self.history.get_since(0),
+                         [(10.0, {}, -1, -1, {}, {})])
+
+    def test_wraps_around(self):
+        for when in range(1, 6):
+            self.history.append(float(when), {'level': when, 'rpm': 0},
+                                {'0': when}, self.sensors)
+        samples = self.history.get_since(0)
+        self.assertEqual([sample[0] for sample in samples], [3.0, 4.0, 5.0])
+        self.assertEqual([sample[1] for sample in self.history.get_since(4.0)],
+                         [{'0': 5}])
+
+    def test_sensors_changed(self):
+        self.history.append(1.0, None, {'0': 40}, self.sensors)
+        self.history.append(2.0, None, {'2': 40}, make_sensors('2'))
+        self.assertEqual(self.history.get_since(0),
+                         [(1.0, {'0': 40}, -1, -1, {}, {}),
+                          (2.0, {'2': 40}, -1, -1, {}, {})])
+        # the columns of a sensor are dropped with its last sample
+        for when in range(3, 6):
+            self.history.append(float(when), None, {'2': 41}, make_sensors('2'))
+        self.assertEqual(sorted(self.history.columns), ['2'])
+        self.assertEqual(self.history.get_since(0)[0], (3.0, {'2': 41}, -1, -1, {}, {}))
+
+    def test_sensors_come_back(self):
+        self.history.append(1.0, None, {'0': 40, '1': 41}, self.sensors)
+        self.history.append(2.0, None, {'0': 42}, make_sensors('0'))
+        self.history.append(3.0, None, {'0': 43, '1': 44}, self.sensors)
+        self.assertEqual([sample[1] for sample in self.history.get_since(0)],
+                         [{'0': 40, '1': 41}, {'0': 42}, {'0': 43, '1': 44}])
+
+    def test_throttles(self):
+        self.history.append(1.0, None, None, self.sensors)
+        self.history.append(2.0, None, None, self.sensors, 0)
+        self.history.append(3.0, None, None, self.sensors, 4)
+        self.assertEqual(self.history.get_throttles_since(0),
+                         [(2.0, 0), (3.0, 4)])
+        self.assertEqual(self.history.get_throttles_since(2.0), [(3.0, 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
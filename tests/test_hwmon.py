@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tpfancod import hwmon
+
+
+class HwmonIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.devices = os.path.join(self.root, 'devices')
+        self.class_dir = os.path.join(self.root, 'class')
+        os.makedirs(self.class_dir)
+        self.coretemp = self.add_hwmon('hwmon3', 'platform/coretemp.0', 'coretemp',
+                                       {'temp1': 'Package id 0', 'temp2': 'Core 0'})
+        self.add_hwmon('hwmon0', 'virtual/thermal/thermal_zone0', 'acpitz',
+                       {'temp1': None})
+        self.add_hwmon('hwmon1', 'virtual/thermal/thermal_zone1', 'acpitz',
+                       {'temp1': None})
+        self.index = hwmon.HwmonIndex(self.class_dir, self.devices)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def add_hwmon(self, hwmon_name, device, driver, inputs):
+        path = os.path.join(self.devices, device, 'hwmon', hwmon_name)
+        os.makedirs(path)
+        with open(os.path.join(path, 'name'), 'w') as f:
+            f.write(driver + '\n')
+        for name, label in inputs.items():
+            with open(os.path.join(path, name + '_input'), 'w') as f:
+                f.write('45000\n')
+            if label is not None:
+                with open(os.path.join(path, name + '_label'), 'w') as f:
+                    f.write(label + '\n')
+        os.symlink(path, os.path.join(self.class_dir, hwmon_name))
+        return os.path.realpath(path)
+
+    def test_keys(self):
+        path = os.path.join(self.coretemp, 'temp1_input')
+        self.assertEqual(self.index.resolve('hwmon/coretemp/Package id 0'), path)
+        self.assertEqual(self.index.resolve('hwmon/coretemp/temp1'), path)
+        self.assertEqual(self.index.resolve('hwmon/platform/coretemp.0/temp1'), path)
+        self.assertEqual(self.index.get_key(path), 'hwmon/coretemp/Package id 0')
+
+    def test_ambiguous(self):
+        self.assertEqual(self.index.resolve('hwmon/acpitz/temp1'), None)
+        self.assertTrue(self.index.resolve(
+            'hwmon/virtual/thermal/thermal_zone1/temp1').endswith('hwmon1/temp1_input'))
+
+    def test_cpu_sensor(self):
+        self.assertEqual(self.index.find_cpu_sensor(), 'hwmon/coretemp/Package id 0')
+
+    def test_rescan(self):
+        self.add_hwmon('hwmon4', 'platform/thinkpad_hwmon', 'thinkpad', {'temp1': None})
+        calls = []
+        self.index.listeners.append(lambda: calls.append(True))
+        self.index.on_uevent({'ACTION': 'add', 'DEVPATH': '/devices/platform/thinkpad_hwmon'})
+        self.assertEqual(calls, [True])
+        self.assertNotEqual(self.index.resolve('hwmon/thinkpad/temp1'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from tpfancod import hardware, load, triggers
+
+PRESSURE = ('some avg10=%s avg60=1.00 avg300=0.50 total=123456\n'
+            'full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+
+
+def stat(busy, idle):
+    return ('cpu  %d 0 0 %d 0 0 0 0 0 0\n'
+            'cpu0 %d 0 0 %d 0 0 0 0 0 0\n' % (busy, idle, busy, idle))
+
+
+class ParseTestCase(unittest.TestCase):
+
+    def test_parse_stat(self):
+        content = 'cpu  100 5 20 800 30 1 2 3 40 0\nintr 1 2 3\n'
+        self.assertEqual(load.parse_stat(content), (131, 961))
+
+    def test_parse_pressure(self):
+        self.assertEqual(load.parse_pressure(PRESSURE % '12.34'), 12.34)
+        self.assertRaises(ValueError, load.parse_pressure, 'full avg10=1.00\n')
+
+
+class LoadMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = hardware.FakeBackend(lambda: 0.0)
+        self.backend.set_file(load.STAT, stat(0, 0))
+        self.backend.set_file(load.PRESSURE, PRESSURE % '0.00')
+        self.tables = triggers.compile_trigger_points(
+            {'utilization': {0: 0, 70: 3, 90: 5},
+             'pressure': {0: 0, 20: 4}}, 5)
+        self.monitor = load.LoadMonitor(self.tables, self.backend)
+
+    def test_utilization_needs_two_samples(self):
+        self.assertEqual(self.monitor.read(), {'pressure': 0})
+        self.backend.set_file(load.STAT, stat(75, 25))
+        self.assertEqual(self.monitor.read(), {'utilization': 75, 'pressure': 0})
+
+    def test_evaluate_with_hysteresis(self):
+        self.monitor.read()
+        self.backend.set_file(load.STAT, stat(95, 5))
+        self.monitor.read()
+        self.assertEqual(self.monitor.evaluate(), 5)
+        # below the trigger but not below the release load
+        self.backend.set_file(load.STAT, stat(183, 17))
+        self.monitor.read()
+        self.assertEqual(self.monitor.evaluate(), 5)
+        self.backend.set_file(load.STAT, stat(263, 37))
+        self.monitor.read()
+        self.assertEqual(self.monitor.evaluate(), 3)
+        self.assertEqual(self.monitor.get_trip_fan_speeds(), {'utilization': 3})
+
+    def test_pressure(self):
+        self.backend.set_file(load.PRESSURE, PRESSURE % '25.60')
+        self.monitor.read()
+        self.assertEqual(self.monitor.evaluate(), 4)
+
+    def test_missing_pressure(self):
+        del self.backend.files[load.PRESSURE]
+        self.assertEqual(self.monitor.read(), {})
+        self.assertEqual(self.monitor.errors, 1)
+        self.assertEqual(self.monitor.evaluate(), 0)
+
+    def test_rebuild_keeps_state(self):
+        self.monitor.read()
+        self.backend.set_file(load.STAT, stat(95, 5))
+        self.monitor.read()
+        self.monitor.evaluate()
+        monitor = load.LoadMonitor(self.tables, self.backend, self.monitor)
+        self.assertEqual(monitor.get_trip_fan_speeds(), {'utilization': 5})
+        self.backend.set_file(load.STAT, stat(185, 15))
+        self.assertEqual(monitor.read()['utilization'], 90)
+
+    def test_no_inputs(self):
+        monitor = load.LoadMonitor({}, self.backend)
+        self.assertEqual(monitor.read(), {})
+        self.assertEqual(monitor.evaluate(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from tpfancod import persist
+from helpers import ManualClock
+
+
+class WriteAtomicallyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'settings.conf')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_replace(self):
+        with open(self.path, 'w') as f:
+            f.write('old')
+        os.chmod(self.path, 0600)
+        persist.write_atomically(self.path, 'new')
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'new')
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0600)
+        self.assertEqual(os.listdir(self.root), ['settings.conf'])
+
+
+class WriteBehindTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = ManualClock()
+        self.writes = 0
+        self.result = True
+        self.persistence = persist.WriteBehind(self.clock, self.write, 2000, 5000)
+
+    def write(self):
+        self.writes += 1
+        return self.result
+
+    def test_debounce(self):
+        for _ in range(3):
+            self.persistence.schedule()
+            self.clock.advance(1)
+        self.assertEqual(self.writes, 0)
+        self.assertTrue(self.persistence.pending)
+        self.clock.advance(1)
+        self.assertEqual(self.writes, 1)
+        self.assertEqual(self.persistence.get_state(), (False, 1004.0, 1, ''))
+
+    def test_max_delay(self):
+        for _ in range(6):
+            self.persistence.schedule()
+            self.clock.advance(1)
+        self.assertEqual(self.writes, 1)
+
+    def test_flush(self):
+        self.assertTrue(self.persistence.flush())
+        self.assertEqual(self.writes, 0)
+        self.persistence.schedule()
+        self.persistence.flush()
+        self.assertEqual(self.writes, 1)
+        self.assertEqual(self.clock.timers, {})
+
+    def test_failed_write_stays_pending(self):
+        self.result = False
+        self.persistence.schedule()
+        self.clock.advance(2)
+        self.assertTrue(self.persistence.pending)
+        self.result = True
+        self.clock.advance(2)
+        self.assertFalse(self.persistence.pending)
+        self.assertEqual(self.writes, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
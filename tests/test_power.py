@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tpfancod import power
+
+
+class PowerMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.supplies = os.path.join(self.directory, 'power_supply')
+        self.platform = os.path.join(self.directory, 'platform')
+        os.makedirs(self.supplies)
+        os.makedirs(self.platform)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, path, content):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content + '\n')
+
+    def add_supply(self, name, supply_type, online=None):
+        self.write(os.path.join(self.supplies, name, 'type'), supply_type)
+        if online is not None:
+            self.write(os.path.join(self.supplies, name, 'online'), online)
+
+    def create_monitor(self):
+        return power.PowerMonitor(self.supplies, self.platform)
+
+    def test_sources(self):
+        self.add_supply('BAT0', 'Battery')
+        self.add_supply('AC', 'Mains', '1')
+        self.assertEqual(self.create_monitor().source, power.AC)
+        self.add_supply('AC', 'Mains', '0')
+        self.assertEqual(self.create_monitor().source, power.BATTERY)
+        # usb power delivery counts as external power
+        self.add_supply('ucsi-source-psy-USBC000:001', 'USB', '1')
+        self.assertEqual(self.create_monitor().source, power.AC)
+        self.write(os.path.join(self.platform, 'dock.0', 'docked'), '1')
+        self.assertEqual(self.create_monitor().source, power.DOCKED)
+
+    def test_no_external_supply(self):
+        self.assertEqual(self.create_monitor().source, power.AC)
+
+    def test_update(self):
+        self.add_supply('AC', 'Mains', '1')
+        monitor = self.create_monitor()
+        changes = []
+        monitor.listeners.append(changes.append)
+        monitor.update()
+        self.add_supply('AC', 'Mains', '0')
+        monitor.on_uevent({'SUBSYSTEM': 'platform',
+                           'DEVPATH': '/devices/platform/thinkpad_acpi'})
+        self.assertEqual(changes, [])
+        monitor.on_uevent({'SUBSYSTEM': 'power_supply',
+                           'DEVPATH': '/devices/LNXSYSTM:00/ACPI0003:00/power_supply/AC'})
+        self.assertEqual(changes, [power.BATTERY])
+        self.write(os.path.join(self.platform, 'dock.0', 'docked'), '1')
+        monitor.on_uevent({'SUBSYSTEM': 'platform', 'DEVPATH': '/devices/platform/dock.0'})
+        self.assertEqual(changes, [power.BATTERY, power.DOCKED])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tpfancod import profiledb
+
+PROFILE = """[General]
+product_vendor = LENOVO
+product_name = %s
+"""
+
+
+def read_profile(path):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    return {'status': True,
+            'file_path': path,
+            'product_pretty_vendor': lines[1].split(' = ')[1],
+            'product_pretty_name': lines[2].split(' = ')[1],
+            'trigger_points': {'0': {0: 0, 50: 2}}}
+
+
+class ProfileDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.profile_dir = os.path.join(self.root, 'profiles')
+        os.mkdir(self.profile_dir)
+        for product_id, name in [('lenovo_7459gh6', 'ThinkPad X200'),
+                                 ('lenovo_7454cto', 'ThinkPad X200'),
+                                 ('lenovo_2516cto', 'ThinkPad T500')]:
+            with open(os.path.join(self.profile_dir, product_id), 'w') as f:
+                f.write(PROFILE % name)
+        self.db_path = os.path.join(self.root, 'profiles.db')
+        self.assertEqual(profiledb.build(self.profile_dir, self.db_path, read_profile), 3)
+        self.db = profiledb.ProfileDatabase(self.db_path)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.root)
+
+    def test_id_match(self):
+        matches = self.db.lookup('lenovo_7459gh6', 'lenovo_thinkpad_x200')
+        self.assertEqual([(kind, match_id) for kind, record, match_id in matches],
+                         [('id', 'lenovo_7459gh6'), ('name', 'lenovo_7454cto'),
+                          ('prefix', 'lenovo_2516cto')])
+        profile = self.db.load(matches[0][1])
+        self.assertEqual(profile['product_pretty_name'], 'ThinkPad X200')
+        self.assertEqual(profile['trigger_points'], {'0': {0: 0, 50: 2}})
+
+    def test_uppercase_file_name(self):
+        with open(os.path.join(self.profile_dir, 'LENOVO_4236A12'), 'w') as f:
+            f.write(PROFILE % 'ThinkPad T420')
+        profiledb.build(self.profile_dir, self.db_path, read_profile)
+        db = profiledb.ProfileDatabase(self.db_path)
+        try:
+            matches = db.lookup('lenovo_4236a12', 'lenovo_thinkpad_t420')
+        finally:
+            db.close()
+        self.assertEqual(matches[0][0], 'id')
+        # the file name is kept, so the profile can be opened
+        self.assertEqual(matches[0][2], 'LENOVO_4236A12')
+        self.assertTrue(os.path.isfile(os.path.join(self.profile_dir, matches[0][2])))
+
+    def test_fallback(self):
+        matches = self.db.lookup('lenovo_0000aaa', 'lenovo_thinkpad_t500')
+        self.assertEqual(matches[0][0], 'name')
+        self.assertEqual(matches[0][2], 'lenovo_2516cto')
+
+    def test_no_match(self):
+        self.assertEqual(self.db.lookup('ibm_0000aaa', 'ibm_thinkpad_r40'), [])
+
+    def test_not_a_database(self):
+        with open(self.db_path, 'w') as f:
+            f.write('[General]\n' * 10)
+        self.assertRaises(ValueError, profiledb.ProfileDatabase, self.db_path)
+
+    def test_fingerprint(self):
+        self.assertEqual(self.db.fingerprint, profiledb.fingerprint(self.profile_dir))
+        self.assertEqual(os.listdir(self.root), ['profiles', 'profiles.db'])
+
+    def test_fingerprint_of_edited_profile(self):
+        path = os.path.join(self.profile_dir, 'lenovo_2516cto')
+        mtime = os.path.getmtime(self.profile_dir)
+        with open(path, 'a') as f:
+            f.write('[Sensors]\n')
+        # editing in place leaves the directory alone
+        os.utime(self.profile_dir, (mtime, mtime))
+        self.assertNotEqual(self.db.fingerprint, profiledb.fingerprint(self.profile_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
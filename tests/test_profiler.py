@@ -0,0 +1,51 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from tpfancod import profiler
+from helpers import ManualClock
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.clock = ManualClock()
+        self.profiler = profiler.Profiler(self.clock, os.path.join(self.root, 'run'))
+
+    def tearDown(self):
+        self.profiler.stop()
+        shutil.rmtree(self.root)
+
+    def test_window(self):
+        self.assertTrue(self.profiler.start(10))
+        self.assertFalse(self.profiler.start(10))
+        self.profiler.on_sample(None, sys._getframe())
+        self.clock.advance(4)
+        self.assertEqual(self.profiler.get_state()[:2], (True, 6.0))
+        self.clock.advance(6)
+        running, left, path = self.profiler.get_state()
+        self.assertFalse(running)
+        self.assertTrue(os.path.isfile(path))
+        with open(path) as f:
+            self.assertTrue('1 samples' in f.read())
+
+    def test_stop_early(self):
+        self.assertEqual(self.profiler.stop(), '')
+        self.profiler.start(0)
+        self.assertEqual(self.profiler.duration, 1)
+        path = self.profiler.stop()
+        self.assertTrue(path.startswith(os.path.join(self.root, 'run', 'profile-')))
+        self.assertEqual(self.clock.timers, {})
+
+    def test_report(self):
+        self.profiler.start(60)
+        self.profiler.on_sample(None, sys._getframe())
+        report = self.profiler.get_report()
+        self.assertTrue(any('test_report' in line for line in report))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from tpfancod import profiles
+
+
+class Holder(object):
+    pass
+
+
+class ResidentProfileTestCase(unittest.TestCase):
+
+    def test_capture_and_restore(self):
+        settings = Holder()
+        settings.hysteresis = 2
+        settings.trigger_points = {'0': {0: 0, 50: 4}}
+        settings.other = 'kept'
+        profile = profiles.ResidentProfile('profile_battery')
+        profile.capture(settings, ['hysteresis', 'trigger_points'])
+        settings.hysteresis = 5
+        settings.trigger_points = {}
+        settings.other = 'changed'
+        profile.restore(settings)
+        self.assertEqual(settings.hysteresis, 2)
+        self.assertEqual(settings.trigger_points, {'0': {0: 0, 50: 4}})
+        self.assertEqual(settings.other, 'changed')
+
+
+if __name__ == '__main__':
+    unittest.main()
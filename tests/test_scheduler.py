@@ -0,0 +1,54 @@
+import unittest
+
+from tpfancod import scheduler
+
+
+class AdaptiveSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = scheduler.AdaptiveScheduler(2000)
+
+    def next_interval(self, now, temps, headroom, aggressiveness=2):
+        return self.scheduler.next_interval(now, temps, headroom, 2000, 500, 4000, aggressiveness)
+
+    def test_slope(self):
+        self.assertEqual(self.scheduler.get_slope(10.0, {'cpu': 50.0}), 0.0)
+        self.assertEqual(self.scheduler.get_slope(12.0, {'cpu': 54.0, 'gpu': 40.0}), 2.0)
+        # a sensor without history does not contribute
+        self.assertEqual(self.scheduler.get_slope(14.0, {'cpu': 54.0, 'gpu': 40.0}), 0.0)
+
+    def test_slope_ignores_falling_temperatures(self):
+        self.scheduler.get_slope(10.0, {'cpu': 60.0})
+        self.assertEqual(self.scheduler.get_slope(11.0, {'cpu': 55.0}), 0.0)
+
+    def test_slope_ignores_clock_standing_still(self):
+        self.scheduler.get_slope(10.0, {'cpu': 50.0})
+        self.assertEqual(self.scheduler.get_slope(10.0, {'cpu': 60.0}), 0.0)
+
+    def test_disabled(self):
+        self.assertEqual(self.next_interval(10.0, {'cpu': 50.0}, None, 0), 2000)
+        self.assertEqual(self.next_interval(12.0, {'cpu': 50.0}, None, 0), 2000)
+
+    def test_lengthens_gradually(self):
+        self.assertEqual(self.next_interval(10.0, {'cpu': 50.0}, None), 3000)
+        self.assertEqual(self.next_interval(13.0, {'cpu': 50.0}, None), 4000)
+        self.assertEqual(self.next_interval(17.0, {'cpu': 50.0}, None), 4000)
+
+    def test_at_trigger_point(self):
+        self.assertEqual(self.next_interval(10.0, {'cpu': 50.0}, 0.5), 500)
+
+    def test_shortens_immediately_when_rising(self):
+        self.assertEqual(self.next_interval(10.0, {'cpu': 50.0}, 10.0), 3000)
+        # 1 K/s with 4 K left: 4000 ms divided by 1 + aggressiveness / 2
+        self.assertEqual(self.next_interval(13.0, {'cpu': 53.0}, 4.0), 2000)
+
+    def test_reset(self):
+        self.next_interval(10.0, {'cpu': 50.0}, None)
+        self.scheduler.reset(1000)
+        self.assertEqual(self.scheduler.interval, 1000)
+        self.assertEqual(self.scheduler.last_time, None)
+        self.assertEqual(self.scheduler.last_temps, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
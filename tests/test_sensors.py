@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tpfancod import hardware, sensors, triggers
+
+
+class SensorRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.ibm_thermal = os.path.join(self.directory, 'thermal')
+        self.hwmon = os.path.join(self.directory, 'temp1_input')
+        self.write(self.ibm_thermal, 'temperatures:\t45 -128 0\n')
+        self.write(self.hwmon, '52000\n')
+        self.handles = hardware.HandlePool()
+        trigger_points = {'0': {0: 0, 40: 2, 50: 4},
+                          '1': {0: 255},
+                          self.hwmon: {0: 0, 50: 3}}
+        self.registry = sensors.SensorRegistry(
+            triggers.compile_trigger_points(trigger_points, 2),
+            {self.hwmon: 0.001}, self.ibm_thermal, self.handles)
+
+    def tearDown(self):
+        self.handles.close_all()
+        shutil.rmtree(self.directory)
+
+    def write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_read(self):
+        self.assertEqual(self.registry.read(),
+                         {'0': 45, '1': -128, self.hwmon: 52})
+
+    def test_evaluate_with_hysteresis(self):
+        self.registry.read()
+        self.assertEqual(self.registry.evaluate(), 3)
+        self.assertEqual(self.registry.get_trip_temperatures(),
+                         {'0': 38, self.hwmon: 48})
+        # falling below the trigger but not below the release temperature
+        self.write(self.hwmon, '49000\n')
+        self.registry.read()
+        self.assertEqual(self.registry.evaluate(), 3)
+        self.write(self.hwmon, '47000\n')
+        self.registry.read()
+        self.assertEqual(self.registry.evaluate(), 2)
+
+    def test_missing_hwmon_sensor(self):
+        os.remove(self.hwmon)
+        self.assertRaises(IOError, self.registry.read)
+
+
+class SensorIntervalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.ibm_thermal = os.path.join(self.directory, 'thermal')
+        self.hwmon = os.path.join(self.directory, 'temp1_input')
+        self.write(self.ibm_thermal, 'temperatures:\t45 50\n')
+        self.write(self.hwmon, '52000\n')
+        self.handles = hardware.HandlePool()
+        trigger_points = {'0': {0: 0, 40: 2},
+                          '1': {0: 0},
+                          self.hwmon: {0: 0, 50: 3}}
+        self.tables = triggers.compile_trigger_points(trigger_points, 2)
+        self.registry = sensors.SensorRegistry(
+            self.tables, {self.hwmon: 0.001}, self.ibm_thermal, self.handles,
+            intervals={'0': 10000, '1': 20000})
+
+    def tearDown(self):
+        self.handles.close_all()
+        shutil.rmtree(self.directory)
+
+    def write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_due(self):
+        self.assertEqual(self.registry.read(0.0), {'0': 45, '1': 50, self.hwmon: 52})
+        self.write(self.ibm_thermal, 'temperatures:\t60 61\n')
+        self.write(self.hwmon, '53000\n')
+        # ibm_thermal is not due yet, its last readings are reused
+        self.assertEqual(self.registry.read(5.0), {'0': 45, '1': 50, self.hwmon: 53})
+        self.assertEqual(self.registry.skipped_reads, 1)
+        # one due sensor reads the whole file
+        self.assertEqual(self.registry.read(10.0), {'0': 60, '1': 61, self.hwmon: 53})
+        self.assertEqual(self.registry.reads, 5)
+
+    def test_without_time(self):
+        self.registry.read(0.0)
+        self.write(self.ibm_thermal, 'temperatures:\t60 61\n')
+        self.assertEqual(self.registry.read()['0'], 60)
+
+    def test_rebuild_keeps_schedule(self):
+        self.registry.read(0.0)
+        registry = sensors.SensorRegistry(
+            self.tables, {self.hwmon: 0.001}, self.ibm_thermal, self.handles,
+            self.registry, intervals={'0': 10000, '1': 20000})
+        self.write(self.ibm_thermal, 'temperatures:\t60 61\n')
+        self.assertEqual(registry.read(5.0)['0'], 45)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import logging
+import unittest
+
+from tpfancod import startup
+from helpers import RecordingHandler
+
+
+class StartupPhasesTestCase(unittest.TestCase):
+
+    def test_phases(self):
+        phases = startup.StartupPhases()
+        phases.begin('arguments')
+        phases.begin('load')
+        phases.end()
+        phases.end()
+        self.assertEqual([name for name, duration in phases.get_phases()],
+                         ['arguments', 'load'])
+
+    def test_finish(self):
+        phases = startup.StartupPhases()
+        phases.begin('dbus')
+        phases.finish()
+        res = phases.get_phases()
+        self.assertEqual([name for name, duration in res], ['dbus', 'total'])
+        self.assertTrue(res[1][1] >= res[0][1] >= 0.0)
+
+
+class LogLevelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('tpfancod')
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(logging.NOTSET)
+
+    def run_phase(self):
+        phases = startup.StartupPhases()
+        phases.begin('load')
+        phases.end()
+
+    def test_debug(self):
+        startup.set_log_level(True)
+        self.run_phase()
+        self.assertEqual(len(self.handler.messages), 1)
+        self.assertTrue(self.handler.messages[0].startswith('Startup phase load took '))
+
+    def test_quiet(self):
+        startup.set_log_level(False)
+        self.run_phase()
+        self.assertEqual(self.handler.messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from tpfancod import stats
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_empty(self):
+        res = stats.Histogram().to_dict()
+        self.assertEqual(res['count'], 0.0)
+        self.assertEqual(res['p99_us'], 0.0)
+
+    def test_percentiles(self):
+        histogram = stats.Histogram()
+        for _ in range(90):
+            histogram.add(0.000015)
+        for _ in range(10):
+            histogram.add(0.003)
+        res = histogram.to_dict()
+        self.assertEqual(res['count'], 100.0)
+        self.assertAlmostEqual(res['min_us'], 15.0)
+        self.assertAlmostEqual(res['max_us'], 3000.0)
+        self.assertEqual(res['p50_us'], 20.0)
+        self.assertEqual(res['p99_us'], 3000.0)
+        self.assertEqual(res['le_20_us'], 90.0)
+        self.assertEqual(res['le_5000_us'], 10.0)
+
+    def test_overflow(self):
+        histogram = stats.Histogram()
+        histogram.add(60.0)
+        self.assertEqual(histogram.to_dict()['le_inf_us'], 1.0)
+
+
+class PollStatsTestCase(unittest.TestCase):
+
+    def test_reset(self):
+        poll_stats = stats.PollStats()
+        poll_stats.add('cycle', 0.001)
+        self.assertEqual(poll_stats.to_dict()['cycle']['count'], 1.0)
+        poll_stats.reset()
+        self.assertEqual(poll_stats.to_dict()['cycle']['count'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
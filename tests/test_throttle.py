@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tpfancod import hardware, throttle
+
+
+class FindCountersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add_cpu(self, cpu, package_id, count=0):
+        cpu_dir = os.path.join(self.directory, 'cpu' + str(cpu))
+        os.makedirs(os.path.join(cpu_dir, 'thermal_throttle'))
+        os.makedirs(os.path.join(cpu_dir, 'topology'))
+        for name, content in [('thermal_throttle/' + throttle.CORE, str(count)),
+                              ('thermal_throttle/' + throttle.PACKAGE, str(count)),
+                              ('topology/physical_package_id', str(package_id))]:
+            with open(os.path.join(cpu_dir, name), 'w') as f:
+                f.write(content + '\n')
+        return cpu_dir
+
+    def test_package_counter_once_per_package(self):
+        for cpu, package_id in [(0, 0), (1, 0), (10, 1), (2, 1)]:
+            self.add_cpu(cpu, package_id)
+        os.makedirs(os.path.join(self.directory, 'cpufreq'))
+        paths = [os.path.relpath(path, self.directory)
+                 for path in throttle.find_counters(self.directory)]
+        self.assertEqual(paths, ['cpu0/thermal_throttle/core_throttle_count',
+                                 'cpu0/thermal_throttle/package_throttle_count',
+                                 'cpu1/thermal_throttle/core_throttle_count',
+                                 'cpu2/thermal_throttle/core_throttle_count',
+                                 'cpu2/thermal_throttle/package_throttle_count',
+                                 'cpu10/thermal_throttle/core_throttle_count'])
+
+    def test_read(self):
+        self.add_cpu(0, 0, 3)
+        self.add_cpu(1, 0, 4)
+        handles = hardware.HandlePool()
+        counters = throttle.ThrottleCounters(throttle.find_counters(self.directory), handles)
+        self.assertEqual(counters.read(), 10)
+        with open(counters.paths[0], 'w') as f:
+            f.write('garbage\n')
+        self.assertEqual(counters.read(), None)
+        handles.close_all()
+
+    def test_no_counters(self):
+        counters = throttle.ThrottleCounters([], hardware.HandlePool())
+        self.assertEqual(counters.read(), None)
+
+
+class LadderTestCase(unittest.TestCase):
+
+    def test_escalate(self):
+        self.assertEqual(throttle.escalate(0), 2)
+        self.assertEqual(throttle.escalate(4), 5)
+        self.assertEqual(throttle.escalate(8), 256)
+        self.assertEqual(throttle.escalate(255), 256)
+        self.assertEqual(throttle.escalate(256), 256)
+
+    def test_relax(self):
+        self.assertEqual(throttle.relax(256), 8)
+        self.assertEqual(throttle.relax(5), 4)
+        self.assertEqual(throttle.relax(2), 0)
+
+    def test_apply_floor(self):
+        self.assertEqual(throttle.apply_floor(3, 0), 3)
+        self.assertEqual(throttle.apply_floor(3, 5), 5)
+        self.assertEqual(throttle.apply_floor(6, 5), 6)
+        self.assertEqual(throttle.apply_floor(255, 5), 255)
+        self.assertEqual(throttle.apply_floor(255, 256), 256)
+
+
+class ThrottleGovernorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.governor = throttle.ThrottleGovernor()
+
+    def test_update(self):
+        self.assertEqual(self.governor.update(100), None)
+        self.assertEqual(self.governor.update(103), 3)
+        self.assertEqual(self.governor.update(103), 0)
+        # a cpu came back online with a fresh counter
+        self.assertEqual(self.governor.update(50), 0)
+        self.assertEqual(self.governor.update(None), None)
+        self.assertEqual(self.governor.update(60), None)
+        self.assertEqual(self.governor.get_stats(),
+                         {'events': 3, 'intervals': 3, 'throttled_intervals': 1,
+                          'escalations': 0, 'floor': 0})
+
+    def test_escalate_and_relax(self):
+        self.assertEqual(self.governor.adjust(3, 2, 0.0, 10000), 4)
+        # still throttling, one more level
+        self.assertEqual(self.governor.adjust(3, 1, 1.0, 10000), 5)
+        # the profile requires more than the escalation
+        self.assertEqual(self.governor.adjust(6, 0, 2.0, 10000), 6)
+        self.assertEqual(self.governor.adjust(3, 0, 10.0, 10000), 5)
+        self.assertEqual(self.governor.adjust(3, 0, 11.0, 10000), 4)
+        self.assertEqual(self.governor.adjust(3, 0, 15.0, 10000), 4)
+        self.assertEqual(self.governor.adjust(3, 0, 21.0, 10000), 3)
+        self.assertEqual(self.governor.adjust(3, 0, 31.0, 10000), 3)
+        self.assertEqual(self.governor.adjust(3, 0, 41.0, 10000), 3)
+        self.assertEqual(self.governor.floor, 0)
+        self.assertEqual(self.governor.escalations, 2)
+
+    def test_reset(self):
+        self.governor.adjust(3, 1, 0.0, 10000)
+        self.governor.reset()
+        self.assertEqual(self.governor.adjust(3, 0, 1.0, 10000), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
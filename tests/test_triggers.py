@@ -0,0 +1,28 @@
+import unittest
+
+from tpfancod import triggers
+
+
+class TriggerTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.table = triggers.TriggerTable({0: 0, 40: 2, 52: 3, 45: 1, 60: 255}, 2)
+
+    def test_below_all_triggers(self):
+        table = triggers.TriggerTable({40: 2}, 2)
+        self.assertEqual(table.lookup(39), None)
+
+    def test_lookup(self):
+        self.assertEqual(self.table.lookup(10), (0, -2))
+        self.assertEqual(self.table.lookup(40), (2, 38))
+        self.assertEqual(self.table.lookup(51), (2, 38))
+        self.assertEqual(self.table.lookup(52), (3, 50))
+        self.assertEqual(self.table.lookup(90), (255, 58))
+
+    def test_compile(self):
+        tables = triggers.compile_trigger_points({'0': {0: 255}}, 2)
+        self.assertEqual(tables['0'].lookup(30), (255, -2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import socket
+import unittest
+
+from tpfancod import uevent
+
+
+class SocketMonitor(uevent.UeventMonitor):
+
+    """reads the uevents from one end of a socket pair instead of netlink"""
+
+    def start(self):
+        if self.sock is None:
+            self.sock, self.peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.source = self.add_watch(self.sock.fileno())
+        return True
+
+    def add_watch(self, fd):
+        return fd
+
+    def remove_watch(self, source):
+        self.peer.close()
+
+
+class ParseUeventTestCase(unittest.TestCase):
+
+    def test_kernel_message(self):
+        properties = uevent.parse_uevent(
+            'change@/devices/virtual/thermal/thermal_zone0\0ACTION=change\0'
+            'DEVPATH=/devices/virtual/thermal/thermal_zone0\0SUBSYSTEM=thermal\0SEQNUM=1234\0')
+        self.assertEqual(properties, {'ACTION': 'change',
+                                      'DEVPATH': '/devices/virtual/thermal/thermal_zone0',
+                                      'SUBSYSTEM': 'thermal', 'SEQNUM': '1234'})
+
+    def test_header_only(self):
+        properties = uevent.parse_uevent('add@/devices/platform/thinkpad_hwmon\0SUBSYSTEM=hwmon')
+        self.assertEqual(properties['ACTION'], 'add')
+        self.assertEqual(properties['DEVPATH'], '/devices/platform/thinkpad_hwmon')
+
+
+class UeventMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = SocketMonitor()
+        self.events = []
+
+    def tearDown(self):
+        self.monitor.stop()
+
+    def send(self, message):
+        self.monitor.peer.send(message)
+        self.monitor.on_readable(self.monitor.source, None)
+
+    def test_dispatch_by_subsystem(self):
+        self.assertTrue(self.monitor.subscribe('thermal', self.events.append))
+        self.send('change@/devices/virtual/thermal/thermal_zone0\0SUBSYSTEM=thermal\0')
+        self.send('change@/devices/platform/thinkpad_hwmon\0SUBSYSTEM=hwmon\0')
+        self.assertEqual([event['DEVPATH'] for event in self.events],
+                         ['/devices/virtual/thermal/thermal_zone0'])
+
+    def test_unsubscribe_stops(self):
+        self.monitor.subscribe('thermal', self.events.append)
+        self.monitor.subscribe('power_supply', self.events.append)
+        self.monitor.unsubscribe('thermal', self.events.append)
+        self.assertNotEqual(self.monitor.sock, None)
+        self.monitor.unsubscribe('power_supply', self.events.append)
+        self.assertEqual(self.monitor.sock, None)
+        self.assertEqual(self.monitor.source, None)
+        self.assertEqual(self.monitor.callbacks, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
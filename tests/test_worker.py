@@ -0,0 +1,57 @@
+import Queue
+import unittest
+
+from tpfancod import worker
+
+
+class QueueClock(object):
+
+    """hands idle callbacks from the workers to the test thread"""
+
+    def __init__(self):
+        self.idle = Queue.Queue()
+
+    def idle_add(self, callback, *args):
+        self.idle.put((callback, args))
+
+    def dispatch(self):
+        callback, args = self.idle.get(timeout=5)
+        callback(*args)
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = QueueClock()
+        self.pool = worker.WorkerPool(self.clock)
+        self.results = []
+
+    def on_done(self, result, error):
+        self.results.append((result, error))
+
+    def test_result(self):
+        self.pool.submit(lambda: 42, self.on_done)
+        # nothing is delivered outside of the main loop
+        self.assertEqual(self.results, [])
+        self.clock.dispatch()
+        self.assertEqual(self.results, [(42, None)])
+
+    def test_error(self):
+        def fail():
+            raise IOError('stuck')
+        self.pool.submit(fail, self.on_done)
+        self.clock.dispatch()
+        self.assertEqual(self.results[0][0], None)
+        self.assertTrue(isinstance(self.results[0][1], IOError))
+
+
+class InlineExecutorTestCase(unittest.TestCase):
+
+    def test_inline(self):
+        results = []
+        worker.InlineExecutor().submit(lambda: 1, lambda result, error: results.append(result))
+        self.assertEqual(results, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()